@@ -1,23 +1,24 @@
 import sys
-import time
 
-from PyQt5.QtCore import QTimer
-from PyQt5.QtWidgets import QApplication, QMainWindow
+# Before anything else, so the startup profile starts as early as it can
+from profiling.Startup import Startup
 
-from assets.Colors import Colors
-from assets.Fonts import Fonts
+with Startup.step("import PyQt5"):
 
-from gui.MainGui import MainGui
+  from PyQt5.QtCore import QTimer
+  from PyQt5.QtWidgets import QApplication, QMainWindow
 
-from meta.Debug import Debug as dbg
+with Startup.step("import gui"):
+
+  from assets.Colors import Colors
+
+  from gui.MainGui import MainGui
 
 WIDTH = 900                                 # Starting width
 HEIGHT = 500                                # Starting height
 
 STYLES = "./assets/styles.qss"              # Master stylesheet
 
-application_start = time.time()
-
 class App(QMainWindow):
 
   def __init__(self):
@@ -26,34 +27,67 @@ class App(QMainWindow):
 
     self.title = "szurubooru_uploader"
 
-    # Initialize Fonts by adding fonts to database before everything else
-    # We only need to do this once
-    Fonts.init()
+    # Whether the window has been painted yet, see paintEvent
+    self.painted = False
 
     # Initialize main window
-    self.setWindowTitle(self.title)
-    self.setGeometry(0, 0, WIDTH, HEIGHT)
-    self.setStyleSheet(f"background-color: {Colors.bg}")
+    with Startup.step("main window"):
+
+      self.setWindowTitle(self.title)
+      self.setGeometry(0, 0, WIDTH, HEIGHT)
+      self.setStyleSheet(f"background-color: {Colors.bg}")
 
     print("Started QMainWindow.")
 
     # Create instance of main tab layout
-    self.tab_widget = MainGui(self)
-    self.setCentralWidget(self.tab_widget)
+    # Fonts get added to the font database as they are used, see Fonts
+    with Startup.step("MainGui"):
+
+      self.tab_widget = MainGui(self)
+      self.setCentralWidget(self.tab_widget)
+
+    with Startup.step("show"):
+
+      self.show()
+
+  def paintEvent(self, event):
+
+    super().paintEvent(event)
+
+    if not self.painted:
 
-    print(f"Finished initializing application in {(time.time() - application_start) * 1000}ms.")
+      self.painted = True
 
-    self.show()
+      # Right after this paint has made it to the screen
+      QTimer.singleShot(0, self.post_startup)
+
+  def post_startup(self):
+    # The window is up, now is the time for everything that can wait
+
+    print(f"Finished initializing application in {Startup.shown():.0f}ms.")
+
+    if Startup.enabled:
+
+      print(f"Startup profile (ms since start):\n{Startup.report()}")
+
+    self.tab_widget.preload()
 
 if __name__ == '__main__':
   # This block launches the actual app
 
   try:
     # We put all of this in a try/except to catch KeyboardInterrupts
-    
+
     # Initialize app and get the stylesheet
-    app = QApplication(sys.argv)
-    app.setStyleSheet(open(STYLES, 'r').read())
+    with Startup.step("QApplication"):
+
+      app = QApplication(sys.argv)
+
+    with Startup.step("stylesheet"):
+
+      with open(STYLES, 'r') as f:
+
+        app.setStyleSheet(f.read())
 
     # Initialize our overriden app class
     ex = App()
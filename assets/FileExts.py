@@ -7,4 +7,21 @@ class FileExts:
   video_exts = ["avi", "flv", "gif", "h264", "m4v", "mp4", "mov", "mpeg", "webm", "3gp"]
 
   # Misc. file extensions
-  misc_exts = ["swf"]
\ No newline at end of file
+  misc_exts = ["swf"]
+
+  def classify(ext):
+    # Returns "image", "video" or "misc" for a lowercased extension, or None if we can't handle it
+
+    if ext in FileExts.image_exts:
+
+      return "image"
+
+    elif ext in FileExts.video_exts:
+
+      return "video"
+
+    elif ext in FileExts.misc_exts:
+
+      return "misc"
+
+    return None
@@ -1,15 +1,22 @@
 from PyQt5.QtGui import QFont, QFontDatabase
 
+FONT_DIR = "./assets/fonts/NotoSansDisplay"
+
 class Fonts:
 
-  def init():
+  # Every style lives in a TTF of its own, and adding one to the font database means reading all of
+  # it, so each style is only added the first time something asks for it. The home screen only
+  # needs a few of them.
 
-    styles = ["ExtraLight", "Light", "LightItalic", "Regular", "Italic", "Bold"]
+  # The styles that have been added so far
+  loaded = set()
 
-    for i in styles:
+  def NotoSansDisplay(style, size):
 
-      QFontDatabase.addApplicationFont(f"./assets/fonts/NotoSansDisplay/NotoSansDisplay-{i}.ttf")
+    if style not in Fonts.loaded:
 
-  def NotoSansDisplay(style, size):
+      # "Light Italic" is in NotoSansDisplay-LightItalic.ttf
+      QFontDatabase.addApplicationFont(f"{FONT_DIR}/NotoSansDisplay-{style.replace(' ', '')}.ttf")
+      Fonts.loaded.add(style)
 
-    return QFont(f"Noto Sans Display {style}", size)
\ No newline at end of file
+    return QFont(f"Noto Sans Display {style}", size)
@@ -0,0 +1,201 @@
+import io
+import os
+import json
+import cv2
+import numpy as np
+
+from PIL import Image
+
+# What a corpus is made of: (kind, extension, share of the files)
+KINDS = [
+  ("jpeg_exif", "jpg", 0.40),               # Camera photos with a date in their EXIF
+  ("jpeg", "jpg", 0.35),                    # Photos that lost their EXIF somewhere along the way
+  ("png_large", "png", 0.10),               # Screenshots and the like, PNGs can't be draft decoded
+  ("mp4", "mp4", 0.06),
+  ("webm", "webm", 0.05),
+  ("broken", "mp4", 0.04)]                  # Cut off downloads, the moov atom is missing
+
+# Every file is a hard link to one of this many distinct files of its kind, so a corpus of 100k
+# files costs a few MB of disk and seconds to make
+TEMPLATES_PER_KIND = 8
+
+# Files are spread over folders of this many, like a real archive would be
+FILES_PER_FOLDER = 1000
+
+JPEG_SIZE = (3000, 2000)
+PNG_SIZE = (2560, 1440)
+VIDEO_SIZE = (640, 360)
+VIDEO_FRAMES = 48
+VIDEO_FPS = 24
+
+# The fourcc of each video extension, both work with the ffmpeg that comes with opencv-python
+FOURCCS = {"mp4": "mp4v", "webm": "VP80"}
+
+# Changing anything above should change this, so stale corpora get made again
+VERSION = 1
+
+class Corpus:
+
+  # A synthetic folder of media to benchmark importing with.
+  # The same seed and count always make the same corpus, which is kept around between runs and only
+  # made again when its description changes.
+
+  def generate(directory, count, seed=0):
+    # Makes (or reuses) a corpus of count files under directory, returns the folder it's in
+
+    spec = {"version": VERSION, "count": count, "seed": seed}
+
+    folder = os.path.join(directory, str(count))
+    spec_path = os.path.join(folder, "corpus.json")
+
+    try:
+
+      with open(spec_path, "r") as f:
+
+        if json.load(f) == spec:
+
+          return folder
+
+    except (OSError, ValueError):
+
+      pass
+
+    templates = Corpus.templates(os.path.join(directory, "templates"), seed)
+
+    rng = np.random.default_rng(seed)
+    kinds = rng.choice(len(KINDS), size=count, p=[share for _, _, share in KINDS])
+
+    Corpus.clear(folder)
+
+    for index, kind in enumerate(kinds.tolist()):
+
+      subfolder = os.path.join(folder, f"{index // FILES_PER_FOLDER:03d}")
+      template = templates[kind][index % TEMPLATES_PER_KIND]
+
+      if index % FILES_PER_FOLDER == 0:
+
+        os.makedirs(subfolder)
+
+      Corpus.link(template, os.path.join(subfolder, f"{index:06d}.{KINDS[kind][1]}"))
+
+    # Written last, so a corpus that got interrupted is made again
+    with open(spec_path, "w") as f:
+
+      json.dump(spec, f)
+
+    return folder
+
+  def templates(directory, seed):
+    # Makes the distinct files every corpus links to, returns a list of paths per kind
+
+    os.makedirs(directory, exist_ok=True)
+
+    rng = np.random.default_rng(seed)
+    templates = []
+
+    for kind, ext, _ in KINDS:
+
+      paths = []
+
+      for index in range(TEMPLATES_PER_KIND):
+
+        path = os.path.join(directory, f"{kind}_{seed}_{index}.{ext}")
+
+        if not os.path.exists(path):
+
+          # Written next to it first, so an interrupted template isn't mistaken for a finished one
+          temp_path = os.path.join(directory, f"tmp_{kind}_{index}.{ext}")
+          getattr(Corpus, kind)(temp_path, rng, index)
+          os.replace(temp_path, path)
+
+        paths.append(path)
+
+      templates.append(paths)
+
+    return templates
+
+  def picture(rng, width, height):
+    # Returns a smooth random BGR picture, which compresses about as well as a photo
+
+    small = rng.integers(0, 256, (height // 32, width // 32, 3), np.uint8)
+
+    return cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+
+  def jpeg_exif(path, rng, index):
+
+    exif = Image.Exif()
+    exif[306] = f"20{10 + index}:0{1 + index % 9}:1{index % 10} 12:34:56"
+    exif[274] = 1 + index % 8
+
+    image = Image.fromarray(Corpus.picture(rng, *JPEG_SIZE)[:, :, ::-1])
+    image.save(path, "JPEG", quality=90, exif=exif)
+
+  def jpeg(path, rng, index):
+
+    cv2.imwrite(path, Corpus.picture(rng, *JPEG_SIZE), [cv2.IMWRITE_JPEG_QUALITY, 90])
+
+  def png_large(path, rng, index):
+
+    cv2.imwrite(path, Corpus.picture(rng, *PNG_SIZE))
+
+  def mp4(path, rng, index):
+
+    Corpus.video(path, rng, "mp4")
+
+  def webm(path, rng, index):
+
+    Corpus.video(path, rng, "webm")
+
+  def broken(path, rng, index):
+    # The mp4 muxer writes the moov atom at the end, so cutting the file in half loses it
+
+    Corpus.video(path, rng, "mp4")
+
+    with open(path, "r+b") as f:
+
+      f.truncate(os.path.getsize(path) // 2)
+
+  def video(path, rng, ext):
+    # Writes a short clip that fades in from black, like so many do
+
+    width, height = VIDEO_SIZE
+    picture = Corpus.picture(rng, width, height)
+
+    # OpenCV picks the container from the extension, so the temporary name has to keep it
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*FOURCCS[ext]), VIDEO_FPS, VIDEO_SIZE)
+
+    for frame in range(VIDEO_FRAMES):
+
+      writer.write((picture * min(1, frame / (VIDEO_FPS / 2))).astype(np.uint8))
+
+    writer.release()
+
+  def link(source, path):
+    # Hard links are free, but not every file system has them
+
+    try:
+
+      os.link(source, path)
+
+    except OSError:
+
+      with open(source, "rb") as src, open(path, "wb") as dst:
+
+        dst.write(src.read())
+
+  def clear(folder):
+    # Removes a previous corpus, which only ever has the spec and subfolders of files in it
+
+    if not os.path.isdir(folder):
+
+      return
+
+    for root, folders, files in os.walk(folder, topdown=False):
+
+      for name in files:
+
+        os.remove(os.path.join(root, name))
+
+      for name in folders:
+
+        os.rmdir(os.path.join(root, name))
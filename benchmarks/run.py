@@ -0,0 +1,466 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import traceback
+
+from benchmarks.Corpus import Corpus
+
+from loading.DateKey import DateKey
+from loading.Importer import Importer
+from loading.Pyramid import Pyramid
+from loading.Scanner import Scanner
+from loading.ThumbnailCache import ThumbnailCache
+from loading.Thumbnailer import Thumbnailer
+from loading.VideoProbe import VideoProbe
+
+SIZES = [1000, 10000, 100000]
+
+THUMB_HEIGHT = 200                          # Same as the GUI
+
+CORPUS_DIR = os.path.join(tempfile.gettempdir(), "szurubooru_uploader_corpus")
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+THRESHOLDS_PATH = os.path.join(BENCHMARK_DIR, "thresholds.json")
+OUTPUT_PATH = os.path.join(BENCHMARK_DIR, "benchmark_results.json")
+
+# A stage that takes more than this much longer than in the baseline counts as a regression
+BASELINE_TOLERANCE = 0.25
+
+# Thumbnails handed to add_thumbnails_to_grid at once, the same as Importer's BATCH_SIZE
+GRID_BATCH_SIZE = 64
+
+# How many thumbnails share a date in the grid benchmarks, about what a camera roll has
+THUMBS_PER_DATE = 40
+
+GRID_WIDTH = 1200
+
+# The pixel budget scroll_grid runs with, a few screens worth of thumbnails, and how many screens
+# it paints
+SCROLL_BUDGET = 32 * 1024 * 1024
+SCROLL_SCREENS = 200
+
+# The heights zoom_grid zooms to one after the other, painting a screen after each, which goes
+# through every level of the pyramid and back to where it started
+ZOOM_HEIGHTS = [220, 180, 140, 100, 60, 150, 300, 400, 250, 200]
+
+class Benchmarks:
+
+  # Each stage takes the corpus folder (for the stages that need files) and the size, and returns
+  # a dict of what it measured, which always has "seconds". The Qt stages only import Qt when they
+  # run, so the rest also runs on machines without a display.
+
+  def thumbnails(corpus, size, workers, cached):
+    # Runs the Importer's thumbnail generation over the corpus, with a cache of its own
+    # Without cached, the cache starts out empty, otherwise it's filled by a run before the timed one
+
+    cache_dir = tempfile.mkdtemp()
+
+    try:
+
+      manifest = Scanner.scan(corpus)
+
+      runs = 2 if cached else 1
+
+      for _ in range(runs):
+
+        importer = Importer(corpus, THUMB_HEIGHT, workers)
+        importer.cache = ThumbnailCache(os.path.join(cache_dir, "thumbnails.db"), 1 << 40)
+
+        start = time.perf_counter()
+        sent = importer.generate_thumbnails(manifest)
+        seconds = time.perf_counter() - start
+
+      return {"seconds": seconds, "files": len(manifest), "thumbnails": sent}
+
+    finally:
+
+      shutil.rmtree(cache_dir, ignore_errors=True)
+
+  def thumbnails_cold(corpus, size, workers):
+
+    return Benchmarks.thumbnails(corpus, size, workers, False)
+
+  def thumbnails_cached(corpus, size, workers):
+
+    return Benchmarks.thumbnails(corpus, size, workers, True)
+
+  def video_probe(corpus, size, workers):
+    # Probes every video in the corpus one after another, broken ones included
+
+    videos = [entry.path for entry in Scanner.scan(corpus) if entry.kind == "video"]
+
+    start = time.perf_counter()
+
+    try:
+
+      results = [VideoProbe.probe(path) for path in videos]
+
+    except RuntimeError as e:
+
+      # No ffprobe, nothing to measure
+      return {"skipped": str(e)}
+
+    return {"seconds": time.perf_counter() - start, "videos": len(videos),
+            "unreadable": sum(metadata is None for metadata in results)}
+
+  def video_thumbnails(corpus, size, workers):
+    # Makes the thumbnail of every video in the corpus in this process, broken ones included, so
+    # the cost of a video isn't hidden behind the worker pool
+
+    videos = [entry for entry in Scanner.scan(corpus) if entry.kind == "video"]
+
+    start = time.perf_counter()
+    made = sum(Thumbnailer.generate(entry, THUMB_HEIGHT) is not None for entry in videos)
+    seconds = time.perf_counter() - start
+
+    return {"seconds": seconds, "videos": len(videos), "thumbnails": made,
+            "ms_per_video": round(seconds * 1000 / max(1, len(videos)), 3)}
+
+  def flow_layout(corpus, size, workers):
+    # Lays out size thumbnails and their datesections from scratch, like after a resize, then
+    # inserts a thumbnail at the top, which is the worst case for an incremental layout
+
+    from PyQt5.QtCore import QRect
+    from gui.FlowLayout import FlowLayout
+
+    flow = FlowLayout(None, 10, 5, 5)
+
+    for item in Benchmarks.grid_items(size):
+
+      flow.addItem(item)
+
+    start = time.perf_counter()
+    flow.doLayout(QRect(0, 0, GRID_WIDTH, 0), False)
+    seconds = time.perf_counter() - start
+
+    flow.insertItem(1, Benchmarks.grid_items(1)[1])
+
+    start = time.perf_counter()
+    flow.doLayout(QRect(0, 0, GRID_WIDTH, 0), False)
+    insert_seconds = time.perf_counter() - start
+
+    return {"seconds": seconds, "insert_seconds": insert_seconds, "items": flow.count()}
+
+  def add_thumbnails_to_grid(corpus, size, workers):
+    # Feeds size thumbnails to MainGui in batches, the way ImportFiles does, and lays them out
+
+    gui, seconds = Benchmarks.filled_grid(size)
+
+    return {"seconds": seconds, "items": gui.thumb_grid.count()}
+
+  def scroll_grid(corpus, size, workers):
+    # Jumps to SCROLL_SCREENS screens spread over a grid of size thumbnails and paints each one,
+    # with a pixel budget of a few screens, so nearly all of them have to be decoded again
+
+    gui, _ = Benchmarks.filled_grid(size)
+    grid = gui.thumb_grid
+
+    # Grabbing a hidden widget resizes it every time, which would lay everything out again
+    grid.show()
+    grid.relayout()
+
+    maximum = grid.verticalScrollBar().maximum()
+    screens = [maximum * index // (SCROLL_SCREENS - 1) for index in range(SCROLL_SCREENS)]
+
+    gui.pixels.budget = SCROLL_BUDGET
+    gui.pixels.trim()
+
+    peak = 0
+    start = time.perf_counter()
+
+    for offset in screens:
+
+      grid.verticalScrollBar().setValue(offset)
+      grid.viewport().grab()
+
+      peak = max(peak, gui.pixels.resident)
+
+    seconds = time.perf_counter() - start
+
+    return {"seconds": seconds, "ms_per_screen": round(seconds * 1000 / len(screens), 3),
+            "peak_bytes": peak,
+            "budget_bytes": SCROLL_BUDGET, "stored_bytes": gui.pixels.stored}
+
+  def zoom_grid(corpus, size, workers):
+    # Zooms a grid of size thumbnails to each of ZOOM_HEIGHTS, in the middle of the grid, and
+    # paints the screen that ends up in view
+
+    gui, _ = Benchmarks.filled_grid(size)
+    grid = gui.thumb_grid
+
+    grid.show()
+    grid.relayout()
+    grid.verticalScrollBar().setValue(grid.verticalScrollBar().maximum() // 2)
+
+    # Start from a screen that's already decoded, like when zooming while looking at the grid
+    grid.viewport().grab()
+
+    start = time.perf_counter()
+    slowest = 0
+
+    for height in ZOOM_HEIGHTS:
+
+      zoom_start = time.perf_counter()
+
+      grid.zoom(height)
+      grid.viewport().grab()
+
+      slowest = max(slowest, time.perf_counter() - zoom_start)
+
+    seconds = time.perf_counter() - start
+
+    return {"seconds": seconds, "ms_per_zoom": round(seconds * 1000 / len(ZOOM_HEIGHTS), 3),
+            "slowest_ms": round(slowest * 1000, 3), "items": grid.count()}
+
+  def filled_grid(size):
+    # Returns a MainGui with size thumbnails fed to it in batches, the way ImportFiles does, and
+    # how many seconds that took, laying them out included
+
+    from gui.MainGui import MainGui
+
+    gui = MainGui(None)
+    gui.thumb_grid.resize(GRID_WIDTH, 800)
+
+    batches = Benchmarks.batches(Benchmarks.thumb_data(), size)
+
+    start = time.perf_counter()
+
+    for batch in batches:
+
+      gui.add_thumbnails_to_grid(batch)
+
+    gui.thumb_grid.relayout()
+
+    return (gui, time.perf_counter() - start)
+
+  def thumb_data():
+    # The (image, size, encoded) that ImportFiles makes of a cached thumbnail, for every thumbnail
+
+    from PyQt5.QtCore import QBuffer, QByteArray, QIODevice
+
+    encoded = []
+
+    for height in Pyramid.heights(THUMB_HEIGHT):
+
+      data = QByteArray()
+      buffer = QBuffer(data)
+      buffer.open(QIODevice.WriteOnly)
+      Benchmarks.image(height).save(buffer, "JPG", 90)
+
+      encoded.append(bytes(data))
+
+    return (None, Benchmarks.image().size(), tuple(encoded))
+
+  def image(height=THUMB_HEIGHT):
+    # One QImage for every thumbnail, QImages are shared so this costs next to nothing
+
+    from PyQt5.QtGui import QImage
+
+    image = QImage(height * 4 // 3, height, QImage.Format_BGR888)
+    image.fill(0)
+
+    return image
+
+  def grid_items(size):
+    # Returns a datesection followed by its thumbnails, for every THUMBS_PER_DATE thumbnails
+
+    from items.DatesectionItem import DatesectionItem
+    from items.ThumbnailItem import ThumbnailItem
+
+    image = Benchmarks.image()
+    items = []
+
+    for index in range(size):
+
+      if index % THUMBS_PER_DATE == 0:
+
+        datesection = DatesectionItem()
+        datesection.setText(f"Section {index // THUMBS_PER_DATE}")
+        items.append(datesection)
+
+      item = ThumbnailItem()
+      item.setImage(image)
+      items.append(item)
+
+    return items
+
+  def batches(thumb_data, size):
+    # Returns the batches of (thumb_data, path, date, time, dhash, key) tuples ImportFiles would
+    # send, the dates spread over size / THUMBS_PER_DATE days in no particular order
+
+    import random
+
+    rng = random.Random(0)
+    days = max(1, size // THUMBS_PER_DATE)
+
+    thumbs = []
+
+    for index in range(size):
+
+      day = rng.randrange(days)
+      date = (f"{2000 + day // 365:04d}", f"{1 + day % 365 // 31:02d}", f"{1 + day % 28:02d}")
+      time_of_day = (f"{rng.randrange(24):02d}", f"{rng.randrange(60):02d}", "00")
+
+      thumbs.append((thumb_data, f"/corpus/{index:06d}.jpg", date, time_of_day, rng.getrandbits(64),
+                     DateKey.key(date, time_of_day)))
+
+    return [thumbs[start:start + GRID_BATCH_SIZE] for start in range(0, size, GRID_BATCH_SIZE)]
+
+# Stages that need a corpus on disk, the rest make up their own items
+CORPUS_STAGES = ["thumbnails_cold", "thumbnails_cached", "video_probe", "video_thumbnails"]
+STAGES = CORPUS_STAGES + ["flow_layout", "add_thumbnails_to_grid", "scroll_grid", "zoom_grid"]
+
+def check(results, thresholds, baseline):
+  # Returns the list of regressions, as strings, from comparing each result with its threshold
+  # (the most seconds it's allowed to take) and with the same stage and size in a baseline
+
+  baseline = {(result["stage"], result["size"]): result for result in baseline}
+  regressions = []
+
+  for result in results:
+
+    if "seconds" not in result:
+
+      continue
+
+    stage, size, seconds = result["stage"], result["size"], result["seconds"]
+
+    limit = thresholds.get(stage, {}).get(str(size))
+
+    if limit is not None and seconds > limit:
+
+      regressions.append(f"{stage} at {size}: {seconds:.3f}s, the threshold is {limit}s")
+
+    previous = baseline.get((stage, size), {}).get("seconds")
+
+    if previous is not None and seconds > previous * (1 + BASELINE_TOLERANCE):
+
+      regressions.append(f"{stage} at {size}: {seconds:.3f}s, the baseline is {previous:.3f}s")
+
+  return regressions
+
+def parse_args(argv):
+
+  parser = argparse.ArgumentParser(
+    prog="python -m benchmarks.run",
+    description="Times the import pipeline and the grid on synthetic corpora.")
+
+  parser.add_argument("--sizes", type=int, nargs="+", default=SIZES,
+                      help="numbers of files to benchmark with")
+  parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES,
+                      help="which stages to run")
+  parser.add_argument("--output", default=OUTPUT_PATH,
+                      help="where to write the results, they're written again after every stage")
+  parser.add_argument("--thresholds", default=THRESHOLDS_PATH,
+                      help="JSON of stage -> size -> the most seconds it may take")
+  parser.add_argument("--baseline",
+                      help="results of an earlier run, stages that got more than "
+                           f"{BASELINE_TOLERANCE:.0%} slower count as regressions")
+  parser.add_argument("--corpus-dir", default=CORPUS_DIR,
+                      help="where corpora are made, and kept for the next run")
+  parser.add_argument("--workers", type=int, default=None,
+                      help="thumbnail worker processes, defaults to every core")
+
+  return parser.parse_args(argv)
+
+def write_report(path, results, regressions):
+  # Writes the results so far, along with what they were measured on
+
+  report = {
+    "time": time.time(),
+    "machine": {
+      "platform": platform.platform(),
+      "python": platform.python_version(),
+      "cpus": os.cpu_count()},
+    "results": results,
+    "regressions": regressions,
+    "failed": [f"{result['stage']} at {result['size']}: {result['failed']}"
+               for result in results if "failed" in result]}
+
+  with open(path, "w") as f:
+
+    json.dump(report, f, indent=2)
+
+  return report
+
+def main(argv):
+
+  args = parse_args(argv)
+
+  # Read these first, so a typo doesn't show up only after every stage has run
+  with open(args.thresholds, "r") as f:
+
+    thresholds = json.load(f)
+
+  baseline = []
+
+  if args.baseline:
+
+    with open(args.baseline, "r") as f:
+
+      baseline = json.load(f)["results"]
+
+  # The grid stages need a QApplication, which doesn't need a display to lay things out
+  if any(stage not in CORPUS_STAGES for stage in args.stages):
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+    from PyQt5.QtWidgets import QApplication
+
+    app = QApplication(sys.argv[:1])
+
+  results = []
+  regressions = []
+
+  report = write_report(args.output, results, regressions)
+
+  for size in args.sizes:
+
+    corpus = None
+
+    if any(stage in CORPUS_STAGES for stage in args.stages):
+
+      print(f"Making a corpus of {size} files...", file=sys.stderr)
+      corpus = Corpus.generate(args.corpus_dir, size)
+
+    for stage in args.stages:
+
+      print(f"Running {stage} at {size}...", file=sys.stderr)
+
+      # A stage that fails is recorded as such, the rest still run
+      try:
+
+        result = {"stage": stage, "size": size,
+                  **getattr(Benchmarks, stage)(corpus, size, args.workers)}
+
+      except Exception as e:
+
+        traceback.print_exc()
+        result = {"stage": stage, "size": size, "failed": f"{type(e).__name__}: {e}"}
+
+      results.append(result)
+
+      print(json.dumps(result), file=sys.stderr)
+
+      # Whatever has run so far is kept even if the run gets cut short
+      regressions = check(results, thresholds, baseline)
+      report = write_report(args.output, results, regressions)
+
+  for regression in regressions:
+
+    print(f"Regression: {regression}", file=sys.stderr)
+
+  for failure in report["failed"]:
+
+    print(f"Failed: {failure}", file=sys.stderr)
+
+  return 1 if regressions or report["failed"] else 0
+
+if __name__ == '__main__':
+
+  sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,415 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import http.client
+
+from loading.Importer import Importer
+from loading.ThumbnailCache import ThumbnailCache
+from loading.VideoReader import VIDEO_OFFSET
+from profiling.Tracer import Tracer
+from tagging.TagDictionary import TagDictionary
+from uploading.SzurubooruClient import SzurubooruClient, SzurubooruError
+from uploading.UploadEngine import UploadJob
+from uploading.Uploader import Uploader
+
+THUMB_HEIGHT = 200                          # Same as the GUI, so they share the thumbnail cache
+
+PROGRESS_INTERVAL = 1.0                     # Least amount of seconds between two progress lines
+
+SAFETIES = ["safe", "sketchy", "unsafe"]
+
+COMPLETIONS = 10                            # How many tags --complete lists
+
+# Sidecar files sit next to a file and are named after it, e.g. "cat.jpg.json" or "cat.jpg.txt"
+# A JSON sidecar is an object with "tags" (a list, or a string of space separated tags) and/or
+# "safety", a text sidecar is just the tags, separated by spaces or newlines.
+SIDECAR_EXTS = [".json", ".txt"]
+
+class Cli:
+
+  # Imports folders, and optionally uploads them, without a GUI.
+  # Runs the same Importer and Uploader as the GUI does, and writes what they emit to stdout as
+  # JSON lines, one object per line with an "event" key:
+  #   {"event": "progress", "stage": ..., "done": ..., "total": ...}
+  #   {"event": "imported", "path": ..., "date": ..., "time": ...}
+  #   {"event": "group", "paths": [...]}                        near-duplicates
+  #   {"event": "unknown_tag", "tag": ..., "suggestions": [...]} not on the server yet
+  #   {"event": "uploaded", "path": ..., "post_id": ...}
+  #   {"event": "duplicate", "path": ..., "post_id": ...}       already on the server
+  #   {"event": "failed", "path": ..., "error": ...}
+  #   {"event": "finished", "folder": ..., ...counts..., "seconds": ...}
+  #   {"event": "completion", "name": ..., "matched": ..., "category": ..., "usages": ...}
+  # Anything else that gets printed along the way goes to stderr.
+
+  def __init__(self, args, out):
+
+    self.args = args
+    self.out = out
+
+    # The Uploader reports from several threads at once
+    self.out_lock = threading.Lock()
+
+    # The progress of the current stage
+    self.stage = ""
+    self.done = 0
+    self.total = 0
+    self.last_progress = 0
+
+    # The server's TagDictionary, only synced once it's needed
+    self.dictionary = None
+
+    self.reset()
+
+  def reset(self):
+    # Forgets everything about the previous folder
+
+    self.imported = []
+    self.groups = 0
+    self.jobs = []
+    self.counts = {"uploaded": 0, "duplicate": 0, "failed": 0}
+
+  def write(self, event, **fields):
+
+    line = json.dumps({"event": event, **fields}, ensure_ascii=False)
+
+    with self.out_lock:
+
+      self.out.write(line + "\n")
+      self.out.flush()
+
+  def run(self):
+    # Processes every folder, returns the exit code
+
+    if self.args.complete is not None:
+
+      return self.complete(self.args.complete)
+
+    if self.args.clear_cache or self.args.prune_cache:
+
+      self.clean_cache()
+
+    failed = 0
+
+    for folder_path in self.args.folders:
+
+      failed += self.process(os.path.abspath(folder_path))
+
+    return 1 if failed else 0
+
+  def clean_cache(self):
+    # Empties the thumbnail cache, or only drops what's there of removed or changed files
+    # Importing a folder already prunes that folder's entries, this goes for every folder.
+
+    cache = ThumbnailCache()
+    cache.open()
+
+    try:
+
+      if self.args.clear_cache:
+
+        cache.clear()
+        print("Cleared the thumbnail cache.")
+
+      else:
+
+        print(f"Pruned {cache.prune()} files from the thumbnail cache.")
+
+    finally:
+
+      cache.close()
+
+  def process(self, folder_path):
+    # Imports a folder and uploads it if asked to, returns the number of files that failed
+
+    self.reset()
+    start = time.monotonic()
+
+    Importer(folder_path, THUMB_HEIGHT, self.args.workers, self.on_import,
+             video_offset=self.args.video_offset).run()
+
+    if self.args.upload:
+
+      self.jobs = [UploadJob(index, path, *self.tags_and_safety(path))
+                   for index, path in enumerate(self.imported)]
+
+      self.check_tags()
+
+      Uploader(self.jobs, self.args.url, self.args.username, self.args.token,
+               self.args.upload_workers, self.on_upload).run()
+
+    self.write("finished", folder=folder_path, imported=len(self.imported), groups=self.groups,
+               **self.counts, seconds=round(time.monotonic() - start, 3))
+
+    return self.counts["failed"]
+
+  def on_import(self, event, *args):
+
+    if event == "send_thumbnails":
+
+      for image, path, creation_date, creation_time, dhash, key in args[0]:
+
+        self.imported.append(path)
+        self.write("imported", path=path, date=creation_date, time=creation_time)
+
+    elif event == "send_groups":
+
+      self.groups = len(args[0])
+
+      for group in args[0]:
+
+        self.write("group", paths=group)
+
+    else:
+
+      self.on_progress(event, *args)
+
+  def on_upload(self, event, *args):
+
+    if event == "post_finished":
+
+      self.on_post("uploaded", *args)
+
+    elif event == "post_duplicate":
+
+      self.on_post("duplicate", *args)
+
+    elif event == "post_failed":
+
+      index, error = args
+
+      self.counts["failed"] += 1
+      self.write("failed", path=self.jobs[index].path, error=error)
+
+    elif event != "post_progress":
+      # Per post progress would be a lot of lines for not much, the overall progress is enough
+
+      self.on_progress(event, *args)
+
+  def on_post(self, event, index, post_id):
+
+    self.counts[event] += 1
+    self.write(event, path=self.jobs[index].path, post_id=post_id)
+
+  def on_progress(self, event, *args):
+    # Turns the progressbar events into progress lines, at most every PROGRESS_INTERVAL seconds
+
+    if event == "format_progressbar":
+
+      # The GUI's progressbar fills in "%v/%m" itself, the numbers are in the line already
+      self.stage = args[0].replace(" - %v/%m", "").rstrip(".")
+      self.done = 0
+
+      # Whatever the previous stage counted up to, this one doesn't know its total yet
+      self.total = 0
+
+    elif event == "max_progressbar":
+
+      self.total = args[0]
+      self.done = 0
+
+    elif event == "increment_progressbar":
+
+      self.done += 1
+
+      if self.done < self.total and time.monotonic() - self.last_progress < PROGRESS_INTERVAL:
+
+        return
+
+    self.last_progress = time.monotonic()
+    self.write("progress", stage=self.stage, done=self.done, total=self.total)
+
+  def tag_dictionary(self):
+    # Returns the server's TagDictionary, synced first if we can log in
+    # Without the server, whatever was synced last time is used.
+
+    if self.dictionary is not None:
+
+      return self.dictionary
+
+    self.dictionary = TagDictionary(self.args.url.rstrip('/'))
+
+    if self.args.username and self.args.token:
+
+      client = None
+
+      try:
+
+        client = SzurubooruClient(self.args.url, self.args.username, self.args.token, 1)
+        print(f"Synced {self.dictionary.sync(client)} tags.")
+
+      except (OSError, ValueError, http.client.HTTPException, SzurubooruError) as e:
+
+        print(f"Could not sync the tags with error {e}, using the ones from last time...")
+
+      finally:
+
+        if client is not None:
+
+          client.close()
+
+    self.dictionary.load()
+
+    return self.dictionary
+
+  def complete(self, prefix):
+    # Writes the most used tags starting with prefix, for shells and editors to complete tags with
+
+    for completion in self.tag_dictionary().complete(prefix, COMPLETIONS):
+
+      self.write("completion", **completion._asdict())
+
+    return 0
+
+  def check_tags(self):
+    # Reports every tag of the jobs that isn't on the server, with the tags it could be the start
+    # of. szurubooru creates whatever tags it doesn't know, so a typo quietly becomes a new tag.
+
+    tags = dict.fromkeys(tag for job in self.jobs for tag in job.tags)
+
+    if not tags:
+
+      return
+
+    dictionary = self.tag_dictionary()
+
+    for tag in tags:
+
+      if dictionary.find(tag) is None:
+
+        suggestions = [completion.name for completion in dictionary.complete(tag, COMPLETIONS)]
+        self.write("unknown_tag", tag=tag, suggestions=suggestions)
+
+  def tags_and_safety(self, path):
+    # Returns the (tags, safety) of a file, the sidecar's tags are added to the ones from the
+    # command line, and its safety takes precedence over the command line's
+
+    tags = list(self.args.tags)
+    safety = self.args.safety
+
+    for sidecar_ext in SIDECAR_EXTS:
+
+      try:
+
+        with open(path + sidecar_ext, "r", encoding="utf-8") as f:
+
+          text = f.read()
+
+      except OSError:
+
+        continue
+
+      if sidecar_ext == ".json":
+
+        try:
+
+          sidecar = json.loads(text)
+
+        except ValueError as e:
+
+          print(f"Could not read sidecar of {path} with error {e}, skipping...")
+          continue
+
+        sidecar_tags = sidecar.get("tags", [])
+
+        if isinstance(sidecar_tags, str):
+
+          sidecar_tags = sidecar_tags.split()
+
+        tags += sidecar_tags
+
+        if sidecar.get("safety") in SAFETIES:
+
+          safety = sidecar["safety"]
+
+      else:
+
+        tags += text.split()
+
+    # Keep the order, but only once each
+    return (list(dict.fromkeys(tags)), safety)
+
+def parse_args(argv):
+
+  parser = argparse.ArgumentParser(
+    prog="cli.py",
+    description="Imports folders without a GUI, and optionally uploads them to szurubooru. "
+                "Progress is written to stdout as JSON lines.")
+
+  parser.add_argument("folders", nargs="*", metavar="folder",
+                      help="folder to import, subfolders included")
+  parser.add_argument("--upload", action="store_true",
+                      help="upload every imported file")
+  parser.add_argument("--tags", default="",
+                      help="space separated tags to give every file, on top of its sidecar's")
+  parser.add_argument("--safety", choices=SAFETIES, default=SAFETIES[0],
+                      help="safety of files whose sidecar doesn't have one")
+  parser.add_argument("--url", default=os.environ.get("SZURUBOORU_URL"),
+                      help="szurubooru server, defaults to $SZURUBOORU_URL")
+  parser.add_argument("--username", default=os.environ.get("SZURUBOORU_USERNAME"),
+                      help="defaults to $SZURUBOORU_USERNAME")
+  parser.add_argument("--token", default=os.environ.get("SZURUBOORU_TOKEN"),
+                      help="login token, defaults to $SZURUBOORU_TOKEN")
+  parser.add_argument("--workers", type=int, default=None,
+                      help="thumbnail worker processes, defaults to every core")
+  parser.add_argument("--video-offset", type=float, default=VIDEO_OFFSET, metavar="SECONDS",
+                      help="take video thumbnails from this far in (or the middle of shorter "
+                           "videos), defaults to %(default)s")
+  parser.add_argument("--prune-cache", action="store_true",
+                      help="first drop the cached thumbnails of every removed or changed file, "
+                           "not just those in the imported folders")
+  parser.add_argument("--clear-cache", action="store_true",
+                      help="first throw away every cached thumbnail")
+  parser.add_argument("--complete", metavar="PREFIX",
+                      help="only list the most used tags on the server starting with PREFIX")
+  parser.add_argument("--upload-workers", type=int, default=4,
+                      help="simultaneous uploads")
+  parser.add_argument("--trace", metavar="PATH",
+                      help="time every stage of every file, and write a Chrome trace to PATH")
+
+  args = parser.parse_args(argv)
+  args.tags = args.tags.split()
+
+  if not args.folders and args.complete is None:
+
+    parser.error("the following arguments are required: folder")
+
+  if args.complete is not None and not args.url:
+
+    parser.error("--complete needs --url (or its environment variable)")
+
+  if args.upload and not (args.url and args.username and args.token):
+
+    parser.error("--upload needs --url, --username and --token (or their environment variables)")
+
+  return args
+
+if __name__ == '__main__':
+
+  args = parse_args(sys.argv[1:])
+
+  # stdout is only for the JSON lines, so point file descriptor 1 at stderr. That way anything
+  # printed along the way, including by the worker processes, can't end up in the middle of them.
+  sys.stdout.flush()
+  out = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8")
+  os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+  if args.trace:
+
+    Tracer.enable(args.trace)
+
+  try:
+
+    code = Cli(args, out).run()
+
+  except KeyboardInterrupt:
+
+    code = 1
+
+  if Tracer.enabled:
+
+    Tracer.save()
+
+  sys.exit(code)
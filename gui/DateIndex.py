@@ -0,0 +1,74 @@
+import bisect
+
+from loading.DateKey import DateKey
+
+class DateIndex:
+
+  # The order of the ThumbnailGrid: a section for every day, newest first, each holding the
+  # thumbnails of that day, newest first.
+  # Days are a sorted list of buckets, each bucket being the sorted keys of its thumbnails, so
+  # placing a thumbnail is a bisect for its day and one within the day, no matter how many
+  # thumbnails there are in total.
+  # Keys are negated so that the lists can stay ascending while the newest comes first. Files
+  # without a date have the smallest key, so they end up in the last section.
+
+  def __init__(self):
+
+    # The negated day of every bucket, and the negated keys of the thumbnails in each one
+    self.days = []
+    self.buckets = []
+
+  def __len__(self):
+
+    return sum(len(bucket) for bucket in self.buckets)
+
+  def insert(self, key):
+    # Adds a thumbnail with the given DateKey
+    # Returns (section, new, offset): section is the position of the key's day among the days,
+    # new is whether that day wasn't there before, and offset is the position of the thumbnail
+    # among the thumbnails of its day.
+
+    day = -DateKey.day(key)
+    section = bisect.bisect_left(self.days, day)
+
+    new = section == len(self.days) or self.days[section] != day
+
+    if new:
+
+      self.days.insert(section, day)
+      self.buckets.insert(section, [])
+
+    bucket = self.buckets[section]
+
+    # After everything that is newer or just as new
+    offset = bisect.bisect_right(bucket, -key)
+    bucket.insert(offset, -key)
+
+    return (section, new, offset)
+
+  def locate(self, key):
+    # Returns (section, start, end), the thumbnails of the given DateKey being the ones from
+    # offset start up to end in that section
+
+    day = -DateKey.day(key)
+    section = bisect.bisect_left(self.days, day)
+
+    bucket = self.buckets[section]
+
+    return (section, bisect.bisect_left(bucket, -key), bisect.bisect_right(bucket, -key))
+
+  def remove(self, section, offset):
+    # Removes the thumbnail at offset in section, returns whether that was the last one of its day
+    # (which means the day and its section are gone too)
+
+    bucket = self.buckets[section]
+    del bucket[offset]
+
+    if bucket:
+
+      return False
+
+    del self.days[section]
+    del self.buckets[section]
+
+    return True
@@ -1,5 +1,7 @@
-from PyQt5.QtCore import Qt, QRect, QSize, QPoint, pyqtSignal
-from PyQt5.QtWidgets import QLayout, QSizePolicy, QStyle
+import bisect
+
+from PyQt5.QtCore import Qt, QRect, QSize, pyqtSignal
+from PyQt5.QtWidgets import QApplication, QLayout, QSizePolicy, QStyle, QWidgetItem
 
 class FlowLayout(QLayout):
 
@@ -15,6 +17,29 @@ class FlowLayout(QLayout):
 
     self.items = []
 
+    # Everything below is cached so a layout pass only redoes what actually changed
+    # The (width, height, newline_before, newline_after) of every item, in the same order
+    self.hints = []
+
+    # The (x, y) every item was placed at
+    self.positions = []
+
+    # The row index: for every row, the index of its first item, the y it is placed at, and the
+    # (x, y, line_height) the layout was at right before placing that first item
+    self.row_starts = []
+    self.row_tops = []
+    self.row_states = []
+
+    # The (x, y, width) of the area the cache was laid out in, and where the items end
+    self.laid_out = None
+    self.content_bottom = 0
+
+    # The index of the first item whose position is out of date, None if nothing is
+    self.dirty_from = 0
+
+    # The index of the first item whose geometry hasn't been set yet, None if every item's is
+    self.unplaced_from = 0
+
     self.total_height = 0
 
     self.setContentsMargins(margin, margin, margin, margin)
@@ -28,6 +53,52 @@ class FlowLayout(QLayout):
     # When we add an item, e.g. using addWidget(), just append it to a list
 
     self.items.append(item)
+    self.hints.append(self.hint(item))
+    self.markDirty(len(self.items) - 1)
+
+  def insertWidget(self, index, widget):
+    # Same as addWidget(), but puts the widget at the given index instead of the end
+
+    self.addChildWidget(widget)
+    self.insertItem(index, QWidgetItem(widget))
+
+  def insertItem(self, index, item):
+    # Puts an item at the given index
+    # Besides QLayoutItems, this takes anything with sizeHint(), setGeometry(), geometry(),
+    # widget() and the newline flags, like the items of the ThumbnailGrid.
+
+    self.items.insert(index, item)
+    self.hints.insert(index, self.hint(item))
+    self.markDirty(index)
+
+    # Skip our own invalidate(), nothing before the new item changed
+    super(FlowLayout, self).invalidate()
+
+  def hint(self, item):
+    # Returns the (width, height, newline_before, newline_after) of an item, which is all that
+    # doLayout needs to know about it
+
+    # The newline flags live on the widget, or on the item itself if it isn't a widget
+    widget = item.widget() or item
+    size = item.sizeHint()
+
+    return (size.width(), size.height(), widget.newline_before == True, widget.newline_after == True)
+
+  def markDirty(self, index):
+    # Marks every item from index onwards as needing to be placed again
+
+    if self.dirty_from is None or index < self.dirty_from:
+
+      self.dirty_from = index
+
+  def invalidate(self):
+    # Qt calls this whenever the size hint of one of our widgets might have changed, so ask every
+    # item for its size again
+
+    self.hints = [self.hint(item) for item in self.items]
+    self.markDirty(0)
+
+    super(FlowLayout, self).invalidate()
 
   def horizontalSpacing(self):
     # This gets the horizontal spacing between widgets
@@ -74,6 +145,9 @@ class FlowLayout(QLayout):
     # If index is in the list, remove the item at the index and return it
     if 0 <= index < len(self.items):
 
+      self.hints.pop(index)
+      self.markDirty(index)
+
       return self.items.pop(index)
 
   def expandingDirections(self):
@@ -125,7 +199,10 @@ class FlowLayout(QLayout):
 
   def doLayout(self, rect, test_only):
     # This function actually does the layout management and placement
-    
+    # Positions are cached, so this only places the items from the row of the first changed item
+    # onwards, or everything when the area changed. With test_only, the height is calculated
+    # without placing anything.
+
     # Pass the margins into these four variables respectively
     left, top, right, bottom = self.getContentsMargins()
 
@@ -134,48 +211,145 @@ class FlowLayout(QLayout):
     # right and bottom are subtracted from its right and bottom sides
     effective = rect.adjusted(+left, +top, -right, -bottom)
 
-    # The "starting" position of the first widget (top left)
-    x = effective.x()
-    y = effective.y()
+    area = (effective.x(), effective.y(), effective.width())
 
-    line_height = 0
+    if test_only and area != self.laid_out:
+      # Just simulating for another width (heightForWidth), so leave the cache alone
 
-    # Go through each item in the list
-    for item in self.items:
+      content_bottom = self.flow(effective, 0, (effective.x(), effective.y(), 0))[4]
+      return content_bottom - rect.y() + bottom
+
+    self.arrange(effective)
+
+    if not test_only and self.unplaced_from is not None:
+      # Place every item that moved since the last time
+
+      for item, (x, y), (width, height, _, _) in zip(self.items[self.unplaced_from:],
+                                                      self.positions[self.unplaced_from:],
+                                                      self.hints[self.unplaced_from:]):
+
+        item.setGeometry(QRect(x, y, width, height))
+
+      self.unplaced_from = None
+
+    # Return the height of the current line
+    return self.content_bottom - rect.y() + bottom
+
+  def arrange(self, effective):
+    # Brings the cached positions up to date for the effective area, without placing any items
+    # Items that are only ever painted (like in ThumbnailGrid) can use itemGeometry instead of
+    # having their geometry set, which saves making a QRect for every item on every resize.
+
+    area = (effective.x(), effective.y(), effective.width())
+
+    if area != self.laid_out:
+      # A different area means every row can break differently
+
+      self.laid_out = area
+      self.markDirty(0)
+
+    if self.dirty_from is not None:
 
-      widget = item.widget()
+      self.updateCache(effective)
 
-      # Use the horizontal and vertical spacing between items
-      h_space = self.horizontalSpacing()
-      v_space = self.verticalSpacing()
+    return self.content_bottom
 
-      if h_space == -1:
-        # If somehow h_space is -1 we use the widget's style to space them
-        
-        h_space = widget.style().layoutSpacing(
-          QSizePolicy.PushButton,
-          QSizePolicy.PushButton,
-          Qt.Horizontal)
+  def itemGeometry(self, index):
+    # Returns where the item at index was positioned by the last arrange or doLayout
 
-      if v_space == -1:
-        # Same with this
-        
-        v_space = widget.style().layoutSpacing(
-          QSizePolicy.PushButton,
-          QSizePolicy.PushButton,
-          Qt.Vertical)
+    x, y = self.positions[index]
+    width, height, _, _ = self.hints[index]
+
+    return QRect(x, y, width, height)
+
+  def updateCache(self, effective):
+    # Brings the cached positions and row index up to date, starting from the row of the item
+    # before the first changed one, since a new item might still fit at the end of that row
+
+    row = max(0, bisect.bisect_right(self.row_starts, self.dirty_from - 1) - 1)
+
+    if self.dirty_from > 0 and row < len(self.row_starts):
+
+      first = self.row_starts[row]
+      state = self.row_states[row]
+
+    else:
+
+      row = 0
+      first = 0
+      state = (effective.x(), effective.y(), 0)
+
+    positions, row_starts, row_tops, row_states, self.content_bottom = \
+      self.flow(effective, first, state)
+
+    # Replace everything from that row onwards
+    del self.positions[first:]
+    del self.row_starts[row:]
+    del self.row_tops[row:]
+    del self.row_states[row:]
+
+    self.positions += positions
+    self.row_starts += row_starts
+    self.row_tops += row_tops
+    self.row_states += row_states
+
+    self.dirty_from = None
+
+    if self.unplaced_from is None or first < self.unplaced_from:
+
+      self.unplaced_from = first
+
+  def flow(self, effective, first, state):
+    # Flows the items from first onwards into the effective area, starting at state, which is the
+    # (x, y, line_height) the layout was at right before that item
+    # Returns (positions, row_starts, row_tops, row_states, content_bottom) for those items
+
+    x, y, line_height = state
+
+    # Use the horizontal and vertical spacing between items
+    h_space = self.horizontalSpacing()
+    v_space = self.verticalSpacing()
+
+    if h_space == -1:
+      # If somehow h_space is -1 we use the application's style to space them
+
+      h_space = QApplication.style().layoutSpacing(
+        QSizePolicy.PushButton,
+        QSizePolicy.PushButton,
+        Qt.Horizontal)
+
+    if v_space == -1:
+      # Same with this
+
+      v_space = QApplication.style().layoutSpacing(
+        QSizePolicy.PushButton,
+        QSizePolicy.PushButton,
+        Qt.Vertical)
+
+    positions = []
+    row_starts = []
+    row_tops = []
+    row_states = []
+
+    row_y = None
+
+    # Go through each item from first onwards
+    for index in range(first, len(self.hints)):
+
+      width, height, newline_before, newline_after = self.hints[index]
+
+      state = (x, y, line_height)
 
       # Add the current item width and h_spacing to the current position to get the starting
       # position for the next item
-      next_x = x + item.sizeHint().width() + h_space
+      next_x = x + width + h_space
 
-      if next_x - h_space > effective.right() and line_height > 0 or \
-         widget.newline_before == True:
+      if next_x - h_space > effective.right() and line_height > 0 or newline_before:
         # If the next position oversteps the right side of the effective area, "wrap around"
 
         # Make the starting x pos of the next item the left of the effective area
-        x = effective.x() 
-        next_x = x + item.sizeHint().width() + h_space
+        x = effective.x()
+        next_x = x + width + h_space
 
         # Make the starting y pos of the next item the line height plus vert. spacing
         y = y + line_height + v_space
@@ -183,29 +357,49 @@ class FlowLayout(QLayout):
         # Reset the line height
         line_height = 0
 
-      if not test_only:
-        # Place the item if we aren't simulating the positioning
+      if y != row_y:
+        # This item starts a new row, remember where so we can start from here next time
+
+        row_starts.append(index)
+        row_tops.append(y)
+        row_states.append(state)
+
+        row_y = y
 
-        # Position the current item on the current position
-        item.setGeometry(QRect(QPoint(x, y), item.sizeHint()))
+      positions.append((x, y))
 
       # Set line height to the tallest item
-      line_height = max(line_height, item.sizeHint().height())
+      line_height = max(line_height, height)
 
-      if widget.newline_after == True:
-        # If the widget needs a newline after, start a new line again
+      if newline_after:
+        # If the item needs a newline after, start a new line again
 
         # Just add to the y...
         y = y + line_height + v_space
 
       else:
         # Otherwise, move the x in preperation for the next item
-        
+
         x = next_x
 
-    # Return the height of the current line
-    return y + line_height - rect.y() + bottom
-  
+    return (positions, row_starts, row_tops, row_states, y + line_height)
+
+  def itemRange(self, top, bottom):
+    # Returns the (start, end) indices of the items in the rows between top and bottom
+    # This bisects the row index, so it only works after doLayout has placed everything
+
+    if not self.row_tops:
+
+      return (0, 0)
+
+    first_row = max(0, bisect.bisect_right(self.row_tops, top) - 1)
+    last_row = bisect.bisect_right(self.row_tops, bottom)
+
+    start = self.row_starts[first_row]
+    end = self.row_starts[last_row] if last_row < len(self.row_starts) else len(self.items)
+
+    return (start, end)
+
   def smartSpacing(self, pm):
     # Gets the default spacing for top level or sublayouts
 
@@ -1,38 +1,81 @@
 import os
 import time
+import importlib
+import threading
 
-from PyQt5.QtCore import Qt, QSize
+from PyQt5.QtCore import Qt, QSize, QTimer
 from PyQt5.QtGui import QIcon, QPixmap
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLabel, QPushButton, QScrollArea, QProgressBar, QFileDialog
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLabel, QPushButton, QProgressBar, QFileDialog
 
 from assets.Colors import Colors
-from assets.FileExts import FileExts
 from assets.Fonts import Fonts
 
-from gui.FlowLayout import FlowLayout
+from gui.DateIndex import DateIndex
+from gui.PixelCache import PixelCache, PIXEL_BUDGET
+from gui.ThumbnailGrid import ThumbnailGrid
+from gui.ThumbnailStore import ThumbnailStore
 
 from items.DatesectionItem import DatesectionItem
 from items.ThumbnailItem import ThumbnailItem
 
-from loading.ImportFiles import ImportFiles
+from loading.DateKey import DateKey, UNKNOWN
+from loading.FolderWatcher import FolderWatcher, SETTLE_INTERVAL
 
-from meta.Debug import Debug as dbg
+from profiling.Startup import Startup
+from profiling.Tracer import Tracer
+
+try:
+
+  from meta.Debug import Debug as dbg
+
+except ImportError:
+
+  # meta holds a developer's local settings and isn't part of the repository, without it the
+  # folder picker is used as usual
+  dbg = None
 
 FILE_IMPORT_ICON = "../assets/file-import.svg"
 
+# Importing and uploading pull in cv2, numpy, requests and the like, which takes longer than
+# everything else in starting up put together. Nothing on the home screen needs them, so they are
+# imported where they're used, and on a background thread once the window is up (see preload).
+PRELOAD = ["loading.ImportFiles", "uploading.UploadFiles"]
+
 class MainGui(QWidget):
 
   def __init__(self, parent):
 
     super(MainGui, self).__init__(parent)
 
-    # The height of each thumbnail
+    # The height thumbnails are made for, and shown at until the grid gets zoomed
+    # They're also made at half and twice that, see Pyramid.
     self.thumb_height = 200
 
-    # A list of thumbnails, no markers, each entry is a dict:
-    # {"idx": int, "date": str, "time": str, "safety": str, "tags": list)
-    # "idx" being the thumbnail's location in the layout
-    self.thumb_list = []
+    # How many processes generate thumbnails at once, None means one per core
+    self.import_workers = None
+
+    # How many seconds into a video its thumbnail is taken from, None for VideoReader's default
+    self.video_offset = None
+
+    # How many files get uploaded at once
+    self.upload_workers = 4
+
+    # How many bytes of thumbnails are kept decoded, the rest are decoded again when they're needed
+    self.pixel_budget = PIXEL_BUDGET
+
+    # A ThumbnailRecord for every imported file, no markers, in the order they were imported
+    # Their index in the store is what the upload thread refers to them by.
+    self.thumbs = ThumbnailStore()
+
+    # Where everything goes in thumb_grid, by date
+    self.date_index = DateIndex()
+
+    # The DatesectionItem of each day (as a DateKey) that has been added to thumb_grid so far
+    self.date_sections = {}
+
+    # Watches the imported folder once it's in, and whether it changed again during an update
+    self.folder_watcher = None
+    self.update_pending = False
 
     self.layout = QVBoxLayout(self)
 
@@ -63,16 +106,32 @@ class MainGui(QWidget):
     self.open_folder.setIcon(QIcon(QPixmap(FILE_IMPORT_ICON)))
     self.open_folder.setIconSize(QSize(14, 14))
 
-    # Create main thumbnail layout, wrapper, and scroll area (but don't insert)
-    # The QScrollArea is the parent of a QWidget which is the wrapper and parent of a QLayout
-    # Why? I have no idea
-    self.thumb_layout_scroll_area = QScrollArea()
-    self.thumb_layout_wrapper = QWidget(self.thumb_layout_scroll_area)
-    self.thumb_layout = FlowLayout(self.thumb_layout_wrapper, -1, 5, 5)
+    # Create main thumbnail grid (but don't insert)
+    self.thumb_grid = ThumbnailGrid()
+
+    # Where the thumbnails' pixels are kept
+    self.pixels = PixelCache(self.thumb_height, self.pixel_budget)
+    self.thumb_grid.pixels = self.pixels
+
+    # Create the line that shows how much memory the thumbnails take up (but don't insert)
+    self.memory_label = QLabel()
+
+    self.memory_label.setObjectName("memoryLabel")
+    self.memory_label.setFont(Fonts.NotoSansDisplay("Regular", 8))
+    self.memory_label.setContentsMargins(15, 0, 0, 0)
 
-    self.thumb_layout.update_wrapper_height.connect(self.update_thumb_layout_wrapper_height)
-    
-    self.thumb_layout_wrapper.setVisible(False)
+    # Once a second is plenty, it only changes as thumbnails come in or get scrolled past
+    self.memory_timer = QTimer(self)
+
+    self.memory_timer.setInterval(1000)
+    self.memory_timer.timeout.connect(self.update_memory_label)
+
+    # Create upload button (but don't insert)
+    self.upload_files = QPushButton(" Upload")
+
+    self.upload_files.clicked.connect(self.start_upload_files_thread)
+    self.upload_files.setObjectName("uploadFiles")
+    self.upload_files.setFont(Fonts.NotoSansDisplay("Italic", 12))
 
     # Create progressbar (but don't insert!)
     self.loading_progressbar = QProgressBar()
@@ -91,31 +150,30 @@ class MainGui(QWidget):
 
     self.setLayout(self.layout)
 
-  def resizeEvent(self, event):
-    # Override the resizeEvent of the main window to to automatically update the wrapper's width
-    # to what is needed, since it doesn't update by itself.
+  def preload(self):
+    # Imports whatever importing and uploading need on a background thread, so that it's there by
+    # the time a folder gets picked. Importing it on the spot waits for this if it isn't done yet.
 
-    self.thumb_layout_wrapper.setFixedWidth(self.thumb_layout_scroll_area.size().width())
+    threading.Thread(target=MainGui.preload_modules, daemon=True).start()
 
-  def count_files(self, folder_path):
+  def preload_modules():
 
-    self.file_count = 0
+    for module in PRELOAD:
 
-    for root, dirs, files in os.walk(folder_path):
+      with Startup.step(f"preload {module}"):
 
-      for name in files:
+        importlib.import_module(module)
 
-        ext = name.split('.')[-1]
-        if ext in FileExts.image_exts or ext in FileExts.video_exts or ext in FileExts.misc_exts:
+    if Startup.enabled:
 
-          self.file_count += 1
+      print(f"Preloaded in the background:\n{Startup.report(background=True)}")
 
   def pick_folder(self):
 
     print("Picking folder...")
 
     # Launch file picker if debug is diabled
-    if dbg.ENABLED:
+    if dbg is not None and dbg.ENABLED:
 
       folder_path = dbg.PATH
 
@@ -126,9 +184,7 @@ class MainGui(QWidget):
     # If we get a file then move on
     if folder_path != '':
 
-      self.count_files(folder_path)
-
-      print(f"Selected \"{folder_path}\", contains {self.file_count} files.")
+      print(f"Selected \"{folder_path}\".")
 
       self.layout.removeWidget(self.open_folder)
       self.open_folder.close()
@@ -149,29 +205,42 @@ class MainGui(QWidget):
     self.home_title.setContentsMargins(15, 5, 0, 0)
 
     # Re-add widgets and layouts
-    self.layout.addWidget(self.thumb_layout_scroll_area)
+    self.layout.addWidget(self.thumb_grid)
+    self.layout.addWidget(self.memory_label)
     self.layout.addWidget(self.loading_progressbar)
     self.layout.insertWidget(0, self.home_title)
 
     # Re-adjust stretches
     self.layout.setStretch(2, 0)
-    self.layout.setStretchFactor(self.thumb_layout_scroll_area, 150)
+    self.layout.setStretchFactor(self.thumb_grid, 150)
+
+    self.update_memory_label()
+    self.memory_timer.start()
 
   def start_import_files_thread(self, folder_path):
 
     print("Starting thread...")
 
+    from loading.ImportFiles import ImportFiles
+    from loading.VideoReader import VIDEO_OFFSET
+
     self.reorganize_ui()
 
     self.loading_progressbar.setVisible(True)
 
     # Begin thread
-    self.import_files_thread = ImportFiles(folder_path, self.thumb_height)
+    video_offset = self.video_offset if self.video_offset is not None else VIDEO_OFFSET
+
+    self.import_files_thread = ImportFiles(folder_path, self.thumb_height, self.import_workers,
+                                           video_offset)
 
-    self.import_files_thread.send_thumbnails_signal.connect(self.add_thumbnails_to_grid)    
+    self.import_files_thread.send_thumbnails_signal.connect(self.add_thumbnails_to_grid)
+    self.import_files_thread.send_groups_signal.connect(self.set_groups)
+    self.import_files_thread.remove_thumbnails_signal.connect(self.remove_thumbnails)
     self.import_files_thread.format_progressbar.connect(self.format_progressbar)
     self.import_files_thread.max_progressbar.connect(self.max_progressbar)
     self.import_files_thread.increment_progressbar.connect(self.increment_progressbar)
+    self.import_files_thread.finished.connect(self.post_load)
 
     # Start timing loading process
     self.load_start = time.time()
@@ -199,70 +268,132 @@ class MainGui(QWidget):
 
     self.loading_progressbar.setValue(self.loading_progressbar.value() + 1)
 
-  def show_thumb_layout(self):
-    # Allows the loading thread to show the thumb layout only right before the thumbnail insertion
+  def make_datesection(self, creation_date, key):
+    # Returns a new datesection for the day of the given date
+
+    # Initialize custom Datesection item
+    datesection = DatesectionItem()
+
+    # Set text of Datesection item to "Unknown Date" if no date found
+    if key == UNKNOWN:
+
+      datesection.setText("Unknown Date")
+
+    else:
+
+      # Otherwise make it the date
+      datesection.setDate(creation_date[0], creation_date[1], creation_date[2])
+
+    self.date_sections[DateKey.day(key)] = datesection
 
-    self.thumb_layout_wrapper.setVisible(True)
+    return datesection
 
   def add_thumbnails_to_grid(self, thumbs_list):
-    # Adds each thumbnail from the given list to the thumb layout
+    # Adds each thumbnail from the given batch to the thumb grid, under its date section
+    # Batches arrive while the import is still running, so each thumbnail is inserted where it
+    # belongs instead of being appended, the DateIndex works out where that is.
 
-    print(f"Adding {len(thumbs_list)} total elements to the layout...")
+    with Tracer.span("add_thumbnails_to_grid", files=len(thumbs_list)):
 
-    for idx, (data, path, creation_date, creation_time) in enumerate(thumbs_list):
+      for thumb_data, path, creation_date, creation_time, dhash, key in thumbs_list:
 
-      # If the previous date isn't the current date or if we are at the start, add a datesection
-      if not thumbs_list[idx - 1] or thumbs_list[idx - 1][1] != creation_date:
+        # Updates send files we already have when they changed, the old thumbnail makes way
+        thumb = self.thumbs.find(path)
 
-        # Initialize custom Datesection item
-        datesection = DatesectionItem()
+        if thumb is not None:
 
-        # Set text of Datesection item to "Unknown Date" if no date found
-        if creation_date[0] == "0000": 
+          self.remove_from_grid(thumb)
+
+        # Create item to add to our grid, and give it the thumbnail (see ImportFiles.receive)
+        image, size, encoded = thumb_data
+
+        item = ThumbnailItem()
+        item.setPixels(self.pixels, size, image, encoded)
+
+        with Tracer.span("grid_insert", path=path):
+
+          # Find its place, after everything that is newer or just as new
+          section, new, offset = self.date_index.insert(key)
+
+          # Make sure the date has a section to go into
+          if new:
+
+            self.thumb_grid.insertSection(section, self.make_datesection(creation_date, key))
+
+          # The datesection comes first in its section
+          self.thumb_grid.insertItem(section, offset + 1, item)
+
+        # Add a record to our thumbs store, or bring the one we have up to date
+        if thumb is None:
+
+          self.thumbs.add(path, creation_date, creation_time, key, item, dhash)
 
-          datesection.setText("Unknown Date")
-        
         else:
-          
-          # Otherwise make it the date
-          datesection.setDate(creation_date[0], creation_date[1], creation_date[2])
-
-        self.thumb_layout.addWidget(datesection)
-
-      # Create item to add to our layout, and load the bytearray into it
-      item = ThumbnailItem()
-      item.loadFromData(data)
-
-      # Add the item to the layout
-      self.thumb_layout.addWidget(item)
-      self.thumb_layout_scroll_area.setWidget(self.thumb_layout_wrapper)
-
-      # Add an entry to our thumbs list
-      current_thumb_dict = {
-        "path": path,
-        "ext": path.split('.')[-1]
-        "date": creation_date,
-        "time": creation_time,
-        "widget": item,
-        "tags": []
-        "selected": False,
-        "safety": ''}
-
-      self.thumb_list.append(current_thumb_dict.copy())
-
-      # Increment progressbar
-      self.increment_progressbar()
-    
-    # Finally, cleanup and perform post-load actions
+
+          self.thumbs.replace(thumb.index, creation_date, creation_time, key, item, dhash)
+
+      # The new thumbnails' pixels count towards the budget too
+      self.pixels.trim()
+
+    # Cleanup
     thumbs_list = None
-    self.post_load()
 
-  def update_thumb_layout_wrapper_height(self, height):
-    # Allows the FlowLayout to set the height it needs *when it's ready*
-    # Before, the height was set after all the thumbnail-adding was complete, leading to a race
-    # condition problem. To sovle that, this is run everytime the layout is updated to avoid that.
+  def remove_thumbnails(self, paths):
+    # Removes the files that are gone from the grid and the thumbs store
+
+    for path in paths:
+
+      thumb = self.thumbs.find(path)
+
+      if thumb is not None:
+
+        self.remove_from_grid(thumb)
+        self.thumbs.remove(thumb.index)
+
+  def remove_from_grid(self, thumb):
+    # Takes a record's thumbnail out of the grid, and its datesection if it was the last of its day
+
+    section, start, end = self.date_index.locate(thumb.key)
+
+    # Every thumbnail from start to end has the same key, and the datesection comes first
+    index = self.thumb_grid.indexOf(section, thumb.widget, start + 1, end + 1)
+
+    self.pixels.discard(thumb.widget)
+
+    if self.date_index.remove(section, index - 1):
+
+      self.thumb_grid.removeSection(section)
+      del self.date_sections[DateKey.day(thumb.key)]
+
+    else:
+
+      self.thumb_grid.removeItem(section, index)
+
+  def update_memory_label(self):
+
+    self.memory_label.setText(f" {self.pixels.report()}")
+
+  def set_groups(self, groups):
+    # Marks each group of near-duplicates (lists of paths) on their thumbnails, numbered from 1
 
-    self.thumb_layout_wrapper.setFixedHeight(height) 
+    # Updates send every group again, so forget the ones from before
+    for thumb in self.thumbs:
+
+      if thumb.group is not None:
+
+        thumb.group = None
+        thumb.widget.setGroup(None)
+
+    for number, group in enumerate(groups, 1):
+
+      for path in group:
+
+        thumb = self.thumbs.find(path)
+
+        thumb.group = number
+        thumb.widget.setGroup(number)
+
+    self.thumb_grid.viewport().update()
 
   def post_load(self):
 
@@ -271,7 +402,133 @@ class MainGui(QWidget):
     self.layout.removeWidget(self.loading_progressbar)
     self.loading_progressbar.close()
 
-    # Set the size of the wrapper for thumb_layout to the size of the QScrollArea it's in
-    self.thumb_layout_wrapper.setFixedWidth(self.thumb_layout_scroll_area.size().width())
-
     print(f"Loading finished in {(time.time() - self.load_start) * 1000}ms.")
+
+    if Tracer.enabled:
+
+      Tracer.save()
+
+    # Everything is in, so it can be uploaded now
+    self.layout.addWidget(self.upload_files)
+
+    # From now on the thread only runs to pick up changes to the folder, quietly, since the
+    # progressbar may well be busy with an upload by then
+    thread = self.import_files_thread
+
+    thread.finished.disconnect(self.post_load)
+    thread.finished.connect(self.post_update)
+
+    thread.format_progressbar.disconnect(self.format_progressbar)
+    thread.max_progressbar.disconnect(self.max_progressbar)
+    thread.increment_progressbar.disconnect(self.increment_progressbar)
+
+    self.folder_watcher = FolderWatcher(self)
+    self.folder_watcher.changed.connect(self.start_update)
+    self.folder_watcher.watch(thread.importer.folders)
+
+  def start_update(self):
+    # Imports whatever changed in the folder, once the update before it is done
+
+    if self.import_files_thread.isRunning():
+
+      self.update_pending = True
+      return
+
+    self.update_pending = False
+    self.import_files_thread.rescan(SETTLE_INTERVAL)
+
+  def post_update(self):
+
+    importer = self.import_files_thread.importer
+
+    # Any new subfolders have to be watched too
+    self.folder_watcher.watch(importer.folders)
+
+    if self.update_pending:
+
+      self.start_update()
+
+    elif importer.unsettled:
+
+      # Come back for the files that were still being written to
+      self.folder_watcher.poke()
+
+  def start_upload_files_thread(self):
+    # Uploads every thumb that hasn't been uploaded yet
+    # The server and credentials come from the SZURUBOORU_URL, SZURUBOORU_USERNAME and
+    # SZURUBOORU_TOKEN environment variables.
+
+    url = os.environ.get("SZURUBOORU_URL")
+    username = os.environ.get("SZURUBOORU_USERNAME")
+    token = os.environ.get("SZURUBOORU_TOKEN")
+
+    if not (url and username and token):
+
+      print("Set SZURUBOORU_URL, SZURUBOORU_USERNAME and SZURUBOORU_TOKEN to upload.")
+      return
+
+    from uploading.UploadFiles import UploadFiles
+
+    jobs = UploadFiles.from_thumbs(thumb for thumb in self.thumbs if thumb.post_id is None)
+
+    print(f"Uploading {len(jobs)} files to {url}...")
+
+    self.upload_files.setEnabled(False)
+
+    # Bring the progressbar back for the upload
+    self.layout.removeWidget(self.upload_files)
+    self.layout.addWidget(self.loading_progressbar)
+    self.loading_progressbar.setVisible(True)
+
+    # Begin thread
+    self.upload_files_thread = UploadFiles(jobs, url, username, token, self.upload_workers)
+
+    self.upload_files_thread.post_progress.connect(self.update_post_progress)
+    self.upload_files_thread.post_finished.connect(self.post_uploaded)
+    self.upload_files_thread.post_duplicate.connect(self.post_duplicate)
+    self.upload_files_thread.post_failed.connect(self.post_upload_failed)
+    self.upload_files_thread.format_progressbar.connect(self.format_progressbar)
+    self.upload_files_thread.max_progressbar.connect(self.max_progressbar)
+    self.upload_files_thread.increment_progressbar.connect(self.increment_progressbar)
+    self.upload_files_thread.finished.connect(self.post_upload)
+
+    self.upload_start = time.time()
+
+    self.upload_files_thread.start()
+
+  def update_post_progress(self, index, sent, total):
+    # Shows how much of a post has been sent on its thumbnail
+
+    self.thumbs[index].widget.setProgress(sent / total if total else 1)
+    self.thumb_grid.viewport().update()
+
+  def post_uploaded(self, index, post_id):
+
+    self.thumbs[index].post_id = post_id
+    self.thumbs[index].widget.setProgress(None)
+    self.thumb_grid.viewport().update()
+
+  def post_duplicate(self, index, post_id):
+    # The file is already on the server, so mark it instead of uploading it again
+
+    self.thumbs[index].post_id = post_id
+    self.thumbs[index].duplicate = True
+    self.thumbs[index].widget.setProgress(None)
+    self.thumbs[index].widget.setDuplicate(True)
+    self.thumb_grid.viewport().update()
+
+  def post_upload_failed(self, index, error):
+
+    self.thumbs[index].widget.setProgress(None)
+    self.thumb_grid.viewport().update()
+
+  def post_upload(self):
+
+    self.loading_progressbar.setVisible(False)
+    self.layout.removeWidget(self.loading_progressbar)
+
+    # Whatever failed can be tried again
+    self.upload_files.setEnabled(True)
+    self.layout.addWidget(self.upload_files)
+
+    print(f"Uploading finished in {(time.time() - self.upload_start) * 1000}ms.")
@@ -0,0 +1,175 @@
+import tempfile
+
+from collections import OrderedDict
+
+from PyQt5.QtCore import Qt, QSize
+from PyQt5.QtGui import QImage
+
+from loading.Pyramid import Pyramid, BASE
+
+# How many bytes of decoded thumbnails are kept in memory by default
+PIXEL_BUDGET = 256 * 1024 * 1024
+
+class PixelCache:
+
+  # Keeps the decoded pixels of thumbnails in memory within a budget.
+  # A decoded thumbnail is about 150KB, the compressed one it came from about a tenth of that, so
+  # keeping every thumbnail decoded doesn't last long in a big folder. Every thumbnail's compressed
+  # bytes are kept instead (in a temporary file by default, where they are the OS's to page out,
+  # or in memory), and only the ones that were painted most recently stay decoded. Whatever gets
+  # painted after being evicted is decoded again on the spot, which for one screen of thumbnails
+  # is quick enough not to notice.
+  # Evicting only happens in trim, so nothing gets evicted halfway through painting a screen.
+  # The compressed bytes are those of every level of the thumbnail's pyramid (see Pyramid). The
+  # grid can be zoomed to any height, what gets decoded is the level nearest to it, scaled to that
+  # height, so zooming never has to go back to the files.
+
+  def __init__(self, thumb_height, budget=PIXEL_BUDGET, on_disk=True):
+
+    self.budget = budget
+
+    # The height of every level, the height thumbnails are shown at, and the level that's scaled
+    # to it
+    self.heights = Pyramid.heights(thumb_height)
+    self.height = thumb_height
+    self.level = BASE
+
+    # (width, height) of a base level -> the size it's shown at, for the current height
+    self.sizes = {}
+
+    # item -> QImage, least recently used first
+    self.images = OrderedDict()
+
+    # The bytes taken up by everything in images
+    self.resident = 0
+
+    # Where the compressed thumbnails go, None keeps them in memory
+    self.file = tempfile.TemporaryFile(buffering=0) if on_disk else None
+
+    # How many compressed bytes there are of the thumbnails in the grid
+    self.stored = 0
+
+  def add(self, item, image, encoded):
+    # Stores the compressed levels of an item, and its decoded image if there is one
+    # The image is only kept if it's already the size the item is shown at, it gets decoded from
+    # the right level otherwise. A new image counts as the least recently used, so adding
+    # thumbnails that never get painted doesn't push out the ones on screen.
+
+    if self.file is not None:
+
+      # The levels go one after the other
+      offset = self.file.seek(0, 2)
+      self.file.write(b"".join(encoded))
+
+      item.stored = (offset, tuple(map(len, encoded)))
+
+    else:
+
+      item.stored = encoded
+
+    self.stored += sum(map(len, encoded))
+
+    if image is not None and not image.isNull() and image.size() == item.sizeHint():
+
+      self.images[item] = image
+      self.images.move_to_end(item, last=False)
+
+      self.resident += image.sizeInBytes()
+
+  def image(self, item):
+    # Returns the decoded image of an item, decoding it again if it was evicted
+
+    image = self.images.get(item)
+
+    if image is not None:
+
+      self.images.move_to_end(item)
+      return image
+
+    image = QImage.fromData(self.load(item, self.level))
+
+    size = item.sizeHint()
+
+    if image.size() != size and not image.isNull():
+
+      image = image.scaled(size, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+
+    self.images[item] = image
+    self.resident += image.sizeInBytes()
+
+    return image
+
+  def load(self, item, level):
+    # Returns the compressed thumbnail of an item at the given level
+
+    if self.file is None:
+
+      return item.stored[level]
+
+    offset, lengths = item.stored
+
+    self.file.seek(offset + sum(lengths[:level]))
+
+    return self.file.read(lengths[level])
+
+  def size(self, source):
+    # Returns the size a thumbnail is shown at, source being the (width, height) of its base level
+    # Laying out the grid asks this for every thumbnail, but most of them share one of a handful of
+    # sizes, so each one is only worked out once per height. Nothing changes the QSizes we hand
+    # out, so the thumbnails can share them.
+
+    size = self.sizes.get(source)
+
+    if size is None:
+
+      width, height = source
+
+      size = QSize(max(1, int(width * self.height / height)), self.height)
+      self.sizes[source] = size
+
+    return size
+
+  def zoom(self, height):
+    # Shows thumbnails height tall from now on, whatever laid them out has to do so again
+    # Every decoded image is the wrong size now, so they are all thrown away.
+
+    self.height = height
+    self.level = Pyramid.nearest(self.heights, height)
+    self.sizes = {}
+
+    self.images.clear()
+    self.resident = 0
+
+  def discard(self, item):
+    # Forgets an item that's no longer in the grid
+
+    image = self.images.pop(item, None)
+
+    if image is not None:
+
+      self.resident -= image.sizeInBytes()
+
+    # The file only ever grows, its bytes are left where they are
+    if item.stored is not None:
+
+      self.stored -= sum(item.stored[1] if self.file is not None else map(len, item.stored))
+      item.stored = None
+
+  def trim(self):
+    # Evicts the least recently used images until the rest fits in the budget
+
+    while self.resident > self.budget and self.images:
+
+      item, image = self.images.popitem(last=False)
+      self.resident -= image.sizeInBytes()
+
+  def report(self):
+    # Returns a line about how much memory the thumbnails take up, for the UI
+
+    megabyte = 1024 * 1024
+
+    where = "on disk" if self.file is not None else "in memory"
+
+    return (f"Thumbnails at {self.height}px, from {self.heights[self.level]}px: "
+            f"{len(self.images)} decoded, {self.resident / megabyte:.1f} of "
+            f"{self.budget / megabyte:.0f} MB | {self.stored / megabyte:.1f} MB compressed {where}")
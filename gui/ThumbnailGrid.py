@@ -0,0 +1,258 @@
+import bisect
+
+from PyQt5.QtCore import Qt, QRect
+from PyQt5.QtGui import QPainter
+from PyQt5.QtWidgets import QAbstractScrollArea
+
+from gui.FlowLayout import FlowLayout
+
+from loading.Pyramid import BASE
+
+from profiling.Tracer import Tracer
+
+# How much one notch of the wheel (or one Ctrl+Plus or Ctrl+Minus) zooms in or out
+ZOOM_STEP = 1.1
+
+class ThumbnailGrid(QAbstractScrollArea):
+
+  # The scrollable grid of thumbnails and datesections.
+  # This used to be a QScrollArea with one widget per thumbnail in a FlowLayout, which falls over
+  # somewhere past 10k files. Now the items are plain objects (see ThumbnailItem and
+  # DatesectionItem) that FlowLayouts position as usual, but nothing is a widget: the grid only
+  # paints the items that intersect the viewport, so painting costs the same no matter how many
+  # items there are.
+  # Every date section has a FlowLayout of its own, starting with its datesection. A datesection
+  # always starts a new row, so sections never share a row and each one can be laid out on its
+  # own: inserting a thumbnail only shifts and re-flows the items of its own section, and the
+  # sections below just move down.
+  # Ctrl and the wheel (or Ctrl+Plus, Ctrl+Minus and Ctrl+0) zoom the thumbnails, see zoom.
+
+  def __init__(self, parent=None, margin=10, spacing=5):
+
+    super(ThumbnailGrid, self).__init__(parent)
+
+    self.margin = margin
+    self.spacing = spacing
+
+    # The FlowLayout of every section, in the order they are shown. They aren't installed on any
+    # widget, we only use them to position the items.
+    self.sections = []
+
+    # The y every section starts at, the height of everything laid out, and whether the items
+    # changed since the last layout
+    self.tops = []
+    self.total_height = 0
+    self.dirty = False
+
+    # The PixelCache the thumbnails are in, if any, it gets trimmed after painting
+    self.pixels = None
+
+  def count(self):
+
+    return sum(section.count() for section in self.sections)
+
+  def itemAt(self, index):
+
+    for section in self.sections:
+
+      if index < section.count():
+
+        return section.itemAt(index)
+
+      index -= section.count()
+
+    return None
+
+  def insertSection(self, position, datesection):
+    # Puts a new section, starting with the given datesection, at position among the sections
+
+    section = FlowLayout(None, 0, self.spacing, self.spacing)
+    section.addItem(datesection)
+
+    self.sections.insert(position, section)
+
+    self.dirty = True
+    self.viewport().update()
+
+  def insertItem(self, position, index, item):
+    # Puts an item at the given index of the section at position (the datesection being index 0),
+    # it gets positioned the next time we paint
+
+    self.sections[position].insertItem(index, item)
+
+    self.dirty = True
+    self.viewport().update()
+
+  def indexOf(self, position, item, start, end):
+    # Returns the index of item in the section at position, looking from start up to end
+
+    return self.sections[position].items.index(item, start, end)
+
+  def removeItem(self, position, index):
+    # Takes the item at the given index out of the section at position
+
+    self.sections[position].takeAt(index)
+
+    self.dirty = True
+    self.viewport().update()
+
+  def removeSection(self, position):
+    # Takes the section at position out, along with everything in it
+
+    del self.sections[position]
+
+    self.dirty = True
+    self.viewport().update()
+
+  def relayout(self):
+    # Positions the items for the current width and updates the scrollbar to match
+    # Each FlowLayout caches its positions, so only the sections that changed get placed again,
+    # and every section's position is its height added to the one before it
+
+    width = self.viewport().width()
+
+    with Tracer.span("relayout", sections=len(self.sections)):
+
+      effective = QRect(self.margin, 0, width - 2 * self.margin, 0)
+
+      self.tops = []
+      y = self.margin
+
+      for section in self.sections:
+
+        self.tops.append(y)
+        y += section.arrange(effective)
+
+      self.total_height = y + self.margin
+
+    self.dirty = False
+
+    scrollbar = self.verticalScrollBar()
+
+    scrollbar.setRange(0, max(0, self.total_height - self.viewport().height()))
+    scrollbar.setPageStep(self.viewport().height())
+    scrollbar.setSingleStep(50)
+
+  def zoom(self, height):
+    # Shows the thumbnails height tall, between half the smallest level of their pyramid and the
+    # biggest one (see PixelCache)
+    # Nothing gets decoded here: the items are laid out again with the size the PixelCache gives
+    # them now, and whatever ends up on screen is decoded from the nearest level as it's painted.
+
+    if self.pixels is None:
+
+      return
+
+    heights = self.pixels.heights
+    height = min(max(height, heights[0] // 2), heights[-1])
+
+    if height == self.pixels.height:
+
+      return
+
+    # Keep the same part of the grid in view
+    scrollbar = self.verticalScrollBar()
+    fraction = scrollbar.value() / max(1, self.total_height)
+
+    with Tracer.span("zoom", height=height, items=self.count()):
+
+      self.pixels.zoom(height)
+
+      # Every item's size hint changed
+      for section in self.sections:
+
+        section.invalidate()
+
+      self.relayout()
+
+    scrollbar.setValue(round(fraction * self.total_height))
+    self.viewport().update()
+
+  def zoomBy(self, steps):
+    # Zooms in by steps of ZOOM_STEP, or out if steps is negative
+
+    if self.pixels is not None:
+
+      self.zoom(round(self.pixels.height * ZOOM_STEP ** steps))
+
+  def wheelEvent(self, event):
+
+    if event.modifiers() & Qt.ControlModifier:
+
+      # A notch of the wheel is 120, touchpads send less at a time
+      self.zoomBy(event.angleDelta().y() / 120)
+      event.accept()
+
+    else:
+
+      super(ThumbnailGrid, self).wheelEvent(event)
+
+  def keyPressEvent(self, event):
+
+    if event.modifiers() & Qt.ControlModifier and event.key() in (Qt.Key_Plus, Qt.Key_Equal):
+
+      self.zoomBy(1)
+
+    elif event.modifiers() & Qt.ControlModifier and event.key() == Qt.Key_Minus:
+
+      self.zoomBy(-1)
+
+    elif event.modifiers() & Qt.ControlModifier and event.key() == Qt.Key_0:
+
+      # Back to the height the thumbnails were made for
+      if self.pixels is not None:
+
+        self.zoom(self.pixels.heights[BASE])
+
+    else:
+
+      super(ThumbnailGrid, self).keyPressEvent(event)
+
+  def resizeEvent(self, event):
+    # The width decides where the rows break, so everything has to be positioned again
+
+    super(ThumbnailGrid, self).resizeEvent(event)
+    self.relayout()
+
+  def scrollContentsBy(self, dx, dy):
+    # Nothing to move around, just paint what's in view now
+
+    self.viewport().update()
+
+  def paintEvent(self, event):
+    # Paints only the items that intersect the area that needs painting
+
+    if self.dirty:
+
+      self.relayout()
+
+    offset = self.verticalScrollBar().value()
+    exposed = event.rect()
+
+    top = exposed.top() + offset
+    bottom = exposed.bottom() + offset
+
+    painter = QPainter(self.viewport())
+
+    # The sections that start before bottom and end after top
+    position = max(0, bisect.bisect_right(self.tops, top) - 1)
+
+    while position < len(self.sections) and self.tops[position] <= bottom:
+
+      section = self.sections[position]
+      section_top = self.tops[position]
+
+      start, end = section.itemRange(top - section_top, bottom - section_top)
+
+      for index in range(start, end):
+
+        section.items[index].paint(painter,
+                                   section.itemGeometry(index).translated(0, section_top - offset))
+
+      position += 1
+
+    painter.end()
+
+    if self.pixels is not None:
+
+      self.pixels.trim()
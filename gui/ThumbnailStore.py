@@ -0,0 +1,272 @@
+class ThumbnailRecord:
+
+  # Everything we know about one imported file
+  # __slots__ keeps this to a fraction of the dict it used to be, since there's one per file.
+  # date, ext, safety, selected and tags are indexed by the ThumbnailStore, so only ever change
+  # those through it.
+
+  __slots__ = ("index", "path", "ext", "date", "time", "key", "widget", "tags", "selected",
+               "safety", "post_id", "duplicate", "phash", "group", "removed")
+
+  def __init__(self, index, path, ext, date, time, key, widget, phash):
+
+    # Where the record is in the ThumbnailStore, which never changes
+    self.index = index
+
+    self.path = path
+    self.ext = ext
+    self.date = date
+    self.time = time
+
+    # The date and time as a DateKey
+    self.key = key
+
+    # The ThumbnailItem in the grid
+    self.widget = widget
+
+    self.tags = []
+    self.selected = False
+    self.safety = ''
+
+    # The post on the server once uploaded, duplicate being whether it was already there
+    self.post_id = None
+    self.duplicate = False
+
+    # The dHash, and the number of the group of near-duplicates it's in (or None)
+    self.phash = phash
+    self.group = None
+
+    # Whether the file is gone, see ThumbnailStore.remove
+    self.removed = False
+
+class ThumbnailStore:
+
+  # The ThumbnailRecords of every imported file, in the order they were added, with indexes on
+  # the fields we filter and bulk edit by: date, extension, safety, selection and tags.
+  # Each index maps a value to the set of record indices that have it, so finding every file of a
+  # date or changing the safety of a selection only touches the records involved, never all of
+  # them. Filters with more than one field intersect their sets, smallest first.
+  # Repeated values (dates, extensions, safeties) are shared between records instead of every
+  # record having its own copy.
+  # Removed records keep their place so that indices stay valid, but they aren't in any index,
+  # iterating or counting the store skips them, and bulk updates leave them alone.
+
+  def __init__(self):
+
+    self.records = []
+
+    # path -> record index
+    self.paths = {}
+
+    # value -> set of record indices
+    self.dates = {}
+    self.exts = {}
+    self.safeties = {}
+    self.tags = {}
+
+    # The indices of the selected records
+    self.selected = set()
+
+    # One copy of every date, extension and safety, which every record that has it points to
+    self.values = {}
+
+  def __len__(self):
+
+    return len(self.paths)
+
+  def __iter__(self):
+
+    return (record for record in self.records if not record.removed)
+
+  def __getitem__(self, index):
+
+    return self.records[index]
+
+  def add(self, path, date, time, key, widget, phash):
+    # Adds a record for a newly imported file, and returns it
+
+    index = len(self.records)
+    ext = path.split('.')[-1].lower()
+
+    record = ThumbnailRecord(index, path, self.values.setdefault(ext, ext),
+                             self.values.setdefault(date, date), time, key, widget, phash)
+
+    self.records.append(record)
+    self.paths[path] = index
+
+    ThumbnailStore.indexed(self.dates, record.date).add(index)
+    ThumbnailStore.indexed(self.exts, record.ext).add(index)
+    ThumbnailStore.indexed(self.safeties, record.safety).add(index)
+
+    return record
+
+  def replace(self, index, date, time, key, widget, phash):
+    # Points the record at index to a new version of its file, keeping its tags and safety
+    # Anything we knew from the server is about the old version, so that's forgotten.
+
+    record = self.records[index]
+
+    date = self.values.setdefault(date, date)
+
+    if record.date != date:
+
+      self.dates[record.date].discard(index)
+      ThumbnailStore.indexed(self.dates, date).add(index)
+
+      record.date = date
+
+    record.time = time
+    record.key = key
+    record.widget = widget
+    record.phash = phash
+
+    record.post_id = None
+    record.duplicate = False
+    record.group = None
+
+  def remove(self, index):
+    # Takes the record at index out of every index, its file is gone
+
+    record = self.records[index]
+
+    del self.paths[record.path]
+
+    self.dates[record.date].discard(index)
+    self.exts[record.ext].discard(index)
+    self.safeties[record.safety].discard(index)
+
+    for tag in record.tags:
+
+      self.tags[tag].discard(index)
+
+    self.selected.discard(index)
+
+    record.selected = False
+    record.removed = True
+
+  def indexed(index, value):
+    # Returns the set of records with value in index, making it if it isn't there yet
+
+    indices = index.get(value)
+
+    if indices is None:
+
+      indices = index[value] = set()
+
+    return indices
+
+  def find(self, path):
+    # Returns the record of a path, or None if it wasn't imported
+
+    index = self.paths.get(path)
+
+    return self.records[index] if index is not None else None
+
+  def live(self, indices):
+    # Returns the indices of records that aren't removed, as a list, so that indices can be any
+    # iterable, even one that can only be gone through once
+
+    return [index for index in indices if not self.records[index].removed]
+
+  def select(self, indices, selected=True):
+    # Selects (or deselects) the records at indices
+
+    indices = self.live(indices)
+
+    for index in indices:
+
+      self.records[index].selected = selected
+
+    if selected:
+
+      self.selected.update(indices)
+
+    else:
+
+      self.selected.difference_update(indices)
+
+  def clear_selection(self):
+
+    self.select(list(self.selected), False)
+
+  def set_safety(self, indices, safety):
+    # Changes the safety of the records at indices
+
+    indices = self.live(indices)
+    safety = self.values.setdefault(safety, safety)
+    target = ThumbnailStore.indexed(self.safeties, safety)
+
+    for index in indices:
+
+      record = self.records[index]
+
+      if record.safety != safety:
+
+        self.safeties[record.safety].discard(index)
+        target.add(index)
+
+        record.safety = safety
+
+  def add_tags(self, indices, tags):
+    # Gives the records at indices every tag in tags they don't have yet
+
+    indices = self.live(indices)
+
+    for tag in tags:
+
+      tagged = ThumbnailStore.indexed(self.tags, tag)
+
+      for index in indices:
+
+        if index not in tagged:
+
+          tagged.add(index)
+          self.records[index].tags.append(tag)
+
+  def remove_tags(self, indices, tags):
+    # Takes every tag in tags away from the records at indices
+
+    indices = self.live(indices)
+
+    for tag in tags:
+
+      tagged = self.tags.get(tag, set())
+
+      for index in indices:
+
+        if index in tagged:
+
+          tagged.discard(index)
+          self.records[index].tags.remove(tag)
+
+  def where(self, date=None, ext=None, safety=None, tag=None, selected=None):
+    # Returns the set of indices of the records that match every given field
+    # selected=True only matches selected records, selected=False only unselected ones.
+
+    matches = []
+
+    for index, value in ((self.dates, date), (self.exts, ext), (self.safeties, safety),
+                         (self.tags, tag)):
+
+      if value is not None:
+
+        matches.append(index.get(value, set()))
+
+    if selected:
+
+      matches.append(self.selected)
+
+    if not matches:
+
+      result = set(self.paths.values())
+
+    else:
+
+      matches.sort(key=len)
+      result = matches[0].intersection(*matches[1:])
+
+    if selected is False:
+
+      result -= self.selected
+
+    return result
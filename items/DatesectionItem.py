@@ -1,37 +1,37 @@
 import calendar
 
-from PyQt5.QtCore import Qt
-from PyQt5.QtWidgets import QLabel, QVBoxLayout, QWidget
+from PyQt5.QtCore import Qt, QRect, QSize
+from PyQt5.QtGui import QFontMetrics
 
 from assets.Colors import Colors
 from assets.Fonts import Fonts
 
-class DatesectionItem(QWidget):
+class DatesectionItem:
 
-  def __init__(self):
+  # The header above every date in the ThumbnailGrid. Like ThumbnailItem, this isn't a widget, the
+  # grid calls paint() whenever it is on screen.
 
-    super(DatesectionItem, self).__init__()
+  # The font is the same for every datesection, so only make it once
+  font = None
 
-    # Tells FlowLayout whether or not to start a newline before or after this widget
-    self.newline_before = True 
-    self.newline_after = True
+  def __init__(self):
 
-    self.height = 30 # This widget needs a different height than normal
+    # Tells FlowLayout whether or not to start a newline before or after this item
+    self.newline_before = True
+    self.newline_after = True
 
-    self.layout = QVBoxLayout()
-    self.label = QLabel()
+    self.height = 30 # This item needs a different height than normal
 
-    self.label.setObjectName("dateSectionLabel")
-    self.label.setContentsMargins(10, 0, 10, 0)
-    self.label.setFont(Fonts.NotoSansDisplay("Bold", 13))
+    self.text = ""
+    self.size = QSize(0, self.height)
+    self.rect = QRect()
 
-    self.layout.addWidget(self.label)
+    if DatesectionItem.font is None:
 
-    self.setLayout(self.layout)
-    self.setStyleSheet(f"background: {Colors.bg}") # Why can't I set this in the master stylesheet????
+      DatesectionItem.font = Fonts.NotoSansDisplay("Bold", 13)
 
   def setDate(self, year, month, day):
-    # Set date text for inner QLabel
+    # Set date text
 
     # Pad month and day
     month = int(str(month).zfill(2))
@@ -40,9 +40,40 @@ class DatesectionItem(QWidget):
     # Final string
     final_string = f"{calendar.month_name[month]} {day}, {year}"
 
-    self.label.setText(final_string)
+    self.setText(final_string)
 
   def setText(self, text):
-    # Set text and width of inner QLabel
+    # Set text and width
+
+    self.text = text
+
+    # Leave 10px on either side of the text
+    width = QFontMetrics(DatesectionItem.font).horizontalAdvance(text) + 20
+    self.size = QSize(width, self.height)
+
+  def paint(self, painter, rect):
+    # Paints the date into rect, which is its geometry moved to where it is on screen
+
+    painter.fillRect(rect, Colors.QCol(Colors.bg))
+
+    painter.setFont(DatesectionItem.font)
+    painter.setPen(Colors.QCol(Colors.fg))
+    painter.drawText(rect.adjusted(10, 0, -10, 0), Qt.AlignLeft | Qt.AlignVCenter, self.text)
+
+  # The part of the QLayoutItem interface that FlowLayout uses
+
+  def sizeHint(self):
+
+    return self.size
+
+  def setGeometry(self, rect):
+
+    self.rect = rect
+
+  def geometry(self):
+
+    return self.rect
+
+  def widget(self):
 
-    self.label.setText(text)
\ No newline at end of file
+    return None
@@ -1,22 +1,165 @@
-from PyQt5.QtCore     import Qt
-from PyQt5.QtGui      import QPixmap
-from PyQt5.QtWidgets  import QLabel
+from PyQt5.QtCore     import Qt, QRect, QSize
+from PyQt5.QtGui      import QImage, QFontMetrics
 
-class ThumbnailItem(QLabel):
+from assets.Colors    import Colors
+from assets.Fonts     import Fonts
 
-  def __init__(self):
+# How tall the upload progress bar at the bottom of a thumbnail is
+PROGRESS_HEIGHT = 4
+
+# The colors groups of near-duplicates are marked with, so neighbouring groups look different
+GROUP_COLORS = [Colors.fg_blue, Colors.fg_green, Colors.fg_orange, Colors.fg_red, Colors.fg_l_blue]
+
+# How much files that are already on the server get darkened, from 0 to 255
+DUPLICATE_SHADE = 160
+
+class ThumbnailItem:
+
+  # A thumbnail in the ThumbnailGrid. This isn't a widget: the grid only paints the items that are
+  # on screen, so each one just remembers its size, where FlowLayout put it, and the thumbnail.
+  # The thumbnail is either a QImage of its own, or lives in a PixelCache, which only keeps it
+  # decoded while there's room for it.
+  # __slots__ keeps the per-item memory down, since we have one of these per file.
+
+  __slots__ = ("newline_before", "newline_after", "image", "pixels", "stored", "size", "source",
+               "rect", "progress", "group", "duplicate")
+
+  # The font of the badges is the same for every thumbnail, so only make it once
+  font = None
 
-    super(ThumbnailItem, self).__init__()
+  def __init__(self):
 
-    # Tells FlowLayout whether or not to start a newline before or after this widget
+    # Tells FlowLayout whether or not to start a newline before or after this item
     self.newline_before = False
     self.newline_after = False
 
-    self.thumb = QPixmap()
+    self.image = QImage()
+    self.size = QSize()
+
+    # The (width, height) of the base level of the thumbnail's pyramid if it's in a PixelCache,
+    # which decides the size it's shown at, see sizeHint
+    self.source = None
+
+    # The PixelCache the thumbnail is in (or None if it's image), and what it needs to find the
+    # compressed thumbnail again
+    self.pixels = None
+    self.stored = None
+    self.rect = QRect()
+
+    # How much of the file has been uploaded, between 0 and 1, or None when it isn't uploading
+    self.progress = None
+
+    # The number of the group of near-duplicates this thumbnail is in, or None
+    self.group = None
+
+    # Whether the file was already on the server, so it didn't get uploaded
+    self.duplicate = False
+
+  def setImage(self, image):
+    # Sets the thumbnail to a QImage
+
+    self.image = image
+    self.size = image.size()
+
+  def setPixels(self, pixels, size, image, encoded):
+    # Puts the thumbnail in a PixelCache, encoded being every level of it compressed, and size and
+    # image those of the base level, image being None if it hasn't been decoded
+
+    self.image = None
+    self.pixels = pixels
+    self.size = size
+    self.source = (size.width(), size.height())
+
+    pixels.add(self, image, encoded)
+
+  def paint(self, painter, rect):
+    # Paints the thumbnail into rect, which is its geometry moved to where it is on screen
+
+    image = self.image if self.pixels is None else self.pixels.image(self)
+
+    painter.drawImage(rect.topLeft(), image)
+
+    if self.duplicate:
+
+      shade = Colors.QCol(Colors.bg)
+      shade.setAlpha(DUPLICATE_SHADE)
+
+      painter.fillRect(rect, shade)
+
+    if self.progress is not None:
+
+      bar = QRect(rect.left(), rect.bottom() - PROGRESS_HEIGHT + 1, rect.width(), PROGRESS_HEIGHT)
+
+      painter.fillRect(bar, Colors.QCol(Colors.bg))
+      painter.fillRect(bar.adjusted(0, 0, int(rect.width() * self.progress) - rect.width(), 0),
+                       Colors.QCol(Colors.fg_special))
+
+    # The number of the thumbnail's group of near-duplicates goes in its top left corner, and
+    # whether it was already on the server in the top right one
+    if self.group is not None:
+
+      self.paintBadge(painter, rect, f"#{self.group}", GROUP_COLORS[self.group % len(GROUP_COLORS)],
+                      False)
+
+    if self.duplicate:
+
+      self.paintBadge(painter, rect, "On server", Colors.fg_l_yellow, True)
+
+  def paintBadge(self, painter, rect, text, color, right):
+    # Paints text on a badge of color in the top left corner of rect, or the top right one
+
+    if ThumbnailItem.font is None:
+
+      ThumbnailItem.font = Fonts.NotoSansDisplay("Bold", 9)
+
+    metrics = QFontMetrics(ThumbnailItem.font)
+    badge = QRect(rect.left() + 4, rect.top() + 4,
+                  metrics.horizontalAdvance(text) + 8, metrics.height() + 2)
+
+    if right:
+
+      badge.moveRight(rect.right() - 4)
+
+    painter.fillRect(badge, Colors.QCol(color))
+
+    painter.setFont(ThumbnailItem.font)
+    painter.setPen(Colors.QCol(Colors.bg))
+    painter.drawText(badge, Qt.AlignCenter, text)
+
+  def setProgress(self, progress):
+    # Sets the upload progress shown at the bottom of the thumbnail, None hides it
+
+    self.progress = progress
+
+  def setGroup(self, group):
+    # Sets the number of the group of near-duplicates shown on the thumbnail, None hides it
+
+    self.group = group
+
+  def setDuplicate(self, duplicate):
+    # Sets whether the thumbnail is marked as already being on the server
+
+    self.duplicate = duplicate
+
+  # The part of the QLayoutItem interface that FlowLayout uses
+
+  def sizeHint(self):
+    # Thumbnails in a PixelCache are as tall as it's zoomed to
+
+    if self.pixels is not None:
+
+      return self.pixels.size(self.source)
+
+    return self.size
+
+  def setGeometry(self, rect):
+
+    self.rect = rect
+
+  def geometry(self):
+
+    return self.rect
 
-  def loadFromData(self, data):
-    # Abbreviates the process of inserting a QPixmap into this QLabel
+  def widget(self):
 
-    self.thumb.loadFromData(data) # Load the bytearray into the QPixmap
-    self.setPixmap(self.thumb) # Attach the QPixmap to this QLabel
-    self.setFixedWidth(self.sizeHint().width()) # Make sure of the width
\ No newline at end of file
+    return None
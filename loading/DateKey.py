@@ -0,0 +1,35 @@
+import datetime
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# The key of files without a (valid) creation date, which is older than any real date
+UNKNOWN = -(1 << 62)
+
+# Keys count seconds from here
+EPOCH = datetime.datetime(1970, 1, 1)
+
+class DateKey:
+
+  # Turns the (year, month, day) and (hour, minute, second) string tuples thumbnails come with
+  # into one integer, seconds since the epoch (the time zone doesn't matter, they only get compared
+  # with each other). Integers compare and hash a lot faster than tuples of strings, so dates are
+  # parsed into a key once per file and everything that orders or groups files uses the key.
+
+  def key(creation_date, creation_time):
+    # Returns the key of a date and time, or UNKNOWN if they aren't a real date
+
+    try:
+
+      moment = datetime.datetime(*map(int, creation_date), *map(int, creation_time))
+
+    except (ValueError, TypeError):
+
+      # All zeroes (no date found), a field out of range, or a tuple of the wrong length
+      return UNKNOWN
+
+    return int((moment - EPOCH).total_seconds())
+
+  def day(key):
+    # Returns the key of midnight of the day key is on, which is what files are grouped by
+
+    return key if key == UNKNOWN else key - key % SECONDS_PER_DAY
@@ -0,0 +1,296 @@
+import re
+import struct
+import zlib
+
+from collections import namedtuple
+
+# What ExifReader.read finds in an image's header
+# datetime is a "YYYY:MM:DD HH:MM:SS" string or None, orientation is the EXIF orientation (1 when
+# there is none), thumbnail is the embedded JPEG thumbnail's bytes or None, and width and height
+# are the stored size of the image (before orientation is applied) or None
+ImageMetadata = namedtuple(
+  "ImageMetadata",
+  ["datetime", "orientation", "thumbnail", "width", "height"],
+  defaults=(None, 1, None, None, None))
+
+# The EXIF tags we care about
+TAG_ORIENTATION = 274
+TAG_DATETIME = 306
+TAG_EXIF_IFD = 34665
+TAG_DATETIME_ORIGINAL = 36867
+TAG_THUMBNAIL_OFFSET = 513
+TAG_THUMBNAIL_LENGTH = 514
+
+# How many bytes each TIFF field type takes up, only the ones we can come across
+TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8}
+
+# The JPEG start of frame markers, which hold the size of the image
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# Matches EXIF style "YYYY:MM:DD HH:MM:SS" as well as ISO style "YYYY-MM-DDTHH:MM:SS"
+DATETIME_PATTERN = re.compile(r"(\d{4})\D(\d{2})\D(\d{2})[ T](\d{2}):(\d{2}):(\d{2})")
+
+class ExifReader:
+
+  # Reads the metadata of JPEGs and PNGs straight from the file's header, without decoding (or
+  # even fully reading) the image. For a JPEG this only reads the markers in front of the image
+  # data, which is usually a few KB, and skips over everything else.
+
+  def read(path):
+    # Returns the ImageMetadata of an image, anything that can't be found is left empty
+
+    try:
+
+      with open(path, "rb") as f:
+
+        head = f.read(8)
+
+        if head[:2] == b"\xff\xd8":
+
+          f.seek(2)
+          return ExifReader.jpeg_metadata(f)
+
+        elif head == PNG_SIGNATURE:
+
+          return ExifReader.png_metadata(f)
+
+    except (OSError, ValueError, IndexError, struct.error, zlib.error):
+
+      # Whatever is broken about the header, the image may still decode
+      pass
+
+    return ImageMetadata()
+
+  def jpeg_metadata(f):
+    # Walks the markers of a JPEG until the start of frame, which comes after the EXIF
+    # f has to be positioned right after the SOI.
+
+    metadata = ImageMetadata()
+
+    while True:
+
+      marker = f.read(2)
+
+      if len(marker) < 2 or marker[0] != 0xFF:
+
+        return metadata
+
+      # Markers can be padded with any amount of 0xFF
+      while marker[1] == 0xFF:
+
+        marker = marker[1:] + f.read(1)
+
+        # The padding runs until the end of the file
+        if len(marker) < 2:
+
+          return metadata
+
+      # Start of scan or end of image, the image data starts here so there's nothing left
+      if marker[1] in (0xDA, 0xD9):
+
+        return metadata
+
+      # Markers without a length
+      if marker[1] == 0x01 or 0xD0 <= marker[1] <= 0xD7:
+
+        continue
+
+      length = struct.unpack(">H", f.read(2))[0]
+
+      if length < 2:
+
+        return metadata
+
+      if marker[1] == 0xE1 and metadata.datetime is None and metadata.thumbnail is None:
+
+        segment = f.read(length - 2)
+
+        if segment[:6] == b"Exif\x00\x00":
+
+          metadata = ExifReader.parse_tiff(segment[6:])
+
+      elif marker[1] in JPEG_SOF_MARKERS:
+
+        # The precision comes first, then the height and width
+        height, width = struct.unpack(">xHH", f.read(5))
+
+        return metadata._replace(width=width, height=height)
+
+      else:
+
+        f.seek(length - 2, 1)
+
+  def png_metadata(f):
+    # Walks the chunks of a PNG until the image data starts
+    # The EXIF can be in an eXIf chunk, otherwise we settle for a "Creation Time" text chunk.
+
+    metadata = ImageMetadata()
+    datetime = None
+
+    while True:
+
+      header = f.read(8)
+
+      if len(header) < 8:
+
+        break
+
+      length, chunk_type = struct.unpack(">I4s", header)
+
+      if chunk_type in (b"IDAT", b"IEND"):
+
+        break
+
+      if chunk_type == b"IHDR":
+
+        width, height = struct.unpack(">II", f.read(8))
+        metadata = metadata._replace(width=width, height=height)
+
+        f.seek(length - 8, 1)
+
+      elif chunk_type == b"eXIf":
+
+        exif = ExifReader.parse_tiff(f.read(length))
+        metadata = exif._replace(width=metadata.width, height=metadata.height)
+
+      elif chunk_type in (b"tEXt", b"zTXt") and datetime is None:
+
+        key, _, text = f.read(length).partition(b"\x00")
+
+        if key == b"Creation Time":
+
+          if chunk_type == b"zTXt":
+
+            # The first byte is the compression method, which can only be zlib
+            text = zlib.decompress(text[1:])
+
+          datetime = ExifReader.normalize_datetime(text.decode("latin-1"))
+
+      else:
+
+        f.seek(length, 1)
+
+      # Skip the CRC
+      f.seek(4, 1)
+
+    if metadata.datetime is None:
+
+      metadata = metadata._replace(datetime=datetime)
+
+    return metadata
+
+  def parse_tiff(tiff):
+    # Parses the TIFF structure that EXIF is stored in
+    # Returns ImageMetadata, using DateTimeOriginal over DateTime when an image has both
+
+    if tiff[:2] == b"II":
+
+      endian = "<"
+
+    elif tiff[:2] == b"MM":
+
+      endian = ">"
+
+    else:
+
+      return ImageMetadata()
+
+    try:
+
+      ifd0_offset = struct.unpack(endian + "I", tiff[4:8])[0]
+      ifd0, ifd1_offset = ExifReader.parse_ifd(tiff, endian, ifd0_offset)
+
+      exif_ifd = {}
+
+      # Offsets have to be integers, broken files can have anything in these tags
+      if isinstance(ifd0.get(TAG_EXIF_IFD), int):
+
+        exif_ifd = ExifReader.parse_ifd(tiff, endian, ifd0[TAG_EXIF_IFD])[0]
+
+      ifd1 = {}
+
+      if ifd1_offset:
+
+        ifd1 = ExifReader.parse_ifd(tiff, endian, ifd1_offset)[0]
+
+    except struct.error:
+
+      return ImageMetadata()
+
+    datetime = exif_ifd.get(TAG_DATETIME_ORIGINAL) or ifd0.get(TAG_DATETIME)
+    orientation = ifd0.get(TAG_ORIENTATION, 1)
+
+    if orientation not in range(1, 9):
+
+      orientation = 1
+
+    # The thumbnail's offset is relative to the start of the TIFF data
+    thumbnail = None
+
+    if isinstance(ifd1.get(TAG_THUMBNAIL_OFFSET), int) and \
+       isinstance(ifd1.get(TAG_THUMBNAIL_LENGTH), int):
+
+      start = ifd1[TAG_THUMBNAIL_OFFSET]
+      thumbnail = tiff[start:start + ifd1[TAG_THUMBNAIL_LENGTH]] or None
+
+    return ImageMetadata(ExifReader.normalize_datetime(datetime), orientation, thumbnail)
+
+  def parse_ifd(tiff, endian, offset):
+    # Parses one IFD, only keeping strings and integers since those are all we need
+    # Returns a tuple of (dict of tag -> value, offset of the next IFD)
+
+    tags = {}
+
+    count = struct.unpack(endian + "H", tiff[offset:offset + 2])[0]
+
+    for i in range(count):
+
+      entry = offset + 2 + i * 12
+      tag, field_type, value_count = struct.unpack(endian + "HHI", tiff[entry:entry + 8])
+
+      size = TYPE_SIZES.get(field_type, 1) * value_count
+
+      # Values that fit in 4 bytes are stored in the entry itself, otherwise it's an offset
+      if size <= 4:
+
+        value_offset = entry + 8
+
+      else:
+
+        value_offset = struct.unpack(endian + "I", tiff[entry + 8:entry + 12])[0]
+
+      if field_type == 2: # ASCII
+
+        raw = tiff[value_offset:value_offset + value_count]
+        tags[tag] = raw.split(b"\x00")[0].decode("latin-1").strip()
+
+      elif field_type == 3 and value_count == 1: # SHORT
+
+        tags[tag] = struct.unpack(endian + "H", tiff[value_offset:value_offset + 2])[0]
+
+      elif field_type == 4 and value_count == 1: # LONG
+
+        tags[tag] = struct.unpack(endian + "I", tiff[value_offset:value_offset + 4])[0]
+
+    next_entry = offset + 2 + count * 12
+    next_offset = struct.unpack(endian + "I", tiff[next_entry:next_entry + 4])[0]
+
+    return (tags, next_offset)
+
+  def normalize_datetime(datetime):
+    # Returns datetime as "YYYY:MM:DD HH:MM:SS", or None if it isn't a usable date and time
+    # Cameras without a clock like to write all zeroes, and PNG text chunks can have ISO dates.
+
+    if not datetime or not isinstance(datetime, str):
+
+      return None
+
+    match = DATETIME_PATTERN.match(datetime.strip())
+
+    if match is None or match.group(1) == "0000":
+
+      return None
+
+    return "{}:{}:{} {}:{}:{}".format(*match.groups())
@@ -0,0 +1,57 @@
+from PyQt5.QtCore import QObject, QFileSystemWatcher, QTimer, pyqtSignal
+
+# Seconds to wait after the last change before reporting it, files tend to be added in bursts
+SETTLE_INTERVAL = 2.0
+
+# Seconds between rescans that happen whether or not a folder changed, which is how files that get
+# overwritten in place are found
+RESCAN_INTERVAL = 60.0
+
+class FolderWatcher(QObject):
+
+  # Watches an imported folder and all of its subfolders, and emits changed once things have
+  # quieted down after a file was added to, removed from or renamed in any of them.
+  # Only folders are watched, not files: there can be tens of thousands of files, which is more
+  # than the system allows watches for, while adding or removing one changes its folder anyway.
+  # A file that gets overwritten in place doesn't change its folder though, so changed is also
+  # emitted every RESCAN_INTERVAL. A rescan only stats the files, and the Importer only makes
+  # thumbnails again for the ones whose size or modification time changed.
+
+  changed = pyqtSignal()
+
+  def __init__(self, parent=None):
+
+    super(FolderWatcher, self).__init__(parent)
+
+    self.watcher = QFileSystemWatcher(self)
+    # Which folder changed doesn't matter, the Importer compares all of them
+    self.watcher.directoryChanged.connect(lambda path: self.poke())
+
+    # Every change starts this over, so a burst of changes is reported once it's over
+    self.timer = QTimer(self)
+
+    self.timer.setSingleShot(True)
+    self.timer.setInterval(int(SETTLE_INTERVAL * 1000))
+    self.timer.timeout.connect(self.changed)
+
+    self.rescan_timer = QTimer(self)
+
+    self.rescan_timer.setInterval(int(RESCAN_INTERVAL * 1000))
+    self.rescan_timer.timeout.connect(self.poke)
+    self.rescan_timer.start()
+
+  def watch(self, folders):
+    # Watches every folder in folders that isn't watched yet
+    # Folders that get deleted stop being watched by themselves.
+
+    new = set(folders).difference(self.watcher.directories())
+
+    if new:
+
+      self.watcher.addPaths(sorted(new))
+
+  def poke(self):
+    # Emits changed once nothing else has changed for SETTLE_INTERVAL
+    # Also for when an update left files that were still being written to.
+
+    self.timer.start()
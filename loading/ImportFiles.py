@@ -1,269 +1,111 @@
-import os
-import subprocess
-import re
-import cv2
+from multiprocessing import shared_memory
 
-from PIL import Image
+from PyQt5.QtCore import QThread, QBuffer, QByteArray, pyqtSignal
+from PyQt5.QtGui import QImage, QImageReader
 
-from PyQt5.QtCore import QThread, pyqtSignal
-
-from assets.FileExts import FileExts
+from loading.Importer import Importer
+from loading.Pyramid import BASE
+from loading.VideoReader import VIDEO_OFFSET
 
 class ImportFiles(QThread):
 
-  # Emmitted when we are ready to send the whole list of thumbnails to the main thread
-  # This also acts as a finished signal.
+  # Runs an Importer on a separate thread, and passes what it emits on to the main thread as
+  # pyqtSignals, with every thumbnail turned into an (image, size, encoded) tuple, see receive
+
+  # Emmitted every time a batch of thumbnails is ready to be inserted by the main thread
+  # Use the QThread's own finished signal to know when the last batch has been sent.
   send_thumbnails_signal = pyqtSignal(list)
 
+  # Emmitted once every thumbnail has been sent, with a list of groups of near-duplicates, each
+  # group being a list of paths
+  send_groups_signal = pyqtSignal(list)
+
+  # Emmitted by updates with the paths of files that were sent before but are gone now
+  remove_thumbnails_signal = pyqtSignal(list)
+
   # Emmitted in order to format and modify the progressbar
   format_progressbar = pyqtSignal(str)
   max_progressbar = pyqtSignal(int)
   increment_progressbar = pyqtSignal()
 
-  def __init__(self, folder_path, thumb_height):
+  def __init__(self, folder_path, thumb_height, workers=None, video_offset=VIDEO_OFFSET):
 
     super(ImportFiles, self).__init__()
 
-    self.folder_path = folder_path
-    self.thumb_height = thumb_height
-    self.files = os.scandir(self.folder_path)
-
-    self.file_count = 0
-
-    for root, dirs, files in os.walk(folder_path):
-
-      for name in files:
-
-        # Make sure these are lowercased, some extensions are all caps  
-        ext = name.split('.')[-1].lower()
+    self.importer = Importer(folder_path, thumb_height, workers, self.relay, self.receive,
+                             video_offset)
 
-        if ext in FileExts.image_exts or ext in FileExts.video_exts or ext in FileExts.misc_exts:
+    # Whether the next run only imports what changed since the last one, and how many seconds
+    # files have to be left alone for before that, see rescan
+    self.updating = False
+    self.settle = 0
 
-          self.file_count += 1
+    # The signal each of the Importer's events goes out as
+    self.signals = {
+      "send_thumbnails": self.send_thumbnails_signal,
+      "send_groups": self.send_groups_signal,
+      "remove_thumbnails": self.remove_thumbnails_signal,
+      "format_progressbar": self.format_progressbar,
+      "max_progressbar": self.max_progressbar,
+      "increment_progressbar": self.increment_progressbar}
 
   def run(self):
     # Main function that gets moved to the separate thread
 
-    print("Processing files...")
-
-    # First, generate thumbnails and put it that and metadata into a list
-    thumbnails = self.generate_thumbnails(self.files)
-
-    # Then, sort those thumbnails by date and time created
-    thumbnails.sort(reverse=True, key=lambda tup: (tup[1], tup[2]))
-
-    # Finally, send the thumbnails and section markers over to the main thread
-    self.send_thumbnails(thumbnails)
-
-  def generate_thumbnails(self, raw_files):
-    # Generates thumbnails from files found in the selected directory
-    # Returns an array of tuples which contain (img_byte_array, creation_date, creation_time)
-    # Each tuple corresponds to a thumbnail of an image or video, or if it's an SWF, a placeholder
-
-    # The array we will add each thumbnail's tuple to
-    thumbs = []
-
-    # Format progressbar to display current action
-    self.format_progressbar.emit("Generating thumbnails - %v/%m")
-    self.max_progressbar.emit(self.file_count)
-
-    for file in raw_files:
-
-      print(f"Processing \"{file.name}\"")
-
-      # Only process files, not directories
-      if file.is_file():
-
-        file_ext = file.name.split('.')[-1].lower()
-
-        if file_ext in FileExts.image_exts: # For image files...
-
-          # Read image from file
-          try:
-
-            im = cv2.imread(file.path)
-
-          except cv2.error().code as e: # TODO: Add separate function to show why loading failed in grid
-
-            print(f"Error while loading {file.name} with error {e}")
-
-          else:
-
-            # Resize image
-            im = self.proper_resize(im, self.thumb_height)
-
-            # Encode image into bytearrray
-            img_byte_array = bytes(cv2.imencode(".png", im)[1])
-
-            # Open image with PIL (i die) and get creation date metadata which is under "306"
-            pil_image = Image.open(file.path)
-
-            exif_data = None
-
-            # We use try block because some images do not contain EXIF metadata.
-            try:
-
-              exif_data = pil_image._getexif()
-
-              # Get the creation date and time
-              creation_date = exif_data[306].split(' ')[0]
-              creation_time = exif_data[306].split(' ')[1]
+    if self.updating:
 
-            except: # Triggered when a key isn't in the image EXIF
+      self.importer.update(self.settle)
 
-              print(f"Could not find creation_date or creation_time in {file.name}")
-              
-              # Setting date and time to zeroes makes the image last in the list
-              creation_date = "0000-00-00"
-              creation_time = "00:00:00"
-
-            # Cleanup
-            im = None
-
-        elif file_ext in FileExts.video_exts: # For video files...
-            
-          # Get video metadata
-          metadata = self.get_video_metadata(file.path)
-
-          # Only attempt to load the video if ffmpeg is able to get metadata
-          # This prevents ffmpeg inside cv2 from printing an unhandleable error
-          if metadata == False:
-
-            print(f"Error: Loading {file.name} failed, moov atom not found. Skipping...")
-
-            creation_date = False
-
-          else:
-
-            creation_date = metadata[0]
-            creation_time = metadata[1]
-
-            # Read video file
-            try:
-
-              frames = cv2.VideoCapture(file.path)
-              first_frame = frames.read()[1]
-
-            except cv2.error().code as e: # TODO: same as the images
-
-              print(f"Error while loading {file.name} with error {e}")
-              exit(1)
-
-            else:
-
-              # Resize frame | !!! .read() result is a tuple, the 2nd value is the ndarray we need.
-              resized_first_frame = self.proper_resize(first_frame, self.thumb_height)
-
-              # Encode first frame into bytearray
-              img_byte_array = bytes(cv2.imencode(".png", resized_first_frame)[1])
-
-              # Free up memory
-              frames.release()
-              cv2.destroyAllWindows()
-
-      if isinstance(creation_date, str):
-        # Only if we aren't skipping a file
-        
-        # Split dates/times by any non-number character into tuple for consistency
-        creation_date = tuple(re.split("[^0-9]", creation_date))
-        creation_time = tuple(re.split("[^0-9]", creation_time))
-
-        # Add the bytearray and info to the list
-        thumbs.append((img_byte_array, creation_date, creation_time))
-
-        creation_date = None
-
-      # Increment progressbar after every cycle
-      self.increment_progressbar.emit()
-
-    return thumbs
-
-  def send_thumbnails(self, thumbs):
-    # Sends the whole list of thumbnails to the main thread using pyqtSignals
-    # This used to have a for loop sending each tuple in the list one by one.
-    # However, this created a premature finish problem, because the thread would emit the next
-    # signal regardless of whether it was finished or not. Then, it would emit the finished signal
-    # before all the thumbnails have been added. 
-
-    print("Sending thumbnails...")
-
-    # Format the progressbar
-    self.format_progressbar.emit("Inserting thumbnails - %v/%m")
-    self.max_progressbar.emit(len(thumbs))
-
-    # Send the list
-    self.send_thumbnails_signal.emit(thumbs) 
-
-    # We don't need this list anymore after that
-    thumbs = None
+    else:
 
-  def get_video_metadata(self, path):
-    # Gets metadata for video files, separate function because it's quite long
-    # Returns a tuple of (creation_date, creation_time)
+      self.importer.run()
 
-    # We use try block because we need to catch an exception
-    try:
+  def rescan(self, settle=0):
+    # Starts the thread again once it has finished, this time only importing what changed
+    # Thumbnails and groups are sent the same way as the first time, along with
+    # remove_thumbnails_signal for anything that's gone. See Importer.update for settle.
 
-      # Use subprocess to run a command, and collect its output
-      # For some reason, when FFMPEG errors, it outputs *all* output into stderr, so we have
-      # to pipe it to stdout.
-      subprocess.check_output(["ffmpeg", "-i", path], stderr=subprocess.STDOUT)
+    self.updating = True
+    self.settle = settle
+    self.start()
 
-    except subprocess.CalledProcessError as err:
+  def relay(self, event, *args):
 
-      # We deliberately "ignore" the error ffmpeg emits when no output is selected, since
-      # we don't need an output, only the metadata and information. We then take the output of
-      # the command and decode it since it comes in bytes
-      output = err.output.decode("ascii")
+    self.signals[event].emit(*args)
 
-    except FileNotFoundError:
+  def receive(self, pixels, encoded):
+    # Turns a thumbnail into an (image, size, encoded) tuple, or None if it can't be read
+    # image and size are those of the pyramid's base level, encoded has every level compressed.
+    # Freshly generated thumbnails are (shared_memory_name, height, width) pixels, Qt reads the BGR
+    # pixels straight out of the shared memory, so copying them into the QImage is the only copy
+    # the main process makes. The shared memory is freed afterwards.
+    # Cached ones don't get decoded, image is None and only the size is read from the header. The
+    # PixelCache decodes them once they are painted.
 
-      # Of course, if ffmpeg isn't even there, we warn the user and can't move on.
-      print("FATAL: ffmpeg not found, that most likely means you don't have it installed.")
-      exit(1)
+    if pixels is not None:
 
-    # Skip if ffmpeg returns a moov atom not found error
-    if re.search(r"moov", output):
+      name, height, width = pixels
 
-      return False
+      shared = shared_memory.SharedMemory(name=name)
 
-    else:
-
-      # Attempt to find the creation date in metadata
       try:
 
-        # If it's stupid but works, it ain't stupid.
-        # 1. get whatever is after the first "creation_time"
-        # 2. get whatever is before the 'Z'
-        # 3. get whatever is after the ": "
-        creation = output.split("creation_time")[1].split('Z')[0].split(": ")[1]
-
-      except IndexError:
-
-        # If we cannot split the output by "creation_time", assume it doesn't exist
-        creation_date = "0000-00-00"
-        creation_time = "00:00:00"
+        image = QImage(shared.buf, width, height, width * 3, QImage.Format_BGR888).copy()
 
-      else:
+      finally:
 
-        # Use regex to split in order to account for different notation styles
-        creation = re.split("[T ]", creation)
+        shared.close()
+        shared.unlink()
 
-        creation_date = creation[0]
-        creation_time = re.split("[\r.]",creation[1])[0]
+      if image.isNull():
 
-      # Return a tuple of the collected information
-      return (creation_date, creation_time)
+        return None
 
-  def proper_resize(self, img_data, desired_height):
-    # Calculates the proportion of the desired height to the original height, then resizes the
-    # length of the image by the proportion, and the height of the image to the desired height.
-    # We only care about the height because the thumbs need to be a uniform height.
+      return (image, image.size(), encoded)
 
-    width = img_data.shape[1]
-    height = img_data.shape[0]
+    buffer = QBuffer()
+    buffer.setData(QByteArray(encoded[BASE]))
 
-    new_length = int(width * (desired_height / (height)))
-    img_data = cv2.resize(img_data, (new_length, desired_height))
+    size = QImageReader(buffer).size()
 
-    return img_data
+    return (None, size, encoded) if size.isValid() else None
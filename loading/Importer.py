@@ -0,0 +1,338 @@
+import time
+import itertools
+
+from multiprocessing import shared_memory
+
+from loading.DateKey import DateKey
+from loading.PerceptualHash import PerceptualHash
+from loading.Pyramid import Pyramid
+from loading.Scanner import Scanner
+from loading.ThumbnailCache import ThumbnailCache
+from loading.ThumbnailEngine import ThumbnailEngine
+from loading.VideoReader import VIDEO_OFFSET
+
+from profiling.Tracer import Tracer
+
+# Thumbnails are sent in batches of at most this many...
+BATCH_SIZE = 64
+
+# ...or whatever has been collected after this many seconds, whichever comes first
+BATCH_INTERVAL = 0.25
+
+class Importer:
+
+  # Scans a folder, generates the thumbnails and metadata of everything in it and looks for
+  # near-duplicates, without anything from Qt, so it also runs without a GUI.
+  # Whoever runs it hears about what's happening through emit, which gets called with the name of
+  # an event and its arguments:
+  #   "send_thumbnails" (batch)   a batch of thumbnails is ready
+  #   "send_groups" (groups)      the groups of near-duplicates, each being a list of paths
+  #   "remove_thumbnails" (paths) files that were sent before are gone, see update
+  #   "format_progressbar" (text), "max_progressbar" (maximum), "increment_progressbar" ()
+  # What a thumbnail's image ends up being is up to load, see Importer.release.
+
+  def __init__(self, folder_path, thumb_height, workers=None, emit=None, load=None,
+               video_offset=VIDEO_OFFSET):
+
+    self.folder_path = folder_path
+    self.thumb_height = thumb_height
+
+    # Thumbnails are made for every level of the pyramid around thumb_height, see Pyramid
+    self.heights = Pyramid.heights(thumb_height)
+
+    self.emit = emit or (lambda event, *args: None)
+    self.load = load or Importer.release
+
+    # Every file we are going to import, filled in by the scanner once run starts
+    self.manifest = []
+
+    # Every folder the scanner went through, which is what has to be watched for changes
+    self.folders = []
+
+    # How many files the last update left alone because they were still being written to
+    self.unsettled = 0
+
+    # path -> dhash of every thumbnail that was sent, to find near-duplicates with
+    self.dhashes = {}
+
+    # The pool of worker processes that does the heavy lifting, workers=None uses every core
+    # Videos get their thumbnail from video_offset seconds in.
+    self.engine = ThumbnailEngine(thumb_height, workers, video_offset)
+
+    # Thumbnails from previous imports, so unchanged files don't have to be generated again
+    self.cache = ThumbnailCache()
+
+  def run(self):
+
+    # Walk the folder once, everything after this only looks at the manifest
+    self.emit("format_progressbar", "Scanning folder...")
+    self.emit("max_progressbar", 0)
+
+    self.manifest = self.scan()
+
+    # Whatever the cache has of files that are gone or changed is of no use anymore
+    self.prune_cache()
+
+    print(f"Processing {len(self.manifest)} files...")
+
+    # Generate thumbnails and metadata, they are sent as they finish
+    self.generate_thumbnails(self.manifest)
+
+    self.send_groups()
+
+  def update(self, settle=0):
+    # Imports whatever changed in the folder since the last run or update
+    # The folder gets scanned again, which only stats the files, and its manifest is compared to
+    # the previous one. Only new files and the ones whose size or modification time changed get
+    # thumbnails, they are sent like in run and replace what was sent for the same path before.
+    # Files that are gone are sent as "remove_thumbnails". Everything else is left alone.
+    # Files modified less than settle seconds ago are most likely still being copied in, so they
+    # are left for a later update and counted in self.unsettled.
+    # Returns whether anything changed.
+
+    previous = {entry.path: entry for entry in self.manifest}
+    settled_before = time.time_ns() - int(settle * 1e9)
+
+    # What the manifest ends up being is what has been imported
+    self.manifest = []
+    self.unsettled = 0
+
+    changed = []
+
+    for entry in self.scan():
+
+      old = previous.pop(entry.path, None)
+
+      if old is not None and (old.size, old.mtime) == (entry.size, entry.mtime):
+
+        self.manifest.append(entry)
+
+      elif entry.mtime > settled_before:
+
+        # Keep whatever we had of it until it settles
+        self.unsettled += 1
+
+        if old is not None:
+
+          self.manifest.append(old)
+
+      else:
+
+        self.manifest.append(entry)
+        changed.append(entry)
+
+    # Whatever is left wasn't found again
+    removed = list(previous)
+
+    if not changed and not removed:
+
+      return False
+
+    print(f"Found {len(changed)} new or changed and {len(removed)} removed files.")
+
+    self.prune_cache()
+
+    for path in removed:
+
+      self.dhashes.pop(path, None)
+
+    if removed:
+
+      self.emit("remove_thumbnails", removed)
+
+    if changed:
+
+      self.generate_thumbnails(changed)
+
+    # The groups may have changed either way
+    self.send_groups()
+
+    return True
+
+  def scan(self):
+    # Walks the folder, returns its manifest and keeps track of its folders
+
+    folders = []
+
+    with Tracer.span("scan") as span:
+
+      manifest = Scanner.scan(self.folder_path, folders)
+      span.set(files=len(manifest))
+
+    self.folders = folders
+
+    return manifest
+
+  def prune_cache(self):
+    # Deletes the cache entries of files in the folder that were removed or changed, going by the
+    # manifest, so they don't stay around until they get evicted
+
+    self.cache.open()
+
+    try:
+
+      with Tracer.span("cache_prune") as span:
+
+        pruned = self.cache.prune_folder(self.folder_path, [(entry.path, entry.size, entry.mtime)
+                                                            for entry in self.manifest])
+        span.set(files=pruned)
+
+    finally:
+
+      self.cache.close()
+
+    if pruned:
+
+      print(f"Pruned {pruned} files from the cache.")
+
+  def generate_thumbnails(self, manifest):
+    # Generates thumbnails for every file in the manifest
+    # Sends batches of tuples which contain
+    # (image, path, creation_date, creation_time, dhash, key), image being whatever load made of
+    # the thumbnail and key the date and time as a DateKey
+    # Each tuple corresponds to a thumbnail of an image or video, or if it's an SWF, a placeholder
+    # Anything in the thumbnail cache is loaded and sent right away, the rest is done by the
+    # ThumbnailEngine's worker processes and stored in the cache as it comes back.
+    # Returns the amount of thumbnails that were sent
+
+    # The current batch we add each thumbnail's tuple to, and when we last sent one
+    batch = []
+    last_sent = time.monotonic()
+    sent = 0
+
+    # Newly generated thumbnails that still have to be written to the cache
+    uncached = []
+
+    # Format progressbar to display current action
+    self.emit("format_progressbar", "Generating thumbnails - %v/%m")
+    self.emit("max_progressbar", len(manifest))
+
+    self.cache.open()
+
+    try:
+
+      with Tracer.span("cache_lookup", files=len(manifest)):
+
+        cached = self.cache.get_many([(entry.path, entry.size, entry.mtime) for entry in manifest],
+                                     self.heights)
+
+      print(f"Found {len(cached)} of {len(manifest)} thumbnails in the cache.")
+
+      # Cached thumbnails go first, they don't have to wait for anything
+      results = ((entry, (None,) + cached[entry.path], None)
+                 for entry in manifest if entry.path in cached)
+
+      # Everything else gets generated
+      generated = self.engine.generate([entry for entry in manifest if entry.path not in cached])
+
+      for entry, thumb, error in itertools.chain(results, generated):
+
+        if error is not None:
+
+          print(f"Error while processing {entry.path} with error {error}")
+
+        elif thumb is not None:
+          # Only if we aren't skipping a file
+
+          pixels, encoded, path, creation_date, creation_time, dhash = thumb
+
+          if pixels is not None:
+
+            # Freshly generated, only the encoded thumbnail goes into the cache
+            uncached.append((entry.size, entry.mtime, thumb[1:]))
+
+          with Tracer.span("load", path=path, cached=pixels is None):
+
+            image = self.load(pixels, encoded)
+
+          # Add the image and info to the batch
+          if image is not None:
+
+            key = DateKey.key(creation_date, creation_time)
+
+            batch.append((image, path, creation_date, creation_time, dhash, key))
+            self.dhashes[path] = dhash
+
+        # Increment progressbar after every file
+        self.emit("increment_progressbar")
+
+        # Send the batch once it's full or once it has been waiting for too long
+        if len(batch) >= BATCH_SIZE or (batch and time.monotonic() - last_sent >= BATCH_INTERVAL):
+
+          self.send_thumbnails(batch)
+
+          sent += len(batch)
+          batch = []
+          last_sent = time.monotonic()
+
+          # Writing to the cache alongside each batch keeps it to one transaction per batch
+          self.store(uncached)
+          uncached = []
+
+      # Send and store whatever is left over
+      if batch:
+
+        self.send_thumbnails(batch)
+        sent += len(batch)
+
+      self.store(uncached)
+
+    finally:
+
+      self.engine.shutdown()
+      self.cache.close()
+
+    return sent
+
+  def store(self, uncached):
+    # Writes newly generated thumbnails to the cache
+
+    with Tracer.span("cache_store", files=len(uncached)):
+
+      self.cache.put_many(uncached, self.heights)
+
+  def send_groups(self):
+    # Finds the groups of near-duplicates among everything that was sent, and sends them
+
+    self.emit("format_progressbar", "Looking for near-duplicates...")
+    self.emit("max_progressbar", 0)
+
+    with Tracer.span("cluster", files=len(self.dhashes)):
+
+      paths = list(self.dhashes)
+      groups = PerceptualHash.cluster(list(self.dhashes.values()))
+
+    groups = [[paths[index] for index in group] for group in groups]
+
+    print(f"Found {len(groups)} groups of near-duplicates.")
+
+    self.emit("send_groups", groups)
+
+  def send_thumbnails(self, thumbs):
+    # Sends a batch of thumbnails
+    # This used to send the whole list at the very end, which meant staring at a progressbar for
+    # the whole import, and then a frozen GUI while everything got inserted at once. Batches are
+    # small enough to insert without freezing, and the GUI puts each thumbnail into its date
+    # section so the order they arrive in doesn't matter.
+
+    # Sort the batch by date and time created, so the grid mostly inserts in order
+    thumbs.sort(reverse=True, key=lambda tup: tup[5])
+
+    # Send the batch
+    with Tracer.span("send_thumbnails", files=len(thumbs)):
+
+      self.emit("send_thumbnails", thumbs)
+
+  def release(pixels, encoded):
+    # The default load, for when nobody is going to look at the thumbnails
+    # pixels is the (shared_memory_name, height, width) of a freshly generated thumbnail's base
+    # level, or None if it came from the cache, and encoded every level compressed. The shared
+    # memory has to be freed either way, the encoded levels are what's left.
+
+    if pixels is not None:
+
+      shared = shared_memory.SharedMemory(name=pixels[0])
+      shared.close()
+      shared.unlink()
+
+    return encoded
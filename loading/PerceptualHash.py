@@ -0,0 +1,134 @@
+import cv2
+import numpy as np
+
+# How many bits apart two hashes can be to still count as the same picture
+MAX_DISTANCE = 5
+
+# The number of bits set in every possible 16 bit value, for counting bits without NumPy 2
+POPCOUNT = np.array([bin(i).count("1") for i in range(1 << 16)], np.uint8)
+
+class PerceptualHash:
+
+  # dHash based near-duplicate detection.
+  # A dHash is 64 bits, one for every pair of horizontally neighbouring pixels in a 9x8 grayscale
+  # shrink of the image, set when the left one is brighter. Resizing, recompressing or slightly
+  # changing the colors of a picture barely changes it, so near-duplicates are hashes that are only
+  # a few bits apart. It's computed from the thumbnail, which is already decoded and small.
+
+  def dhash(img_data):
+    # Returns the dHash of a BGR ndarray as an int
+
+    gray = cv2.cvtColor(img_data, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+
+    bits = small[:, 1:] < small[:, :-1]
+
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+  def to_signed(dhash):
+    # SQLite only stores signed 64 bit integers
+
+    return dhash - (1 << 64) if dhash >= 1 << 63 else dhash
+
+  def from_signed(dhash):
+
+    return dhash & ((1 << 64) - 1)
+
+  def distances(a, b):
+    # Returns the number of differing bits between two arrays of hashes (as uint64), pairwise
+
+    if hasattr(np, "bitwise_count"):
+
+      return np.bitwise_count(a ^ b)
+
+    return POPCOUNT[(a ^ b).view(np.uint16)].reshape(-1, 4).sum(axis=1, dtype=np.uint8)
+
+  def cluster(hashes, max_distance=MAX_DISTANCE):
+    # Groups hashes that are at most max_distance bits apart, directly or through other hashes
+    # Returns a list of groups, each being a list of indices into hashes. Hashes without any near
+    # duplicate aren't in any group.
+    # Comparing every pair would be quadratic, so this uses the pigeonhole principle instead: split
+    # the 64 bits into max_distance + 1 slices, and two hashes that differ in at most max_distance
+    # bits must have at least one slice exactly in common. Only hashes that share a slice get
+    # compared, which sorting each slice finds for all of them at once.
+    # This takes about a second for 100k hashes, so it shouldn't run on the main thread.
+
+    if len(hashes) < 2:
+
+      return []
+
+    hashes = np.array(hashes, np.uint64)
+
+    # Exact duplicates are trivially in the same group, only compare every distinct hash once
+    unique, inverse = np.unique(hashes, return_inverse=True)
+
+    first, second = PerceptualHash.close_pairs(unique, max_distance)
+
+    # Union-find over the distinct hashes
+    parent = list(range(len(unique)))
+
+    def find(i):
+
+      while parent[i] != i:
+
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+
+      return i
+
+    for i, j in zip(first.tolist(), second.tolist()):
+
+      root_i, root_j = find(i), find(j)
+
+      if root_i != root_j:
+
+        parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    groups = {}
+
+    for index, unique_index in enumerate(inverse.tolist()):
+
+      groups.setdefault(find(unique_index), []).append(index)
+
+    return [group for group in groups.values() if len(group) > 1]
+
+  def close_pairs(unique, max_distance):
+    # Returns a tuple of two arrays, the index pairs of every two distinct hashes that share a
+    # slice and are at most max_distance bits apart
+    # Candidates are checked as soon as they are found, so they never pile up in memory.
+
+    slices = max_distance + 1
+    bounds = [64 * i // slices for i in range(slices + 1)]
+
+    first = [np.empty(0, np.intp)]
+    second = [np.empty(0, np.intp)]
+
+    for low, high in zip(bounds, bounds[1:]):
+
+      values = (unique >> np.uint64(low)) & np.uint64((1 << (high - low)) - 1)
+
+      order = np.argsort(values, kind="stable")
+      ordered = values[order]
+
+      # Pair every hash with the ones after it in the same run of equal slices
+      offset = 1
+
+      while offset < len(order):
+
+        same = ordered[offset:] == ordered[:-offset]
+
+        if not same.any():
+
+          break
+
+        i = order[:-offset][same]
+        j = order[offset:][same]
+
+        close = PerceptualHash.distances(unique[i], unique[j]) <= max_distance
+
+        first.append(i[close])
+        second.append(j[close])
+
+        offset += 1
+
+    return (np.concatenate(first), np.concatenate(second))
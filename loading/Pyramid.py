@@ -0,0 +1,24 @@
+import math
+
+# The levels of the thumbnail pyramid, as multiples of the thumb_height it's made for
+PYRAMID = (0.5, 1, 2)
+
+# The level of thumb_height itself, which is what the grid shows until it gets zoomed
+BASE = PYRAMID.index(1)
+
+class Pyramid:
+
+  # Every thumbnail is made at a few heights at once, from the same decoded image, so the grid can
+  # be zoomed without going back to the files: whatever height it's zoomed to gets scaled from the
+  # nearest level, which never has to stretch a thumbnail by more than about 1.4 times.
+
+  def heights(thumb_height):
+    # Returns the height of every level for thumbnails of thumb_height, smallest first
+
+    return tuple(max(1, round(thumb_height * scale)) for scale in PYRAMID)
+
+  def nearest(heights, height):
+    # Returns the index of the level closest to height
+    # Closeness is by ratio rather than difference, 140 is about as close to 100 as to 200.
+
+    return min(range(len(heights)), key=lambda level: abs(math.log(heights[level] / height)))
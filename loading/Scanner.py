@@ -0,0 +1,75 @@
+import os
+
+from collections import namedtuple
+
+from assets.FileExts import FileExts
+
+# One file found by the scanner, mtime is in nanoseconds
+# kind is "image", "video" or "misc", see FileExts.classify
+ManifestEntry = namedtuple("ManifestEntry", ["path", "name", "ext", "kind", "size", "mtime"])
+
+class Scanner:
+
+  def scan(folder_path, folders=None):
+    # Walks the folder and all of its subfolders exactly once
+    # Returns a list of ManifestEntry for every file with an extension we know how to handle.
+    # Everything after this works off of that list instead of touching the folder again. The
+    # stat comes from the DirEntry, which on Windows is already there from listing the folder.
+    # If folders is a list, the path of every folder that got listed is appended to it.
+
+    manifest = []
+
+    # Folders that still have to be listed, this is faster than recursing
+    pending = [folder_path]
+
+    while pending:
+
+      current = pending.pop()
+
+      try:
+
+        entries = os.scandir(current)
+
+      except OSError as e:
+
+        print(f"Could not open folder with error {e}, skipping...")
+        continue
+
+      if folders is not None:
+
+        folders.append(current)
+
+      with entries:
+
+        for entry in entries:
+
+          try:
+
+            # Don't follow symlinks into folders, we could end up going in circles
+            if entry.is_dir(follow_symlinks=False):
+
+              pending.append(entry.path)
+              continue
+
+            if not entry.is_file():
+
+              continue
+
+            # Make sure these are lowercased, some extensions are all caps
+            ext = entry.name.split('.')[-1].lower()
+            kind = FileExts.classify(ext)
+
+            if kind is None:
+
+              continue
+
+            stat = entry.stat()
+
+          except OSError as e:
+
+            print(f"Could not read {entry.path} with error {e}, skipping...")
+            continue
+
+          manifest.append(ManifestEntry(entry.path, entry.name, ext, kind, stat.st_size, stat.st_mtime_ns))
+
+    return manifest
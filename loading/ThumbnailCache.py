@@ -0,0 +1,233 @@
+import os
+import time
+import sqlite3
+
+from loading.PerceptualHash import PerceptualHash
+
+# Where the cache lives, it's shared between every folder that gets imported
+CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "szurubooru_uploader", "thumbnails.db")
+
+# How big the thumbnails in the cache are allowed to get in total before old ones get evicted
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# SQLite only allows so many variables in one query, so lookups are done in chunks of this size
+CHUNK_SIZE = 500
+
+class ThumbnailCache:
+
+  # A persistent cache of generated thumbnails and their creation date and time.
+  # An entry is only valid for the exact same path, size, mtime and thumb_height, anything else
+  # counts as stale and gets replaced the next time that file is generated.
+  # Every level of a thumbnail's pyramid (see Pyramid) is an entry of its own, a file only counts
+  # as cached when all of its levels are.
+  # The connection belongs to whichever thread opened it, so open it inside the thread using it.
+
+  def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES):
+
+    self.path = path
+    self.max_bytes = max_bytes
+
+    self.db = None
+
+  def open(self):
+    # Opens (and creates, if needed) the cache database
+
+    if self.db is not None:
+
+      return
+
+    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    self.db = sqlite3.connect(self.path)
+
+    # WAL lets us write batches without syncing the whole file every time
+    self.db.execute("PRAGMA journal_mode=WAL")
+    self.db.execute("PRAGMA synchronous=NORMAL")
+
+    self.db.execute("""
+      CREATE TABLE IF NOT EXISTS thumbnails (
+        path          TEXT    NOT NULL,
+        thumb_height  INTEGER NOT NULL,
+        size          INTEGER NOT NULL,
+        mtime         INTEGER NOT NULL,
+        thumb         BLOB    NOT NULL,
+        bytes         INTEGER NOT NULL,
+        creation_date TEXT    NOT NULL,
+        creation_time TEXT    NOT NULL,
+        last_used     REAL    NOT NULL,
+        dhash         INTEGER,
+        PRIMARY KEY (path, thumb_height))""")
+
+    # Caches from before dHashes were a thing don't have the column, their entries count as stale
+    columns = [row[1] for row in self.db.execute("PRAGMA table_info(thumbnails)")]
+
+    if "dhash" not in columns:
+
+      self.db.execute("ALTER TABLE thumbnails ADD COLUMN dhash INTEGER")
+
+    self.db.execute("CREATE INDEX IF NOT EXISTS thumbnails_last_used ON thumbnails (last_used)")
+    self.db.commit()
+
+  def close(self):
+    # Closes the database, evicting first so it never stays over the size cap
+
+    if self.db is not None:
+
+      self.evict()
+      self.db.close()
+      self.db = None
+
+  def get_many(self, files, heights):
+    # Looks up a list of (path, size, mtime) tuples, heights being those of the pyramid's levels
+    # Returns a dict of path -> (img_byte_arrays, path, creation_date, creation_time, dhash) for
+    # every file that has a valid entry for every level, img_byte_arrays being a tuple with the
+    # thumbnail of each level. Stale entries are left alone, they get replaced by put_many.
+
+    stats = {path: (size, mtime) for path, size, mtime in files}
+    paths = list(stats)
+
+    # path -> thumb_height -> thumbnail, and the rest of the first valid entry of every path
+    levels = {}
+    rest = {}
+
+    for i in range(0, len(paths), CHUNK_SIZE):
+
+      chunk = paths[i:i + CHUNK_SIZE]
+
+      rows = self.db.execute(
+        f"""SELECT path, thumb_height, size, mtime, thumb, creation_date, creation_time, dhash
+            FROM thumbnails WHERE thumb_height IN ({','.join('?' * len(heights))})
+            AND path IN ({','.join('?' * len(chunk))})""",
+        [*heights, *chunk])
+
+      for path, thumb_height, size, mtime, thumb, creation_date, creation_time, dhash in rows:
+
+        if stats[path] == (size, mtime) and dhash is not None:
+
+          levels.setdefault(path, {})[thumb_height] = thumb
+          rest.setdefault(path, (tuple(creation_date.split('-')), tuple(creation_time.split(':')),
+                                 PerceptualHash.from_signed(dhash)))
+
+    found = {}
+
+    for path, thumbs in levels.items():
+
+      if len(thumbs) == len(heights):
+
+        found[path] = (tuple(thumbs[height] for height in heights), path, *rest[path])
+
+    # Mark everything we found as recently used
+    now = time.time()
+
+    self.db.executemany(
+      "UPDATE thumbnails SET last_used = ? WHERE path = ? AND thumb_height = ?",
+      [(now, path, height) for path in found for height in heights])
+
+    self.db.commit()
+
+    return found
+
+  def put_many(self, entries, heights):
+    # Stores a list of (size, mtime, thumbnail) tuples, thumbnail being a tuple of
+    # (img_byte_arrays, path, creation_date, creation_time, dhash) like get_many returns
+
+    now = time.time()
+
+    self.db.executemany(
+      """INSERT OR REPLACE INTO thumbnails
+         (path, thumb_height, size, mtime, thumb, bytes, creation_date, creation_time, last_used,
+          dhash)
+         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+      [(path, thumb_height, size, mtime, thumb, len(thumb), '-'.join(creation_date),
+        ':'.join(creation_time), now, PerceptualHash.to_signed(dhash))
+       for size, mtime, (thumbs, path, creation_date, creation_time, dhash) in entries
+       for thumb_height, thumb in zip(heights, thumbs)])
+
+    self.db.commit()
+
+  def evict(self):
+    # Deletes the least recently used entries until the cache fits under max_bytes again
+
+    total = self.db.execute("SELECT COALESCE(SUM(bytes), 0) FROM thumbnails").fetchone()[0]
+
+    if total <= self.max_bytes:
+
+      return
+
+    victims = []
+
+    for path, thumb_height, size in self.db.execute(
+      "SELECT path, thumb_height, bytes FROM thumbnails ORDER BY last_used"):
+
+      if total <= self.max_bytes:
+
+        break
+
+      victims.append((path, thumb_height))
+      total -= size
+
+    self.db.executemany("DELETE FROM thumbnails WHERE path = ? AND thumb_height = ?", victims)
+    self.db.commit()
+
+    print(f"Evicted {len(victims)} thumbnails from the cache.")
+
+  def prune_folder(self, folder_path, files):
+    # Deletes the entries of every file in a folder (subfolders included) that was removed or
+    # changed since it was cached, files being the (path, size, mtime) of everything in it now
+    # Unlike prune this doesn't stat anything, the scan of the folder already did.
+    # Returns how many files were pruned.
+
+    stats = {path: (size, mtime) for path, size, mtime in files}
+
+    # Every path in the folder sorts between these two
+    start = os.path.join(folder_path, "")
+    end = start[:-1] + chr(ord(start[-1]) + 1)
+
+    # A path can show up more than once, every level of it is an entry
+    stale = set()
+
+    for path, size, mtime in self.db.execute(
+      "SELECT DISTINCT path, size, mtime FROM thumbnails WHERE path >= ? AND path < ?",
+      (start, end)):
+
+      if stats.get(path) != (size, mtime):
+
+        stale.add(path)
+
+    self.db.executemany("DELETE FROM thumbnails WHERE path = ?", [(path,) for path in stale])
+    self.db.commit()
+
+    return len(stale)
+
+  def prune(self):
+    # Deletes every entry whose file was removed or changed since it was cached
+    # This stats every file in the cache, whatever folder it's in. Returns how many were pruned.
+
+    stale = []
+
+    for path, size, mtime in self.db.execute("SELECT DISTINCT path, size, mtime FROM thumbnails"):
+
+      try:
+
+        stat = os.stat(path)
+
+      except OSError:
+
+        stale.append((path,))
+
+      else:
+
+        if (stat.st_size, stat.st_mtime_ns) != (size, mtime):
+
+          stale.append((path,))
+
+    self.db.executemany("DELETE FROM thumbnails WHERE path = ?", stale)
+    self.db.commit()
+
+    return len(stale)
+
+  def clear(self):
+    # Throws away the whole cache
+
+    self.db.execute("DELETE FROM thumbnails")
+    self.db.commit()
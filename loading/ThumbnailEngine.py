@@ -0,0 +1,83 @@
+import os
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from loading.Thumbnailer import Thumbnailer
+from loading.VideoReader import VIDEO_OFFSET
+
+from profiling.Tracer import Tracer
+
+class ThumbnailEngine:
+
+  # Spreads the thumbnail generation of a list of files over a pool of worker processes.
+  # We use processes rather than threads because most of the work is decoding and resizing,
+  # which would otherwise fight over the GIL.
+
+  def __init__(self, thumb_height, workers=None, video_offset=VIDEO_OFFSET):
+
+    self.thumb_height = thumb_height
+
+    # How many seconds into a video its thumbnail is taken
+    self.video_offset = video_offset
+
+    # Use every core by default
+    self.workers = workers or os.cpu_count() or 1
+
+    self.pool = None
+
+  def start(self):
+    # Starts the worker processes
+    # We use "spawn" because forking a process that has Qt threads running is asking for trouble
+
+    if self.pool is None:
+
+      self.pool = ProcessPoolExecutor(
+        max_workers=self.workers,
+        mp_context=multiprocessing.get_context("spawn"))
+
+  def shutdown(self):
+    # Stops the worker processes, and cancels anything that hasn't started yet
+
+    if self.pool is not None:
+
+      self.pool.shutdown(wait=True, cancel_futures=True)
+      self.pool = None
+
+  def generate(self, entries):
+    # Generates thumbnails for every ManifestEntry in the given list
+    # This is a generator, it yields (entry, result, error) as soon as each file finishes, so the
+    # order is *not* the order of the list. result is what Thumbnailer.generate_shared returns, so
+    # whoever reads the pixels out of the shared memory has to unlink it (see Importer).
+    # While tracing, the workers hand back their spans along with each result.
+
+    self.start()
+
+    traced = Tracer.enabled
+
+    if traced:
+
+      futures = {self.pool.submit(Tracer.traced, Thumbnailer.generate_shared, entry,
+                                  self.thumb_height, self.video_offset): entry for entry in entries}
+
+    else:
+
+      futures = {self.pool.submit(Thumbnailer.generate_shared, entry, self.thumb_height,
+                                  self.video_offset): entry for entry in entries}
+
+    for future in as_completed(futures):
+
+      try:
+
+        result = future.result()
+
+        if traced:
+
+          result, events = result
+          Tracer.merge(events)
+
+        yield (futures[future], result, None)
+
+      except Exception as e:
+
+        yield (futures[future], None, e)
@@ -0,0 +1,334 @@
+import os
+import re
+import cv2
+import numpy as np
+
+from multiprocessing import shared_memory
+
+from PIL import Image
+
+from loading.ExifReader import ExifReader
+from loading.PerceptualHash import PerceptualHash
+from loading.Pyramid import Pyramid, BASE
+from loading.VideoReader import VideoReader, VIDEO_OFFSET
+
+from profiling.Tracer import Tracer
+
+# How thumbnails get compressed for the on-disk cache
+CACHE_ENCODING = ".jpg"
+CACHE_ENCODING_PARAMS = [cv2.IMWRITE_JPEG_QUALITY, 90]
+
+class Thumbnailer:
+
+  # Everything in here runs inside of the worker processes of ThumbnailEngine, so nothing in this
+  # class is allowed to touch Qt. Each function only depends on its arguments so that it can be
+  # pickled and sent over to another process.
+
+  def generate(entry, thumb_height, video_offset=VIDEO_OFFSET):
+    # Generates the thumbnail pyramid and metadata of a single file, entry being a ManifestEntry
+    # The file is only decoded once, for the top level, the others are scaled down from it.
+    # Videos get theirs from video_offset seconds in.
+    # Returns a tuple of (levels, path, creation_date, creation_time), levels being the resized BGR
+    # ndarray of every level of the pyramid (see Pyramid), or None if the file has to be skipped
+
+    print(f"Processing \"{entry.name}\"")
+
+    # Only the top level gets made from the file
+    heights = Pyramid.heights(thumb_height)
+    top = heights[-1]
+
+    with Tracer.span("thumbnail", path=entry.path, kind=entry.kind, bytes=entry.size):
+
+      if entry.kind == "image": # For image files...
+
+        thumb = Thumbnailer.image_thumbnail(entry.path, top)
+
+      elif entry.ext == "gif": # GIFs are videos too, but the first frame is good enough...
+
+        thumb = Thumbnailer.gif_thumbnail(entry.path, top)
+
+      elif entry.kind == "video": # For video files...
+
+        thumb = Thumbnailer.video_thumbnail(entry.path, top, video_offset)
+
+      else:
+
+        thumb = None
+
+    if thumb is None:
+
+      return None
+
+    img_data, creation_date, creation_time = thumb
+
+    levels = Thumbnailer.pyramid(img_data, heights)
+
+    # Split dates/times by any non-number character into tuple for consistency
+    creation_date = tuple(re.split("[^0-9]", creation_date))
+    creation_time = tuple(re.split("[^0-9]", creation_time))
+
+    return (levels, entry.path, creation_date, creation_time)
+
+  def generate_shared(entry, thumb_height, video_offset=VIDEO_OFFSET):
+    # Same as generate, but for handing the thumbnail back to the main process
+    # The pixels of the base level are written into a block of shared memory instead of being
+    # pickled through a pipe, and every level is encoded, for the on-disk cache and for the grid to
+    # zoom with. Returns a tuple of (pixels, encoded, path, creation_date, creation_time, dhash),
+    # pixels being a (shared_memory_name, height, width) tuple for ImportFiles to read the BGR
+    # pixels from, and encoded a tuple of every compressed level, smallest first.
+
+    thumb = Thumbnailer.generate(entry, thumb_height, video_offset)
+
+    if thumb is None:
+
+      return None
+
+    levels, path, creation_date, creation_time = thumb
+
+    # Qt wants the rows tightly packed
+    img_data = np.ascontiguousarray(levels[BASE])
+    height, width = img_data.shape[:2]
+
+    with Tracer.span("encode") as span:
+
+      encoded = tuple(bytes(cv2.imencode(CACHE_ENCODING, level, CACHE_ENCODING_PARAMS)[1])
+                      for level in levels)
+      span.set(bytes=sum(map(len, encoded)))
+
+    with Tracer.span("dhash"):
+
+      dhash = PerceptualHash.dhash(img_data)
+
+    # The main process unlinks it once it has copied the pixels out
+    with Tracer.span("shared_memory", bytes=img_data.nbytes):
+
+      shared = shared_memory.SharedMemory(create=True, size=img_data.nbytes)
+      np.ndarray(img_data.shape, np.uint8, buffer=shared.buf)[:] = img_data
+      shared.close()
+
+    return ((shared.name, height, width), encoded, path, creation_date, creation_time, dhash)
+
+  def image_thumbnail(path, thumb_height):
+    # Returns a tuple of (img_data, creation_date, creation_time) for an image file
+    # JPEGs never get decoded at full size: we either use the thumbnail embedded in the EXIF, or
+    # let libjpeg scale the image down while decoding it (PIL's draft mode), which only has to do
+    # a fraction of the work.
+
+    name = os.path.basename(path)
+
+    # Get the creation date, orientation and embedded thumbnail without decoding anything
+    with Tracer.span("exif"):
+
+      metadata = ExifReader.read(path)
+
+    try:
+
+      # Try the embedded thumbnail first, and only decode the image if it's too small
+      im = Thumbnailer.exif_thumbnail(metadata, thumb_height)
+
+      if im is None:
+
+        # Open image with PIL, this only reads the header until we ask for the pixels
+        with Tracer.span("decode") as span, Image.open(path) as pil_image:
+
+          if pil_image.format == "JPEG":
+
+            im = Thumbnailer.draft_decode(pil_image, thumb_height, metadata.orientation)
+
+          else:
+
+            # Nothing to gain for other formats, cv2 also takes care of the orientation by itself
+            im = cv2.imread(path)
+            metadata = metadata._replace(orientation=1)
+
+          if im is not None:
+
+            span.set(pixels=im.shape[0] * im.shape[1])
+
+      if im is not None and metadata.orientation != 1:
+
+        with Tracer.span("orient"):
+
+          im = Thumbnailer.orient(im, metadata.orientation)
+
+    except (OSError, ValueError, cv2.error) as e: # TODO: Add separate function to show why loading failed in grid
+
+      print(f"Error while loading {name} with error {e}")
+      return None
+
+    if im is None:
+
+      print(f"Error while loading {name}, cv2 could not decode it")
+      return None
+
+    # Resize image
+    im = Thumbnailer.proper_resize(im, thumb_height)
+
+    if metadata.datetime is not None:
+
+      # Get the creation date and time
+      creation_date, creation_time = metadata.datetime.split(' ')
+
+    else:
+
+      print(f"Could not find creation_date or creation_time in {name}")
+
+      # Setting date and time to zeroes makes the image last in the list
+      creation_date = "0000-00-00"
+      creation_time = "00:00:00"
+
+    return (im, creation_date, creation_time)
+
+  def exif_thumbnail(metadata, thumb_height):
+    # Returns the thumbnail embedded in a JPEG's EXIF as a BGR ndarray, if it's usable
+    # It has to be at least thumb_height tall (once rotated) and have the same aspect ratio as the
+    # actual image, since some cameras letterbox it. Returns None otherwise.
+
+    if metadata.thumbnail is None or not metadata.width or not metadata.height:
+
+      return None
+
+    with Tracer.span("exif_thumbnail", bytes=len(metadata.thumbnail)):
+
+      im = cv2.imdecode(np.frombuffer(metadata.thumbnail, np.uint8), cv2.IMREAD_COLOR)
+
+    if im is None:
+
+      return None
+
+    height, width = im.shape[:2]
+
+    # Rotated by 90 or 270 degrees, so the thumbnail's height will be its current width
+    if metadata.orientation in (5, 6, 7, 8):
+
+      if width < thumb_height:
+
+        return None
+
+    elif height < thumb_height:
+
+      return None
+
+    ratio = metadata.width / metadata.height
+
+    if abs(width / height - ratio) > 0.02 * ratio:
+
+      return None
+
+    return im
+
+  def draft_decode(pil_image, thumb_height, orientation):
+    # Decodes a JPEG at the smallest of 1/1, 1/2, 1/4 or 1/8 scale that still covers thumb_height
+    # Returns a BGR ndarray like cv2.imread would
+
+    # Rotated by 90 or 270 degrees, so the stored width is what becomes the height
+    if orientation in (5, 6, 7, 8):
+
+      pil_image.draft("RGB", (thumb_height, 1))
+
+    else:
+
+      pil_image.draft("RGB", (1, thumb_height))
+
+    # cv2 works in BGR, so flip the channels
+    return np.asarray(pil_image.convert("RGB"))[:, :, ::-1]
+
+  def orient(img_data, orientation):
+    # Applies an EXIF orientation to an image, since neither PIL's draft mode nor the embedded
+    # thumbnail do it for us
+
+    if orientation in (2, 5, 7):
+
+      img_data = cv2.flip(img_data, 1)
+
+    if orientation in (3, 4):
+
+      img_data = cv2.rotate(img_data, cv2.ROTATE_180)
+
+      if orientation == 4:
+
+        img_data = cv2.flip(img_data, 1)
+
+    elif orientation in (6, 7):
+
+      img_data = cv2.rotate(img_data, cv2.ROTATE_90_CLOCKWISE)
+
+    elif orientation in (5, 8):
+
+      img_data = cv2.rotate(img_data, cv2.ROTATE_90_COUNTERCLOCKWISE)
+
+    return img_data
+
+  def video_thumbnail(path, thumb_height, video_offset=VIDEO_OFFSET):
+    # Returns a tuple of (img_data, creation_date, creation_time) for a video file
+    # The frame comes from video_offset seconds in, see VideoReader
+
+    name = os.path.basename(path)
+
+    video = VideoReader.read(path, thumb_height, video_offset)
+
+    if video is None:
+
+      print(f"Error: Loading {name} failed, it could not be read. Skipping...")
+      return None
+
+    img_data, metadata = video
+
+    if img_data.shape[0] != thumb_height:
+
+      img_data = Thumbnailer.proper_resize(img_data, thumb_height)
+
+    return (img_data, metadata.creation_date, metadata.creation_time)
+
+  def gif_thumbnail(path, thumb_height):
+    # Returns a tuple of (img_data, creation_date, creation_time) for a GIF
+    # Opening a GIF with PIL only decodes its first frame, which is a lot cheaper than running it
+    # through a video decoder. GIFs don't have a creation date.
+
+    name = os.path.basename(path)
+
+    try:
+
+      with Tracer.span("decode") as span, Image.open(path) as pil_image:
+
+        im = cv2.cvtColor(np.asarray(pil_image.convert("RGB")), cv2.COLOR_RGB2BGR)
+        span.set(pixels=im.shape[0] * im.shape[1])
+
+    except (OSError, ValueError) as e:
+
+      print(f"Error while loading {name} with error {e}")
+      return None
+
+    return (Thumbnailer.proper_resize(im, thumb_height), "0000-00-00", "00:00:00")
+
+  def pyramid(img_data, heights):
+    # Returns img_data, which is heights[-1] tall, along with it scaled down to every other height
+    # Each level is scaled from the one above it, which is less work than going from the top every
+    # time and looks the same.
+
+    levels = [img_data]
+
+    for height in reversed(heights[:-1]):
+
+      levels.append(Thumbnailer.proper_resize(levels[-1], height))
+
+    return levels[::-1]
+
+  def proper_resize(img_data, desired_height):
+    # Calculates the proportion of the desired height to the original height, then resizes the
+    # length of the image by the proportion, and the height of the image to the desired height.
+    # We only care about the height because the thumbs need to be a uniform height.
+
+    width = img_data.shape[1]
+    height = img_data.shape[0]
+
+    new_length = int(width * (desired_height / (height)))
+
+    # INTER_AREA is both faster and better looking than the default when shrinking
+    interpolation = cv2.INTER_AREA if desired_height < height else cv2.INTER_LINEAR
+
+    with Tracer.span("resize", pixels=width * height):
+
+      img_data = cv2.resize(img_data, (new_length, desired_height), interpolation=interpolation)
+
+    return img_data
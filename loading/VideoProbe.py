@@ -0,0 +1,108 @@
+import re
+import json
+import subprocess
+
+from collections import namedtuple
+
+# What VideoProbe finds out about a video
+# creation_date is "YYYY-MM-DD" and creation_time is "HH:MM:SS", both are all zeroes when the video
+# has no creation time. duration is in seconds, and anything else that's missing is None.
+VideoMetadata = namedtuple(
+  "VideoMetadata",
+  ["creation_date", "creation_time", "duration", "width", "height", "codec"])
+
+# Only ask ffprobe for what we actually use, this keeps the output (and its work) small
+PROBE_COMMAND = [
+  "ffprobe", "-v", "error", "-print_format", "json",
+  "-show_entries", "format=duration:format_tags=creation_time:"
+                   "stream=codec_type,codec_name,width,height:stream_tags=creation_time"]
+
+# How long a single ffprobe is allowed to take before we give up on the file
+PROBE_TIMEOUT = 30
+
+# Matches the "YYYY-MM-DDTHH:MM:SS" part of a creation_time tag
+CREATION_TIME_PATTERN = re.compile(r"(\d{4}-\d{2}-\d{2})[T ](\d{2}:\d{2}:\d{2})")
+
+class VideoProbe:
+
+  # Gets video metadata from ffprobe's JSON output instead of scraping what ffmpeg prints.
+  # ffprobe only takes one input at a time, videos get probed one by one inside the thumbnail
+  # workers, which already bound how many run at once.
+
+  def probe(path):
+    # Returns the VideoMetadata of a video, or None if ffprobe can't read it (e.g. when the moov
+    # atom is missing)
+
+    try:
+
+      output = subprocess.run(
+        PROBE_COMMAND + [path],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        timeout=PROBE_TIMEOUT,
+        check=True).stdout
+
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+
+      return None
+
+    except FileNotFoundError:
+
+      # Of course, if ffprobe isn't even there, we can't move on. We raise instead of exiting
+      # because this runs inside a worker process, ImportFiles reports it for us.
+      raise RuntimeError("ffprobe not found, that most likely means you don't have ffmpeg installed.")
+
+    try:
+
+      info = json.loads(output)
+
+    except ValueError:
+
+      return None
+
+    return VideoProbe.parse(info)
+
+  def creation(text):
+    # Returns the (creation_date, creation_time) of a creation_time tag, all zeroes if there's none
+
+    match = CREATION_TIME_PATTERN.search(text)
+
+    if match is not None and not match.group(1).startswith("0000"):
+
+      return match.groups()
+
+    return ("0000-00-00", "00:00:00")
+
+  def parse(info):
+    # Turns ffprobe's JSON output into VideoMetadata, returns None if there's no video stream
+
+    video = next((stream for stream in info.get("streams", [])
+                  if stream.get("codec_type") == "video"), None)
+
+    if video is None:
+
+      return None
+
+    container = info.get("format", {})
+
+    # The container's creation time is the most reliable, some files only have it on the stream
+    creation = container.get("tags", {}).get("creation_time") or \
+               video.get("tags", {}).get("creation_time") or ""
+
+    creation_date, creation_time = VideoProbe.creation(creation)
+
+    try:
+
+      duration = float(container["duration"])
+
+    except (KeyError, ValueError):
+
+      duration = None
+
+    return VideoMetadata(
+      creation_date,
+      creation_time,
+      duration,
+      video.get("width"),
+      video.get("height"),
+      video.get("codec_name"))
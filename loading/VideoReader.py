@@ -0,0 +1,316 @@
+import os
+import time
+import shutil
+import struct
+
+import cv2
+
+try:
+
+  import av
+
+except ImportError:
+
+  # PyAV is a dependency (see the README), but without it videos still get imported, just slower
+  # and with an extra read for their creation time (see VideoReader.read_cv2)
+  av = None
+
+from loading.VideoProbe import VideoProbe, VideoMetadata
+
+from profiling.Tracer import Tracer
+
+# Where the thumbnail of a video comes from by default, in seconds from the start
+# The very first frame is often black, a fade in or a title card.
+VIDEO_OFFSET = 1.0
+
+# Whether the cv2 fallback can get the creation time from ffprobe
+HAS_FFPROBE = shutil.which("ffprobe") is not None
+
+# Containers whose creation time the cv2 fallback reads by itself, from the mvhd box
+MP4_EXTS = {"mp4", "m4v", "mov", "3gp"}
+
+# MP4 times count seconds from 1904
+MP4_EPOCH_OFFSET = 2082844800
+
+class VideoReader:
+
+  # Reads the metadata of a video and one frame of it, for its thumbnail.
+  # With PyAV both come from a single open of the container: the metadata is in the header, then we
+  # seek to the keyframe at or before the offset and decode only that, already scaled down by
+  # swscale. Nothing but keyframes gets decoded, so the cost hardly depends on the codec or on how
+  # far in the offset is. This is the only path that opens a video just once.
+  # Without PyAV, one VideoCapture gives the frame, size and duration, but it decodes every frame
+  # from the keyframe up to the offset, and cv2 has no way to get at the container's tags, so the
+  # creation time takes a second look at the file: MP4s get their mvhd box read from the header,
+  # anything else takes an ffprobe (if there is one).
+
+  def read(path, thumb_height, offset=VIDEO_OFFSET):
+    # Returns (img_data, metadata), img_data being a BGR ndarray and metadata a VideoMetadata, or
+    # None if the video can't be read. PyAV's frames are already thumb_height high, cv2's are
+    # full size.
+
+    if av is not None:
+
+      return VideoReader.read_av(path, thumb_height, offset)
+
+    return VideoReader.read_cv2(path, offset)
+
+  def target(offset, duration):
+    # Returns the second to take the thumbnail from, short videos get theirs from the middle
+
+    if duration is None:
+
+      return offset
+
+    return min(offset, duration / 2)
+
+  def read_av(path, thumb_height, offset):
+
+    try:
+
+      container = av.open(path)
+
+    except (av.error.FFmpegError, OSError):
+
+      return None
+
+    with container:
+
+      if not container.streams.video:
+
+        return None
+
+      stream = container.streams.video[0]
+
+      # Everything after this point only needs keyframes
+      stream.codec_context.skip_frame = "NONKEY"
+
+      duration = container.duration / av.time_base if container.duration else None
+
+      # The container's creation time is the most reliable, some files only have it on the stream
+      creation = container.metadata.get("creation_time") or \
+                 stream.metadata.get("creation_time") or ""
+
+      creation_date, creation_time = VideoProbe.creation(creation)
+
+      metadata = VideoMetadata(creation_date, creation_time, duration, stream.width, stream.height,
+                               stream.codec_context.name)
+
+      try:
+
+        with Tracer.span("video_decode") as span:
+
+          frame = VideoReader.keyframe(container, stream, VideoReader.target(offset, duration))
+
+          if frame is not None:
+
+            span.set(pixels=frame.width * frame.height)
+
+      except av.error.FFmpegError as e:
+
+        print(f"Error while decoding {path} with error {e}")
+        return None
+
+    if frame is None:
+
+      return None
+
+    return (VideoReader.scale(frame, thumb_height), metadata)
+
+  def keyframe(container, stream, second):
+    # Returns the keyframe at or before second, or the first one if seeking doesn't work out
+
+    if second > 0 and stream.time_base:
+
+      try:
+
+        container.seek(int(second / stream.time_base), stream=stream, backward=True)
+
+        frame = next(container.decode(stream), None)
+
+        if frame is not None:
+
+          return frame
+
+      except av.error.FFmpegError:
+
+        # Some files can't seek at all
+        pass
+
+      container.seek(0, stream=stream)
+
+    return next(container.decode(stream), None)
+
+  def scale(frame, thumb_height):
+    # Returns a PyAV frame as a BGR ndarray thumb_height high, turned the way it's meant to be shown
+    # PyAV doesn't apply the display matrix like cv2 does, phones store portrait videos sideways.
+
+    rotation = round(getattr(frame, "rotation", 0) or 0) % 360
+
+    # A quarter turn swaps the sides, so the width is what ends up being the height
+    sideways = rotation in (90, 270)
+    across, along = (frame.height, frame.width) if sideways else (frame.width, frame.height)
+
+    width = max(1, round(across * thumb_height / along))
+
+    if sideways:
+
+      img_data = frame.to_ndarray(width=thumb_height, height=width, format="bgr24")
+
+    else:
+
+      img_data = frame.to_ndarray(width=width, height=thumb_height, format="bgr24")
+
+    # rotation is counterclockwise
+    if rotation == 90:
+
+      img_data = cv2.rotate(img_data, cv2.ROTATE_90_COUNTERCLOCKWISE)
+
+    elif rotation == 270:
+
+      img_data = cv2.rotate(img_data, cv2.ROTATE_90_CLOCKWISE)
+
+    elif rotation == 180:
+
+      img_data = cv2.rotate(img_data, cv2.ROTATE_180)
+
+    return img_data
+
+  def read_cv2(path, offset):
+
+    capture = cv2.VideoCapture(path)
+
+    try:
+
+      # cv2 can't open what ffprobe can't read either, e.g. when the moov atom is missing
+      if not capture.isOpened():
+
+        return None
+
+      fps = capture.get(cv2.CAP_PROP_FPS)
+      frame_count = capture.get(cv2.CAP_PROP_FRAME_COUNT)
+
+      duration = frame_count / fps if fps > 0 and frame_count > 0 else None
+
+      with Tracer.span("video_decode") as span:
+
+        frame = None
+        second = VideoReader.target(offset, duration)
+
+        # cv2 seeks to the keyframe before the offset and decodes its way up to it
+        if second > 0 and capture.set(cv2.CAP_PROP_POS_MSEC, second * 1000):
+
+          frame = capture.read()[1]
+
+        if frame is None:
+
+          capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+          frame = capture.read()[1]
+
+        if frame is None:
+
+          return None
+
+        span.set(pixels=frame.shape[0] * frame.shape[1])
+
+      fourcc = int(capture.get(cv2.CAP_PROP_FOURCC))
+      codec = fourcc.to_bytes(4, "little").decode("ascii", "replace").strip("\0 ") or None
+
+    except cv2.error as e:
+
+      print(f"Error while decoding {path} with error {e}")
+      return None
+
+    finally:
+
+      capture.release()
+
+    creation_date, creation_time = ("0000-00-00", "00:00:00")
+
+    if os.path.splitext(path)[1][1:].lower() in MP4_EXTS:
+
+      creation_date, creation_time = VideoProbe.creation(VideoReader.mp4_creation(path))
+
+    elif HAS_FFPROBE:
+
+      with Tracer.span("video_probe"):
+
+        probed = VideoProbe.probe(path)
+
+      if probed is not None:
+
+        creation_date, creation_time = probed.creation_date, probed.creation_time
+
+    metadata = VideoMetadata(creation_date, creation_time, duration, frame.shape[1],
+                             frame.shape[0], codec)
+
+    return (frame, metadata)
+
+  def mp4_creation(path):
+    # Returns the creation time in the mvhd box of an MP4 or QuickTime file as a
+    # "YYYY-MM-DD HH:MM:SS" string, or "" if there isn't one
+    # Only the box headers on the way to it get read, the media data is skipped over.
+
+    try:
+
+      with open(path, "rb") as f:
+
+        end = os.fstat(f.fileno()).st_size
+
+        moov = VideoReader.find_box(f, b"moov", end)
+
+        if moov is None or VideoReader.find_box(f, b"mvhd", moov) is None:
+
+          return ""
+
+        version = f.read(4)[0]
+
+        if version == 1:
+
+          seconds = struct.unpack(">Q", f.read(8))[0]
+
+        else:
+
+          seconds = struct.unpack(">I", f.read(4))[0]
+
+    except (OSError, IndexError, struct.error):
+
+      return ""
+
+    # Zero means it was never set
+    if seconds <= MP4_EPOCH_OFFSET:
+
+      return ""
+
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(seconds - MP4_EPOCH_OFFSET))
+
+  def find_box(f, kind, end):
+    # Looks for a box of the given kind from where f is up to end, skipping over the others
+    # Returns the offset the box ends at, with f right after its header, or None if it isn't there
+
+    while f.tell() + 8 <= end:
+
+      start = f.tell()
+      size, box = struct.unpack(">I4s", f.read(8))
+
+      if size == 1:
+
+        # The size didn't fit, it comes right after
+        size = struct.unpack(">Q", f.read(8))[0]
+
+      elif size == 0:
+
+        # The box goes on until the end
+        size = end - start
+
+      if size < 8:
+
+        return None
+
+      if box == kind:
+
+        return start + size
+
+      f.seek(start + size)
+
+    return None
@@ -0,0 +1,94 @@
+import os
+import time
+import threading
+
+from profiling.Tracer import Tracer
+
+# Set this environment variable to anything to have the startup profile printed
+STARTUP_ENV = "SZURUBOORU_STARTUP_PROFILE"
+
+class Step:
+
+  # Times whatever happens inside its with block, see Startup.step
+
+  __slots__ = ("name", "start")
+
+  def __init__(self, name):
+
+    self.name = name
+
+  def __enter__(self):
+
+    self.start = time.perf_counter_ns()
+
+    return self
+
+  def __exit__(self, *exc_info):
+
+    Startup.add(self.name, self.start, time.perf_counter_ns() - self.start)
+
+    return False
+
+class Startup:
+
+  # Records how long each step of starting the app takes, imports included, from the moment this
+  # module is imported (the first thing __init__.py does) until the window is first painted, and
+  # whatever gets loaded in the background after that.
+  # There are only a handful of steps, so they are always recorded, but the report is only printed
+  # when STARTUP_ENV is set. While tracing, the steps end up in the trace too.
+
+  start = time.perf_counter_ns()
+
+  enabled = bool(os.environ.get(STARTUP_ENV))
+
+  # Every step so far as (name, start_ns, duration_ns, background)
+  steps = []
+
+  # When the window was first painted, None until then
+  window = None
+
+  def step(name):
+    # Returns a context manager timing its with block as a step called name
+
+    return Step(name)
+
+  def add(name, start, duration):
+
+    background = threading.current_thread() is not threading.main_thread()
+
+    Startup.steps.append((name, start, duration, background))
+
+    if Tracer.enabled:
+
+      Tracer.add(f"startup: {name}", start, duration, {})
+
+  def shown():
+    # Marks the window as painted, returns how many milliseconds that took
+
+    Startup.window = time.perf_counter_ns()
+
+    return (Startup.window - Startup.start) / 1e6
+
+  def report(background=False):
+    # Returns a table of the steps (only the background ones with background), with when each one
+    # started and how long it took, in milliseconds since the start
+
+    rows = [(name, (start - Startup.start) / 1e6, duration / 1e6)
+            for name, start, duration, in_background in Startup.steps
+            if in_background == background]
+
+    width = max([len(name) for name, _, _ in rows] + [len("step")])
+
+    lines = [f"{'step':<{width}}  {'at':>8}  {'took':>8}"]
+    lines += [f"{name:<{width}}  {at:8.1f}  {took:8.1f}" for name, at, took in rows]
+
+    if not background and Startup.window is not None:
+
+      # Whatever isn't in a step, e.g. Qt laying out and painting the window
+      accounted = sum(took for _, _, took in rows)
+      total = (Startup.window - Startup.start) / 1e6
+
+      lines.append(f"{'(other)':<{width}}  {'':>8}  {total - accounted:8.1f}")
+      lines.append(f"{'time to window':<{width}}  {'':>8}  {total:8.1f}")
+
+    return "\n".join(lines)
@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import threading
+
+# Set this environment variable to a path to trace, the trace gets written there
+TRACE_ENV = "SZURUBOORU_TRACE"
+
+# The percentiles in the summary
+PERCENTILES = (0.5, 0.95)
+
+class Span:
+
+  # Times whatever happens inside its with block, see Tracer.span
+
+  __slots__ = ("name", "args", "start")
+
+  def __init__(self, name, args):
+
+    self.name = name
+    self.args = args
+
+  def __enter__(self):
+
+    self.start = time.perf_counter_ns()
+
+    return self
+
+  def __exit__(self, *exc_info):
+
+    Tracer.add(self.name, self.start, time.perf_counter_ns() - self.start, self.args)
+
+    return False
+
+  def set(self, **args):
+    # Adds counters that are only known once the work is done, like the pixels that got decoded
+
+    self.args.update(args)
+
+class NullSpan:
+
+  # What Tracer.span hands out when tracing is off, so a disabled span costs one call
+
+  __slots__ = ()
+
+  def __enter__(self):
+
+    return self
+
+  def __exit__(self, *exc_info):
+
+    return False
+
+  def set(self, **args):
+
+    pass
+
+NULL_SPAN = NullSpan()
+
+class Tracer:
+
+  # Records how long each stage of the import takes, per file, along with counters like the bytes
+  # read and pixels decoded, and writes them out as a Chrome trace (chrome://tracing or
+  # ui.perfetto.dev) plus a summary table.
+  # Tracing is off unless TRACE_ENV is set (or Tracer.enable is called), in which case every span
+  # is just a shared no-op object. Worker processes inherit the environment, so they trace too;
+  # their spans get handed back with each result (see Tracer.traced) since every process has a
+  # Tracer of its own. perf_counter is the same clock in every process, so it all lines up.
+
+  enabled = bool(os.environ.get(TRACE_ENV))
+  path = os.environ.get(TRACE_ENV)
+
+  # Every span so far as (name, start_ns, duration_ns, pid, tid, args)
+  events = []
+
+  def enable(path):
+    # Turns tracing on, for this process and any it starts from now on
+
+    Tracer.enabled = True
+    Tracer.path = path
+
+    os.environ[TRACE_ENV] = path
+
+  def span(name, **args):
+    # Returns a context manager timing its with block as a span called name
+    # args are the span's counters and details, e.g. the path of the file it's working on
+
+    if not Tracer.enabled:
+
+      return NULL_SPAN
+
+    return Span(name, args)
+
+  def add(name, start, duration, args):
+
+    # Appending is atomic, so this is safe from any thread without a lock
+    Tracer.events.append((name, start, duration, os.getpid(), threading.get_ident(), args))
+
+  def traced(function, *args):
+    # Calls function with args and returns (result, spans), spans being everything recorded in
+    # this process since the last time. Meant to be submitted to a worker process instead of
+    # function itself, the spans of a call that raised go along with the next one.
+
+    result = function(*args)
+
+    events = Tracer.events
+    Tracer.events = []
+
+    return (result, events)
+
+  def merge(events):
+    # Adds spans that were recorded in another process
+
+    Tracer.events += events
+
+  def save(path=None):
+    # Writes the Chrome trace to path (or wherever tracing was enabled with), prints the summary
+    # and returns it
+
+    path = path or Tracer.path
+
+    trace = [{
+      "name": name,
+      "ph": "X",
+      "ts": start / 1000,
+      "dur": duration / 1000,
+      "pid": pid,
+      "tid": tid,
+      "args": args} for name, start, duration, pid, tid, args in Tracer.events]
+
+    with open(path, "w") as f:
+
+      json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+
+    summary = Tracer.summary()
+
+    print(f"Trace of {len(trace)} spans written to {path}")
+    print(summary)
+
+    return summary
+
+  def stats():
+    # Returns a dict of name -> (count, total_ms, p50_ms, p95_ms, max_ms, counters), counters
+    # being the sum of every numeric arg of the spans with that name
+
+    durations = {}
+    counters = {}
+
+    for name, start, duration, pid, tid, args in Tracer.events:
+
+      durations.setdefault(name, []).append(duration / 1e6)
+      totals = counters.setdefault(name, {})
+
+      for key, value in args.items():
+
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+
+          totals[key] = totals.get(key, 0) + value
+
+    stats = {}
+
+    for name, values in durations.items():
+
+      values.sort()
+      percentiles = [values[min(len(values) - 1, int(q * len(values)))] for q in PERCENTILES]
+
+      stats[name] = (len(values), sum(values), *percentiles, values[-1], counters[name])
+
+    return stats
+
+  def summary():
+    # Returns a table of every span name's count, total, p50, p95 and max in milliseconds and its
+    # counters, the slowest in total first
+
+    stats = Tracer.stats()
+
+    lines = [f"{'stage':<24}{'count':>8}{'total':>12}{'p50':>10}{'p95':>10}{'max':>10}  counters"]
+
+    for name, (count, total, p50, p95, maximum, counters) in \
+        sorted(stats.items(), key=lambda item: -item[1][1]):
+
+      counters = ", ".join(f"{key}={value:,}" for key, value in sorted(counters.items()))
+
+      lines.append(f"{name:<24}{count:>8}{total:>12.1f}{p50:>10.2f}{p95:>10.2f}{maximum:>10.2f}"
+                   f"  {counters}")
+
+    return "\n".join(lines)
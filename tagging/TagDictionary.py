@@ -0,0 +1,359 @@
+import os
+import json
+import time
+import zlib
+import bisect
+import numpy as np
+
+from collections import namedtuple
+
+# Where the dictionaries live, there is one per server
+DICTIONARY_DIR = os.path.join(os.path.expanduser("~"), ".cache", "szurubooru_uploader", "tags")
+
+# The fields of a tag we keep, and ask the server for
+TAG_FIELDS = ("names", "category", "usages", "creationTime", "lastEditTime")
+
+# How many tags to ask for at once, szurubooru doesn't send more than 100
+PAGE_SIZE = 100
+
+# Usage counts change without a tag being edited, and deleted tags don't show up in a search, so
+# every once in a while the whole dictionary is fetched again
+FULL_SYNC_INTERVAL = 7 * 24 * 60 * 60
+
+# Prefixes that match more than this many names get their results worked out when the index is
+# built, everything else is few enough to sort on the spot
+SCAN_LIMIT = 256
+
+# How many results are worked out ahead of time for those prefixes
+TOP_RESULTS = 50
+
+# Sorts after any character a name can have, so prefix + LAST_CHARACTER comes after every name
+# starting with prefix
+LAST_CHARACTER = "\uffff"
+
+# A tag that matched a prefix
+# name is the tag's primary name, matched is the name (or alias) that matched the prefix
+Completion = namedtuple("Completion", ["name", "matched", "category", "usages"])
+
+class TagDictionary:
+
+  # A local copy of a szurubooru server's tags, for autocompleting tags without asking the server.
+  # The tags are stored as zlib compressed JSON, and only loaded the first time they are needed.
+  # Every name and alias goes into a sorted list, so the names starting with a prefix are one
+  # bisect away. Prefixes like "a" match tens of thousands of names though, so for every prefix
+  # that matches more than SCAN_LIMIT names, the most used tags are picked out ahead of time.
+  # Syncing only fetches what was created or edited since the last sync.
+
+  def __init__(self, server, directory=DICTIONARY_DIR):
+
+    # The file name only needs to be unique per server
+    name = zlib.crc32(server.encode())
+    self.path = os.path.join(directory, f"{name:08x}.json.z")
+
+    # Each tag is a [names, category, usages, creation_time, last_edit_time] list
+    self.tags = None
+
+    # The newest creation and edit time we have seen, and when we last fetched everything
+    self.created = ""
+    self.edited = ""
+    self.full_sync = 0
+
+    # The prefix index: lowercased names in order, the index of the tag each one belongs to and its
+    # usages, and the precomputed results of the prefixes that match too many names
+    self.keys = []
+    self.owners = []
+    self.usages = np.empty(0, np.int64)
+    self.top = {}
+
+  def loaded(self):
+
+    return self.tags is not None
+
+  def load(self):
+    # Reads the dictionary from disk, if we haven't yet
+
+    if self.loaded():
+
+      return
+
+    try:
+
+      with open(self.path, "rb") as f:
+
+        data = json.loads(zlib.decompress(f.read()))
+
+      self.tags = data["tags"]
+      self.created = data["created"]
+      self.edited = data["edited"]
+      self.full_sync = data["full_sync"]
+
+    except (OSError, ValueError, KeyError, zlib.error):
+
+      self.tags = []
+
+    self.build_index()
+
+  def save(self):
+    # Writes the dictionary to disk, replacing the old file only once the new one is complete
+
+    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    data = {
+      "created": self.created,
+      "edited": self.edited,
+      "full_sync": self.full_sync,
+      "tags": self.tags}
+
+    temp_path = self.path + ".tmp"
+
+    with open(temp_path, "wb") as f:
+
+      f.write(zlib.compress(json.dumps(data, separators=(",", ":")).encode(), 6))
+
+    os.replace(temp_path, self.path)
+
+  def build_index(self):
+    # Builds the sorted list of names, and works out the results of the prefixes that match too
+    # many names to sort on every keystroke
+
+    entries = sorted((name.lower(), owner)
+                     for owner, tag in enumerate(self.tags) for name in tag[0])
+
+    self.keys = [key for key, owner in entries]
+    self.owners = [owner for key, owner in entries]
+    self.usages = np.array([self.tags[owner][2] or 0 for owner in self.owners], np.int64)
+    self.top = {}
+
+    # Ranges of names that share a prefix of the current length, and are still too big
+    ranges = [(0, len(self.keys))]
+    length = 1
+
+    while ranges:
+
+      bigger = []
+
+      for start, end in ranges:
+
+        index = start
+
+        while index < end:
+
+          # Names that are shorter than the prefixes we are at were already covered
+          if len(self.keys[index]) < length:
+
+            index += 1
+            continue
+
+          # Find the end of this prefix's run, the keys are sorted so it's one bisect away
+          prefix = self.keys[index][:length]
+          run_end = bisect.bisect_left(self.keys, prefix + LAST_CHARACTER, index, end)
+
+          if run_end - index > SCAN_LIMIT:
+
+            self.top[prefix] = self.rank(index, run_end, TOP_RESULTS)
+            bigger.append((index, run_end))
+
+          index = run_end
+
+      ranges = bigger
+      length += 1
+
+  def rank(self, start, end, limit):
+    # Returns the (owner, key index) of the most used tags among the names from start to end, each
+    # tag only once
+
+    usages = self.usages[start:end]
+
+    # A tag can match with more than one of its names, so pick some extra in case
+    count = min(len(usages), limit * 2)
+
+    if count < len(usages):
+
+      candidates = np.argpartition(-usages, count - 1)[:count]
+
+    else:
+
+      candidates = np.arange(len(usages))
+
+    candidates = candidates[np.argsort(-usages[candidates], kind="stable")]
+
+    best = {}
+
+    for index in (candidates + start).tolist():
+
+      best.setdefault(self.owners[index], index)
+
+      if len(best) == limit:
+
+        return list(best.items())
+
+    if count < len(usages):
+
+      # So many aliases matched that the extra wasn't enough, rank the whole range
+      return self.rank_all(start, end, limit)
+
+    return list(best.items())
+
+  def rank_all(self, start, end, limit):
+
+    best = {}
+
+    for index in (np.argsort(-self.usages[start:end], kind="stable") + start).tolist():
+
+      best.setdefault(self.owners[index], index)
+
+      if len(best) == limit:
+
+        break
+
+    return list(best.items())
+
+  def complete(self, prefix, limit=10):
+    # Returns the Completions of the most used tags with a name or alias starting with prefix
+
+    self.load()
+
+    prefix = prefix.lower()
+
+    if not prefix:
+
+      return []
+
+    if prefix in self.top and limit <= TOP_RESULTS:
+
+      ranked = self.top[prefix]
+
+    else:
+
+      # Every prefix that matches more than SCAN_LIMIT names is in top, so this range is small
+      # unless more results are asked for than top has
+      start = bisect.bisect_left(self.keys, prefix)
+      end = bisect.bisect_left(self.keys, prefix + LAST_CHARACTER, start)
+
+      ranked = self.rank(start, end, limit)
+
+    completions = []
+
+    for owner, index in ranked[:limit]:
+
+      names, category, usages = self.tags[owner][:3]
+      matched = next(name for name in names if name.lower() == self.keys[index])
+
+      completions.append(Completion(names[0], matched, category, usages))
+
+    return completions
+
+  def find(self, name):
+    # Returns the primary name of the tag that has name as a name or alias, or None if no tag does
+
+    self.load()
+
+    key = name.lower()
+    index = bisect.bisect_left(self.keys, key)
+
+    if index < len(self.keys) and self.keys[index] == key:
+
+      return self.tags[self.owners[index]][0][0]
+
+    return None
+
+  def sync(self, client):
+    # Brings the dictionary up to date with the server
+    # Returns the number of tags that were fetched.
+
+    self.load()
+
+    if not self.tags or time.time() - self.full_sync > FULL_SYNC_INTERVAL:
+
+      fetched = self.fetch_all(client)
+
+    else:
+
+      fetched = self.fetch_changes(client)
+
+    self.build_index()
+    self.save()
+
+    return fetched
+
+  def fetch_all(self, client):
+    # Replaces the whole dictionary with what's on the server
+
+    tags = []
+    offset = 0
+
+    while True:
+
+      page = client.list_tags("", offset, PAGE_SIZE, TAG_FIELDS)
+      results = page.get("results", [])
+
+      tags += [TagDictionary.compact(tag) for tag in results]
+      offset += len(results)
+
+      if not results or offset >= page.get("total", 0):
+
+        break
+
+    self.tags = tags
+    self.created = max((tag[3] or "" for tag in tags), default="")
+    self.edited = max((tag[4] or "" for tag in tags), default="")
+    self.full_sync = time.time()
+
+    return len(tags)
+
+  def fetch_changes(self, client):
+    # Fetches the tags that were created or edited since the last sync, newest first, stopping at
+    # the first one that's older
+
+    changed = []
+
+    for sort, field, since in (("creation-time", 3, self.created),
+                               ("last-edit-time", 4, self.edited)):
+
+      offset = 0
+
+      while True:
+
+        page = client.list_tags(f"sort:{sort}", offset, PAGE_SIZE, TAG_FIELDS)
+        results = [TagDictionary.compact(tag) for tag in page.get("results", [])]
+
+        newer = [tag for tag in results if (tag[field] or "") > since]
+        changed += newer
+
+        offset += len(results)
+
+        if len(newer) < len(results) or not results or offset >= page.get("total", 0):
+
+          break
+
+    return self.merge(changed)
+
+  def merge(self, changed):
+    # Puts changed tags into the dictionary, replacing the tags they used to be
+    # A tag can be renamed, so anything sharing a name with a changed tag is replaced. Tags don't
+    # have an id, so a tag that lost every one of its old names lingers until the next full sync.
+    # Returns the number of tags that changed.
+
+    owners = {name.lower(): owner for owner, tag in enumerate(self.tags) for name in tag[0]}
+    replaced = set()
+
+    for tag in changed:
+
+      replaced.update(owners[name.lower()] for name in tag[0] if name.lower() in owners)
+
+    # The same tag can show up in both searches, keep it once
+    unique = {tag[0][0].lower(): tag for tag in changed}
+
+    self.tags = [tag for owner, tag in enumerate(self.tags) if owner not in replaced]
+    self.tags += unique.values()
+
+    self.created = max([self.created] + [tag[3] or "" for tag in changed])
+    self.edited = max([self.edited] + [tag[4] or "" for tag in changed])
+
+    return len(unique)
+
+  def compact(tag):
+    # Turns a tag's JSON into the list we store
+
+    return [tag.get("names", []), tag.get("category"), tag.get("usages", 0),
+            tag.get("creationTime"), tag.get("lastEditTime")]
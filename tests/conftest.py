@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The modules import each other from the root of the repository, e.g. "from loading.Scanner import
+# Scanner", so that's where the tests import them from too
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,57 @@
+import json
+
+from benchmarks import run
+from benchmarks.run import Benchmarks, Corpus
+
+def test_failed_stage_is_recorded_and_the_rest_still_runs(tmp_path, monkeypatch):
+
+  def broken(corpus, size, workers):
+
+    raise RuntimeError("broken stage")
+
+  monkeypatch.setattr(Corpus, "generate", lambda corpus_dir, size: str(tmp_path))
+  monkeypatch.setattr(Benchmarks, "video_probe", broken)
+  monkeypatch.setattr(Benchmarks, "video_thumbnails", lambda corpus, size, workers: {"seconds": 1})
+
+  output = tmp_path / "results.json"
+  thresholds = tmp_path / "thresholds.json"
+  thresholds.write_text(json.dumps({"video_thumbnails": {"10": 0.5}}))
+
+  code = run.main(["--sizes", "10", "--stages", "video_probe", "video_thumbnails",
+                   "--output", str(output), "--thresholds", str(thresholds)])
+
+  report = json.loads(output.read_text())
+
+  assert code == 1
+  assert report["results"] == [
+    {"stage": "video_probe", "size": 10, "failed": "RuntimeError: broken stage"},
+    {"stage": "video_thumbnails", "size": 10, "seconds": 1}]
+  assert report["failed"] == ["video_probe at 10: RuntimeError: broken stage"]
+  assert report["regressions"] == ["video_thumbnails at 10: 1.000s, the threshold is 0.5s"]
+
+def test_results_are_written_after_every_stage(tmp_path, monkeypatch):
+
+  output = tmp_path / "results.json"
+
+  def interrupted(corpus, size, workers):
+
+    # The first stage has to be on disk by the time the second one runs
+    assert json.loads(output.read_text())["results"][0]["stage"] == "video_thumbnails"
+
+    raise KeyboardInterrupt
+
+  monkeypatch.setattr(Corpus, "generate", lambda corpus_dir, size: str(tmp_path))
+  monkeypatch.setattr(Benchmarks, "video_thumbnails", lambda corpus, size, workers: {"seconds": 1})
+  monkeypatch.setattr(Benchmarks, "video_probe", interrupted)
+
+  try:
+
+    run.main(["--sizes", "10", "--stages", "video_thumbnails", "video_probe",
+              "--output", str(output)])
+
+  except KeyboardInterrupt:
+
+    pass
+
+  assert [result["stage"] for result in json.loads(output.read_text())["results"]] == \
+    ["video_thumbnails"]
@@ -0,0 +1,71 @@
+import io
+import json
+
+import pytest
+
+from cli import Cli, parse_args
+from tagging.TagDictionary import TagDictionary
+from uploading.UploadEngine import UploadJob
+
+def make_cli(tmp_path, argv):
+  # A Cli that writes to a StringIO, with a dictionary of a few tags instead of the server's
+
+  # Without a username, nothing gets synced
+  cli = Cli(parse_args(argv + ["--url", "https://booru.example", "--username", ""]),
+            io.StringIO())
+
+  cli.dictionary = TagDictionary("https://booru.example", str(tmp_path))
+  cli.dictionary.tags = [[["cat", "kitty"], "default", 10, None, None],
+                         [["cat_ears"], "default", 50, None, None]]
+  cli.dictionary.build_index()
+
+  return cli
+
+def lines(cli):
+
+  return [json.loads(line) for line in cli.out.getvalue().splitlines()]
+
+def test_unknown_tags_are_reported(tmp_path):
+
+  cli = make_cli(tmp_path, ["folder"])
+  cli.jobs = [UploadJob(0, "/a.jpg", ["cat", "Kitty", "cat_e"], "safe"),
+              UploadJob(1, "/b.jpg", ["cat_e", "dgo"], "safe")]
+
+  cli.check_tags()
+
+  assert lines(cli) == [
+    {"event": "unknown_tag", "tag": "cat_e", "suggestions": ["cat_ears"]},
+    {"event": "unknown_tag", "tag": "dgo", "suggestions": []}]
+
+def test_complete(tmp_path):
+
+  cli = make_cli(tmp_path, ["--complete", "CA"])
+
+  assert cli.run() == 0
+  assert [(line["name"], line["matched"]) for line in lines(cli)] == [("cat_ears", "cat_ears"),
+                                                                      ("cat", "cat")]
+
+def test_folders_are_needed_unless_completing():
+
+  with pytest.raises(SystemExit):
+
+    parse_args(["--url", "https://booru.example"])
+
+  with pytest.raises(SystemExit):
+
+    parse_args(["--complete", "ca", "--url", ""])
+
+  assert parse_args(["--complete", "ca", "--url", "https://booru.example"]).folders == []
+
+def test_every_stage_starts_from_zero(tmp_path):
+
+  cli = make_cli(tmp_path, ["folder"])
+
+  cli.on_progress("format_progressbar", "Loading thumbnails - %v/%m")
+  cli.on_progress("max_progressbar", 2)
+  cli.on_progress("increment_progressbar")
+  cli.on_progress("increment_progressbar")
+  cli.on_progress("format_progressbar", "Looking for near-duplicates...")
+
+  assert lines(cli)[-1] == {"event": "progress", "stage": "Looking for near-duplicates",
+                            "done": 0, "total": 0}
@@ -0,0 +1,209 @@
+import struct
+import zlib
+
+import pytest
+
+from loading.ExifReader import ExifReader, ImageMetadata, PNG_SIGNATURE
+
+def tiff(ifd0, exif=None, ifd1=None, thumbnail=None, endian="<"):
+  # Returns TIFF data with the given IFDs, each a list of (tag, type, value) entries, value being
+  # an int for SHORT (3) and LONG (4) or a str for ASCII (2)
+  # The pointer to the EXIF IFD and the thumbnail's offset and length are filled in.
+
+  ifd0 = list(ifd0)
+  ifds = [ifd0]
+
+  if exif is not None:
+
+    ifd0.append((34665, 4, None))
+    ifds.append(list(exif))
+
+  if ifd1 is not None or thumbnail is not None:
+
+    ifd1 = list(ifd1 or [])
+
+    if thumbnail is not None:
+
+      ifd1 += [(513, 4, None), (514, 4, len(thumbnail))]
+
+    ifds.append(ifd1)
+
+  # Header, then every IFD, then whatever values don't fit in their entry, then the thumbnail
+  offsets = []
+  end = 8
+
+  for ifd in ifds:
+
+    offsets.append(end)
+    end += 2 + 12 * len(ifd) + 4
+
+  values = b""
+  thumbnail_offset = end + sum(len(value) + 1 for ifd in ifds for _, kind, value in ifd
+                               if kind == 2 and len(value) + 1 > 4)
+
+  data = (b"II*\x00" if endian == "<" else b"MM\x00*") + struct.pack(endian + "I", 8)
+
+  for index, ifd in enumerate(ifds):
+
+    data += struct.pack(endian + "H", len(ifd))
+
+    for tag, kind, value in ifd:
+
+      # The entries added above
+      if tag == 34665 and value is None:
+
+        value = offsets[1]
+
+      elif tag == 513 and value is None:
+
+        value = thumbnail_offset
+
+      if kind == 2:
+
+        raw = value.encode("latin-1") + b"\x00"
+
+        if len(raw) <= 4:
+
+          field = raw.ljust(4, b"\x00")
+
+        else:
+
+          field = struct.pack(endian + "I", end + len(values))
+          values += raw
+
+        data += struct.pack(endian + "HHI", tag, kind, len(raw)) + field
+
+      elif kind == 3:
+
+        data += struct.pack(endian + "HHIH2x", tag, kind, 1, value)
+
+      else:
+
+        data += struct.pack(endian + "HHII", tag, kind, 1, value)
+
+    # Only IFD0 links to IFD1, the EXIF IFD is only pointed at
+    linked = ifd1 is not None and index == 0
+    data += struct.pack(endian + "I", offsets[-1] if linked else 0)
+
+  return data + values + (thumbnail or b"")
+
+def jpeg(*segments, width=640, height=480):
+  # Returns the header of a JPEG with the given (marker, payload) segments in front of its frame
+
+  data = b"\xff\xd8"
+
+  for marker, payload in segments:
+
+    data += bytes([0xFF, marker]) + struct.pack(">H", len(payload) + 2) + payload
+
+  frame = struct.pack(">BHHB", 8, height, width, 3)
+
+  return data + b"\xff\xc0" + struct.pack(">H", len(frame) + 2) + frame + b"\xff\xda"
+
+def png(*chunks, width=640, height=480):
+  # Returns the header of a PNG with the given (type, data) chunks after its IHDR
+
+  def chunk(kind, data):
+
+    return struct.pack(">I", len(data)) + kind + data + b"\x00" * 4
+
+  ihdr = struct.pack(">II", width, height) + b"\x08\x02\x00\x00\x00"
+
+  return PNG_SIGNATURE + chunk(b"IHDR", ihdr) + b"".join(chunk(*c) for c in chunks) + \
+         chunk(b"IEND", b"")
+
+def read(tmp_path, data, name="image"):
+
+  path = tmp_path / name
+  path.write_bytes(data)
+
+  return ExifReader.read(str(path))
+
+@pytest.mark.parametrize("endian", ["<", ">"])
+def test_jpeg_exif(tmp_path, endian):
+
+  exif = tiff([(306, 2, "2020:01:01 00:00:00"), (274, 3, 6)],
+              exif=[(36867, 2, "2021:03:04 05:06:07")], thumbnail=b"\xff\xd8thumb", endian=endian)
+
+  metadata = read(tmp_path, jpeg((0xE1, b"Exif\x00\x00" + exif)))
+
+  # DateTimeOriginal wins over DateTime
+  assert metadata == ImageMetadata("2021:03:04 05:06:07", 6, b"\xff\xd8thumb", 640, 480)
+
+def test_jpeg_without_exif_still_has_its_size(tmp_path):
+
+  assert read(tmp_path, jpeg((0xE0, b"JFIF\x00"))) == ImageMetadata(width=640, height=480)
+
+def test_jpeg_marker_padding(tmp_path):
+
+  data = jpeg()
+  data = data[:2] + b"\xff\xff\xff" + data[2:]
+
+  assert read(tmp_path, data) == ImageMetadata(width=640, height=480)
+
+@pytest.mark.parametrize("data", [
+  b"\xff\xd8\xff\xff",                    # Padding until the end of the file
+  b"\xff\xd8\xff",                        # Half a marker
+  b"\xff\xd8\xff\xe1\x00",                # Half a length
+  b"\xff\xd8\xff\xe1\x00\x40Exif\x00\x00", # A segment that's cut short
+  b"\xff\xd8\xff\xc0\x00\x11\x08",        # A frame that's cut short
+  b"\xff\xd8\xff\xe1\x00\x01",            # A length that doesn't even cover itself
+  b"\xff\xd8",
+  b""])
+def test_truncated_jpeg(tmp_path, data):
+
+  assert read(tmp_path, data) == ImageMetadata()
+
+def test_exif_with_broken_offsets(tmp_path):
+
+  # The EXIF IFD and thumbnail pointers point past the end, or aren't numbers at all
+  exif = tiff([(306, 2, "2021:03:04 05:06:07"), (34665, 4, 1 << 30)])
+  assert read(tmp_path, jpeg((0xE1, b"Exif\x00\x00" + exif))).datetime is None
+
+  exif = tiff([(306, 2, "2021:03:04 05:06:07"), (34665, 2, "oops"), (274, 2, "6")],
+              ifd1=[(513, 2, "oops"), (514, 4, 10)])
+  assert read(tmp_path, jpeg((0xE1, b"Exif\x00\x00" + exif))) == \
+    ImageMetadata("2021:03:04 05:06:07", 1, None, 640, 480)
+
+@pytest.mark.parametrize("datetime", ["0000:00:00 00:00:00", "", "    ", "yesterday"])
+def test_unusable_dates(tmp_path, datetime):
+
+  exif = tiff([(306, 2, datetime)])
+
+  assert read(tmp_path, jpeg((0xE1, b"Exif\x00\x00" + exif))).datetime is None
+
+def test_date_that_is_not_a_string(tmp_path):
+
+  exif = tiff([(306, 4, 20210304)])
+
+  assert read(tmp_path, jpeg((0xE1, b"Exif\x00\x00" + exif))).datetime is None
+
+def test_png_creation_time(tmp_path):
+
+  text = (b"tEXt", b"Creation Time\x002021-03-04T05:06:07")
+
+  assert read(tmp_path, png(text)) == ImageMetadata("2021:03:04 05:06:07", 1, None, 640, 480)
+
+def test_png_compressed_creation_time(tmp_path):
+
+  text = (b"zTXt", b"Creation Time\x00\x00" + zlib.compress(b"2021:03:04 05:06:07"))
+
+  assert read(tmp_path, png(text)).datetime == "2021:03:04 05:06:07"
+
+def test_png_exif_wins_over_text(tmp_path):
+
+  exif = (b"eXIf", tiff([(306, 2, "2021:03:04 05:06:07"), (274, 3, 3)]))
+  text = (b"tEXt", b"Creation Time\x002020-01-01T00:00:00")
+
+  assert read(tmp_path, png(text, exif)) == ImageMetadata("2021:03:04 05:06:07", 3, None, 640, 480)
+
+def test_png_with_broken_compressed_text(tmp_path):
+
+  text = (b"zTXt", b"Creation Time\x00\x00not zlib")
+
+  assert read(tmp_path, png(text)) == ImageMetadata()
+
+def test_not_an_image(tmp_path):
+
+  assert read(tmp_path, b"GIF89a") == ImageMetadata()
+  assert ExifReader.read(str(tmp_path / "missing.jpg")) == ImageMetadata()
@@ -0,0 +1,68 @@
+import os
+import time
+
+import pytest
+
+from PyQt5.QtCore import QCoreApplication
+
+from loading import FolderWatcher as watcher_module
+from loading.FolderWatcher import FolderWatcher
+from loading.Importer import Importer
+
+@pytest.fixture
+def app():
+
+  return QCoreApplication.instance() or QCoreApplication([])
+
+def wait(app, condition, seconds):
+  # Runs the event loop until condition is true or seconds have gone by
+
+  end = time.monotonic() + seconds
+
+  while not condition() and time.monotonic() < end:
+
+    app.processEvents()
+    time.sleep(0.01)
+
+def test_rescans_without_a_folder_change(app, tmp_path, monkeypatch):
+
+  monkeypatch.setattr(watcher_module, "SETTLE_INTERVAL", 0.05)
+  monkeypatch.setattr(watcher_module, "RESCAN_INTERVAL", 0.1)
+
+  watcher = FolderWatcher()
+  watcher.watch([str(tmp_path)])
+
+  changes = []
+  watcher.changed.connect(lambda: changes.append(time.monotonic()))
+
+  wait(app, lambda: len(changes) >= 2, 5)
+
+  assert len(changes) >= 2
+
+def test_update_finds_files_overwritten_in_place(tmp_path, monkeypatch):
+
+  (tmp_path / "a.jpg").write_bytes(b"first")
+  (tmp_path / "b.jpg").write_bytes(b"other")
+
+  importer = Importer(str(tmp_path), 200)
+  importer.manifest = importer.scan()
+
+  generated = []
+
+  monkeypatch.setattr(importer, "prune_cache", lambda: None)
+  monkeypatch.setattr(importer, "send_groups", lambda: None)
+  monkeypatch.setattr(importer, "generate_thumbnails",
+                      lambda entries: generated.extend(entry.path for entry in entries))
+
+  assert not importer.update()
+
+  # Same size, same folder, only the contents and the modification time change
+  with open(tmp_path / "a.jpg", "r+b") as f:
+
+    f.write(b"FIRST")
+
+  past = time.time() - 10
+  os.utime(tmp_path / "a.jpg", (past, past))
+
+  assert importer.update()
+  assert generated == [str(tmp_path / "a.jpg")]
@@ -0,0 +1,372 @@
+import os
+import json
+import time
+import threading
+import http.client
+
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from uploading.SzurubooruClient import SzurubooruClient, SzurubooruError, CHUNK_SIZE
+from uploading.UploadEngine import UploadEngine, UploadJob, EXPIRED_TOKEN_ERROR
+from uploading.UploadJournal import UploadJournal, TOKEN, APPLIED
+
+# A request the stand-in server got, connection being the client's port, which is different for
+# every connection
+Request = namedtuple("Request", ["method", "path", "headers", "body", "connection"])
+
+class Handler(BaseHTTPRequestHandler):
+
+  # Keeps connections alive unless the server is told to drop one
+  protocol_version = "HTTP/1.1"
+
+  def log_message(self, *args):
+
+    pass
+
+  def answer(self):
+
+    body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+    request = Request(self.command, self.path, self.headers, body, self.client_address[1])
+
+    server = self.server
+    server.requests.append(request)
+
+    answer = server.answers.get((self.command, self.path.split("?")[0]), (200, {}))
+
+    if callable(answer):
+
+      answer = answer(request)
+
+    if answer is None:
+
+      # Hang up without answering
+      self.close_connection = True
+      return
+
+    status, data = answer
+    data = data if isinstance(data, bytes) else json.dumps(data).encode()
+
+    self.send_response(status)
+    self.send_header("Content-Type", "application/json")
+    self.send_header("Content-Length", str(len(data)))
+    self.end_headers()
+    self.wfile.write(data)
+
+    # Closing right after answering, without saying so, is what a server timing out an idle
+    # connection looks like to the client the next time it uses it
+    if server.drop:
+
+      server.drop = False
+      self.close_connection = True
+
+  do_GET = do_POST = do_PUT = answer
+
+class StandIn(ThreadingHTTPServer):
+
+  # A szurubooru server that records every request, and answers with whatever is in answers for
+  # its (method, path), either a (status, JSON or bytes) tuple or a function of the Request that
+  # returns one. Anything else gets a 200 with an empty JSON object.
+
+  daemon_threads = True
+
+  def __init__(self):
+
+    super(StandIn, self).__init__(("127.0.0.1", 0), Handler)
+
+    self.requests = []
+    self.answers = {}
+    self.drop = False
+
+  def url(self):
+
+    return f"http://127.0.0.1:{self.server_address[1]}/"
+
+  def connections(self):
+
+    return {request.connection for request in self.requests}
+
+@pytest.fixture
+def server():
+
+  server = StandIn()
+  thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+  thread.start()
+
+  yield server
+
+  server.shutdown()
+  server.server_close()
+
+@pytest.fixture
+def client(server):
+
+  client = SzurubooruClient(server.url(), "user", "token", connections=2)
+
+  yield client
+
+  client.close()
+
+def test_requests_go_to_the_api_with_the_token(server, client):
+
+  server.answers[("GET", "/api/post/5")] = (200, {"id": 5})
+
+  assert client.get_post(5) == {"id": 5}
+
+  request = server.requests[0]
+
+  assert request.headers["Authorization"] == "Token dXNlcjp0b2tlbg=="
+  assert request.headers["Accept"] == "application/json"
+
+def test_connections_are_kept_alive(server, client):
+
+  for _ in range(10):
+
+    client.get_post(1)
+
+  assert len(server.requests) == 10
+  assert len(server.connections()) == 1
+
+def test_concurrent_requests_stay_within_the_pool(server, client):
+
+  threads = [threading.Thread(target=lambda: [client.get_post(1) for _ in range(10)])
+             for _ in range(4)]
+
+  for thread in threads:
+
+    thread.start()
+
+  for thread in threads:
+
+    thread.join()
+
+  assert len(server.requests) == 40
+  assert len(server.connections()) <= 2
+
+def test_stale_connection_is_retried(server, client):
+
+  server.drop = True
+
+  client.get_post(1)
+  assert client.get_post(1) == {}
+
+  # The first request's connection got closed, the second went out again on a new one
+  assert len(server.connections()) == 2
+  assert [request.path for request in server.requests] == ["/api/post/1", "/api/post/1"]
+
+def test_fresh_connection_failing_is_an_error(server, client):
+
+  server.answers[("GET", "/api/post/1")] = None
+
+  with pytest.raises(http.client.RemoteDisconnected):
+
+    client.get_post(1)
+
+  assert len(server.requests) == 1
+
+def test_error_json_becomes_an_exception(server, client):
+
+  server.answers[("POST", "/api/posts/")] = (409, {
+    "name": "PostAlreadyUploadedError",
+    "description": "Post already uploaded (2)",
+    "otherPostId": 2})
+
+  with pytest.raises(SzurubooruError) as error:
+
+    client.create_post("token", None)
+
+  assert error.value.status == 409
+  assert error.value.name == "PostAlreadyUploadedError"
+  assert error.value.description == "Post already uploaded (2)"
+  assert error.value.answer["otherPostId"] == 2
+
+  # The safety is filled in when there isn't one
+  assert json.loads(server.requests[0].body) == {"contentToken": "token", "safety": "safe"}
+
+def test_error_without_json(server, client):
+
+  server.answers[("GET", "/api/post/1")] = (502, b"<html>Bad Gateway</html>")
+
+  with pytest.raises(SzurubooruError) as error:
+
+    client.get_post(1)
+
+  assert (error.value.status, error.value.name) == (502, "Bad Gateway")
+  assert error.value.description == "<html>Bad Gateway</html>"
+  assert error.value.answer == {}
+
+def test_multipart_body_is_streamed(tmp_path):
+
+  path = tmp_path / "a \"quoted\" name.jpg"
+  content = os.urandom(2 * CHUNK_SIZE + 100)
+  path.write_bytes(content)
+
+  content_type, length, body = SzurubooruClient.multipart({"field": b"value"},
+                                                          {"content": str(path)})
+
+  boundary = content_type.split("boundary=")[1]
+  chunks = list(body())
+
+  assert b"".join(chunks) == (
+    f"--{boundary}\r\n"
+    f"Content-Disposition: form-data; name=\"field\"\r\n\r\n"
+    f"value\r\n"
+    f"--{boundary}\r\n"
+    f"Content-Disposition: form-data; name=\"content\"; filename=\"a %22quoted%22 name.jpg\"\r\n"
+    f"Content-Type: application/octet-stream\r\n\r\n").encode() + content + \
+    f"\r\n--{boundary}--\r\n".encode()
+
+  assert length == len(b"".join(chunks))
+
+  # The file is never in memory in more than one chunk at a time
+  assert max(len(chunk) for chunk in chunks) <= CHUNK_SIZE
+
+  # The body can be sent again, e.g. when a stale connection has to be retried
+  assert b"".join(body()) == b"".join(chunks)
+
+def test_upload_file_with_progress(server, client, tmp_path):
+
+  path = tmp_path / "image.jpg"
+  content = os.urandom(3 * CHUNK_SIZE)
+  path.write_bytes(content)
+
+  server.answers[("POST", "/api/uploads")] = (200, {"token": "abc"})
+
+  calls = []
+
+  assert client.upload_file(str(path), lambda sent, total: calls.append((sent, total))) == "abc"
+
+  request = server.requests[0]
+
+  assert request.headers["Content-Type"].startswith("multipart/form-data; boundary=")
+  assert int(request.headers["Content-Length"]) == len(request.body)
+  assert content in request.body
+
+  # Progress goes up chunk by chunk, and ends at the whole body
+  sent = [call[0] for call in calls]
+
+  assert len(calls) > 3
+  assert sent == sorted(sent)
+  assert calls[-1] == (len(request.body), len(request.body))
+  assert {call[1] for call in calls} == {len(request.body)}
+
+def booru(server):
+  # Makes the stand-in server hand out tokens and posts like szurubooru does
+  # Returns the dict of token -> contents of every upload.
+
+  uploads = {}
+  lock = threading.Lock()
+
+  def upload(request):
+
+    with lock:
+
+      token = f"token{len(uploads)}"
+      uploads[token] = request.body
+
+    return (200, {"token": token})
+
+  def create(request):
+
+    token = json.loads(request.body)["contentToken"]
+
+    if token not in uploads:
+
+      return (400, {"name": EXPIRED_TOKEN_ERROR, "description": "Expired"})
+
+    return (200, {"id": int(token[5:]) + 1, "version": 1})
+
+  server.answers[("POST", "/api/uploads")] = upload
+  server.answers[("POST", "/api/posts/")] = create
+
+  return uploads
+
+def test_engine_uploads_over_kept_alive_connections(server, client, tmp_path):
+
+  booru(server)
+
+  jobs = []
+
+  for index in range(8):
+
+    path = tmp_path / f"{index}.jpg"
+    path.write_bytes(bytes([index]) * 1000)
+
+    jobs.append(UploadJob(index, str(path), ["tag"] if index % 2 else [], "sketchy"))
+
+  progress = []
+  engine = UploadEngine(client, workers=2)
+
+  try:
+
+    results = list(engine.upload(jobs, lambda job, sent, total: progress.append(job.index)))
+
+  finally:
+
+    engine.shutdown()
+
+  assert sorted(job.index for job, _, _ in results) == list(range(8))
+  assert all(error is None for _, _, error in results)
+  assert set(progress) == set(range(8))
+
+  # Tags are applied to the posts of the jobs that have them, at the version they were created at
+  updates = [json.loads(request.body) for request in server.requests if request.method == "PUT"]
+
+  assert len(updates) == 4
+  assert all(update["tags"] == ["tag"] and update["version"] == 1 for update in updates)
+
+  # Three requests per tagged file and two per untagged one, all of them over two connections
+  assert len(server.requests) == 20
+  assert len(server.connections()) <= 2
+
+def test_engine_reports_errors_per_job(server, client, tmp_path):
+
+  path = tmp_path / "a.jpg"
+  path.write_bytes(b"a")
+
+  server.answers[("POST", "/api/uploads")] = (413, {"name": "TooBig", "description": "Too big"})
+
+  engine = UploadEngine(client, workers=2)
+
+  try:
+
+    [(job, post, error)] = engine.upload([UploadJob(0, str(path), [], None)])
+
+  finally:
+
+    engine.shutdown()
+
+  assert post is None
+  assert isinstance(error, SzurubooruError) and error.name == "TooBig"
+
+def test_engine_uploads_again_when_the_token_expired(server, client, tmp_path):
+
+  uploads = booru(server)
+
+  path = tmp_path / "a.jpg"
+  path.write_bytes(b"a")
+
+  # An earlier session got as far as the upload, the server threw it away since
+  journal = UploadJournal("server", str(tmp_path))
+  journal.open()
+  journal.record(str(path), "sha1", TOKEN, token="gone", token_time=time.time())
+
+  engine = UploadEngine(client, workers=2, journal=journal)
+
+  try:
+
+    [(job, post, error)] = engine.upload([UploadJob(0, str(path), [], None, "sha1")])
+
+  finally:
+
+    engine.shutdown()
+
+  assert error is None and post["id"] == 1
+  assert list(uploads) == ["token0"]
+  assert [request.path for request in server.requests] == ["/api/posts/", "/api/uploads",
+                                                           "/api/posts/"]
+  assert journal.state(str(path), "sha1")["state"] == APPLIED
+
+  journal.close()
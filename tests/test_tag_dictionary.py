@@ -0,0 +1,180 @@
+import random
+
+import pytest
+
+from tagging import TagDictionary as dictionary_module
+from tagging.TagDictionary import TagDictionary, Completion
+
+class Server:
+
+  # Answers list_tags like szurubooru does, from a list of tag JSONs, and remembers the queries
+
+  def __init__(self, tags):
+
+    self.tags = tags
+    self.queries = []
+
+  def list_tags(self, query, offset, limit=100, fields=()):
+
+    self.queries.append((query, offset))
+
+    tags = self.tags
+
+    if query == "sort:creation-time":
+
+      tags = sorted(tags, key=lambda tag: tag["creationTime"], reverse=True)
+
+    elif query == "sort:last-edit-time":
+
+      tags = sorted(tags, key=lambda tag: tag["lastEditTime"], reverse=True)
+
+    return {"query": query, "offset": offset, "limit": limit, "total": len(tags),
+            "results": tags[offset:offset + limit]}
+
+def tag(names, usages, created="2021-01-01T00:00:00Z", edited=None, category="default"):
+
+  return {"names": names, "category": category, "usages": usages, "creationTime": created,
+          "lastEditTime": edited or created}
+
+def make_dictionary(tmp_path, tags):
+
+  dictionary = TagDictionary("https://booru.example", str(tmp_path))
+  dictionary.tags = [TagDictionary.compact(tag) for tag in tags]
+  dictionary.build_index()
+
+  return dictionary
+
+def test_complete_ranks_by_usage(tmp_path):
+
+  dictionary = make_dictionary(tmp_path, [
+    tag(["cat", "Cat_Ears_Alias"], 10),
+    tag(["cat_ears"], 50, category="meta"),
+    tag(["dog"], 100),
+    tag(["caterpillar", "catapillar"], 5)])
+
+  # Each tag only once, even when more than one of its names matches
+  assert [(c.name, c.category, c.usages) for c in dictionary.complete("CAT")] == [
+    ("cat_ears", "meta", 50), ("cat", "default", 10), ("caterpillar", "default", 5)]
+
+  # Aliases complete to their tag
+  assert dictionary.complete("cat_ears_") == [Completion("cat", "Cat_Ears_Alias", "default", 10)]
+  assert dictionary.complete("catap") == [Completion("caterpillar", "catapillar", "default", 5)]
+
+  assert dictionary.complete("cat", 1) == [Completion("cat_ears", "cat_ears", "meta", 50)]
+  assert dictionary.complete("x") == []
+  assert dictionary.complete("") == []
+
+@pytest.mark.parametrize("limit", [1, 3, 10])
+def test_precomputed_prefixes_agree_with_scanning(tmp_path, monkeypatch, limit):
+
+  # Small enough limits that plenty of prefixes get precomputed
+  monkeypatch.setattr(dictionary_module, "SCAN_LIMIT", 8)
+  monkeypatch.setattr(dictionary_module, "TOP_RESULTS", 3)
+
+  rng = random.Random(1)
+  usages = rng.sample(range(10000), 300)
+
+  tags = []
+
+  for count in usages:
+
+    names = ["".join(rng.choice("abc") for _ in range(rng.randint(1, 6)))
+             for _ in range(rng.randint(1, 3))]
+
+    tags.append(tag(list(dict.fromkeys(names)), count))
+
+  # Names have to be unique across tags, like on the server
+  seen = set()
+  tags = [t for t in tags if not seen.intersection(t["names"]) and not seen.update(t["names"])]
+
+  dictionary = make_dictionary(tmp_path, tags)
+
+  assert "a" in dictionary.top and "ab" in dictionary.top
+
+  prefixes = {name[:length] for t in tags for name in t["names"] for length in range(1, 4)}
+
+  for prefix in prefixes:
+
+    expected = sorted((t for t in tags if any(name.startswith(prefix) for name in t["names"])),
+                      key=lambda t: -t["usages"])[:limit]
+
+    assert [c.name for c in dictionary.complete(prefix, limit)] == \
+           [t["names"][0] for t in expected], prefix
+
+def test_find(tmp_path):
+
+  dictionary = make_dictionary(tmp_path, [tag(["cat", "kitty"], 10), tag(["dog"], 5)])
+
+  assert dictionary.find("cat") == "cat"
+  assert dictionary.find("KITTY") == "cat"
+  assert dictionary.find("ca") is None
+  assert dictionary.find("dogs") is None
+
+def test_merge_follows_renames(tmp_path):
+
+  dictionary = make_dictionary(tmp_path, [tag(["cat", "kitty"], 10), tag(["dog"], 5)])
+
+  # cat was renamed to feline, keeping kitty as an alias, and shows up in both searches
+  renamed = TagDictionary.compact(tag(["feline", "kitty"], 12, edited="2021-02-01T00:00:00Z"))
+  dictionary.merge([renamed, renamed])
+  dictionary.build_index()
+
+  assert len(dictionary.tags) == 2
+  assert dictionary.find("cat") is None
+  assert dictionary.find("kitty") == "feline"
+  assert dictionary.complete("f") == [Completion("feline", "feline", "default", 12)]
+  assert dictionary.edited == "2021-02-01T00:00:00Z"
+
+def test_sync_fetches_everything_then_only_changes(tmp_path):
+
+  tags = [tag([f"tag{index:03}"], index, created=f"2021-01-01T00:{index // 60:02}:{index % 60:02}Z")
+          for index in range(250)]
+
+  server = Server(tags)
+  dictionary = TagDictionary("https://booru.example", str(tmp_path))
+
+  assert dictionary.sync(server) == 250
+  assert server.queries == [("", 0), ("", 100), ("", 200)]
+
+  # A new tag, and an old one that got renamed, keeping its old name as an alias
+  tags.append(tag(["new"], 1, created="2021-06-01T00:00:00Z"))
+  tags[5] = tag(["renamed", "tag005"], 5, created=tags[5]["creationTime"],
+                edited="2021-06-02T00:00:00Z")
+
+  server.queries = []
+
+  assert dictionary.sync(server) == 2
+
+  # Both searches stop at the first tag that's older than the last sync
+  assert server.queries == [("sort:creation-time", 0), ("sort:last-edit-time", 0)]
+
+  assert dictionary.find("new") == "new"
+  assert dictionary.find("renamed") == "renamed"
+  assert dictionary.find("tag005") == "renamed"
+  assert len(dictionary.tags) == 251
+
+  # It's all on disk for the next session
+  saved = TagDictionary("https://booru.example", str(tmp_path))
+
+  assert saved.find("renamed") == "renamed"
+  assert (saved.created, saved.edited) == ("2021-06-01T00:00:00Z", "2021-06-02T00:00:00Z")
+
+  # Nothing changed since
+  server.queries = []
+
+  assert saved.sync(server) == 0
+  assert len(server.queries) == 2
+
+def test_sync_fetches_everything_once_in_a_while(tmp_path):
+
+  server = Server([tag(["cat"], 1)])
+  dictionary = TagDictionary("https://booru.example", str(tmp_path))
+  dictionary.sync(server)
+
+  # Deleted tags only go away with a full sync
+  server.tags = [tag(["dog"], 1)]
+  dictionary.full_sync -= dictionary_module.FULL_SYNC_INTERVAL + 1
+
+  assert dictionary.sync(server) == 1
+  assert dictionary.find("cat") is None
+  assert dictionary.find("dog") == "dog"
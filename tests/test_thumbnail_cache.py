@@ -0,0 +1,135 @@
+import os
+
+from loading.ThumbnailCache import ThumbnailCache
+
+HEIGHTS = (100, 200, 400)
+
+def make_cache(tmp_path, max_bytes=1 << 30):
+
+  cache = ThumbnailCache(str(tmp_path / "thumbnails.db"), max_bytes)
+  cache.open()
+
+  return cache
+
+def thumbnail(path, size=10, dhash=123):
+  # A cache entry with a thumbnail of size bytes for every level
+
+  return (tuple(bytes([level]) * size for level in range(len(HEIGHTS))), path, ("2021", "03", "04"),
+          ("05", "06", "07"), dhash)
+
+def test_hit_needs_the_same_size_and_mtime(tmp_path):
+
+  cache = make_cache(tmp_path)
+  cache.put_many([(100, 5, thumbnail("/a.jpg")), (200, 6, thumbnail("/b.jpg"))], HEIGHTS)
+
+  found = cache.get_many([("/a.jpg", 100, 5), ("/b.jpg", 200, 7), ("/c.jpg", 1, 1)], HEIGHTS)
+
+  assert list(found) == ["/a.jpg"]
+  assert found["/a.jpg"] == thumbnail("/a.jpg")
+
+def test_hit_needs_every_level(tmp_path):
+
+  cache = make_cache(tmp_path)
+  cache.put_many([(100, 5, thumbnail("/a.jpg"))], HEIGHTS)
+
+  # Only the 200 level of a file cached at another set of heights
+  cache.put_many([(100, 5, ((b"x",), "/b.jpg", ("2021",), ("05",), 1))], (200,))
+
+  assert list(cache.get_many([("/a.jpg", 100, 5), ("/b.jpg", 100, 5)], HEIGHTS)) == ["/a.jpg"]
+  assert list(cache.get_many([("/a.jpg", 100, 5)], (200,))) == ["/a.jpg"]
+
+def test_dhash_round_trips_above_63_bits(tmp_path):
+
+  cache = make_cache(tmp_path)
+  cache.put_many([(1, 1, thumbnail("/a.jpg", dhash=(1 << 64) - 1))], HEIGHTS)
+
+  assert cache.get_many([("/a.jpg", 1, 1)], HEIGHTS)["/a.jpg"][4] == (1 << 64) - 1
+
+def test_evicts_least_recently_used(tmp_path):
+
+  # Room for two files of three 100 byte levels
+  cache = make_cache(tmp_path, max_bytes=600)
+
+  for index, path in enumerate(["/a.jpg", "/b.jpg", "/c.jpg"]):
+
+    cache.put_many([(1, 1, thumbnail(path, size=100))], HEIGHTS)
+
+    # Make sure /a.jpg is used last, even within the same clock tick
+    cache.db.execute("UPDATE thumbnails SET last_used = ? WHERE path = ?", (index, path))
+
+  cache.db.execute("UPDATE thumbnails SET last_used = 10 WHERE path = '/a.jpg'")
+  cache.evict()
+
+  files = [(path, 1, 1) for path in ["/a.jpg", "/b.jpg", "/c.jpg"]]
+
+  assert sorted(cache.get_many(files, HEIGHTS)) == ["/a.jpg", "/c.jpg"]
+
+def test_prune_folder_drops_removed_and_changed_files(tmp_path):
+
+  cache = make_cache(tmp_path)
+
+  folder = os.path.join(os.sep, "photos")
+  kept, changed, removed = (os.path.join(folder, name) for name in ["kept.jpg", "changed.jpg",
+                                                                    "removed.jpg"])
+  # Starts with the folder's name but isn't in it, and in another folder altogether
+  sibling = os.path.join(os.sep, "photos2", "a.jpg")
+  elsewhere = os.path.join(os.sep, "other", "a.jpg")
+
+  cache.put_many([(1, 1, thumbnail(path)) for path in [kept, changed, removed, sibling, elsewhere]],
+                 HEIGHTS)
+
+  assert cache.prune_folder(folder, [(kept, 1, 1), (changed, 2, 1)]) == 2
+
+  files = [(path, 1, 1) for path in [kept, changed, removed, sibling, elsewhere]]
+
+  assert sorted(cache.get_many(files, HEIGHTS)) == sorted([kept, sibling, elsewhere])
+  assert cache.db.execute("SELECT COUNT(*) FROM thumbnails WHERE path = ?", (changed,)).fetchone() \
+    == (0,)
+
+def test_prune_stats_the_files(tmp_path):
+
+  cache = make_cache(tmp_path)
+
+  path = tmp_path / "a.jpg"
+  path.write_bytes(b"jpeg")
+  stat = os.stat(path)
+
+  cache.put_many([(stat.st_size, stat.st_mtime_ns, thumbnail(str(path))),
+                  (1, 1, thumbnail(str(tmp_path / "gone.jpg")))], HEIGHTS)
+
+  assert cache.prune() == 1
+  assert list(cache.get_many([(str(path), stat.st_size, stat.st_mtime_ns)], HEIGHTS)) == [str(path)]
+
+def test_clear(tmp_path):
+
+  cache = make_cache(tmp_path)
+  cache.put_many([(1, 1, thumbnail("/a.jpg"))], HEIGHTS)
+
+  cache.clear()
+
+  assert cache.get_many([("/a.jpg", 1, 1)], HEIGHTS) == {}
+
+def test_importer_prunes_its_folder_after_scanning(tmp_path):
+
+  from loading.Importer import Importer
+
+  folder = tmp_path / "photos"
+  folder.mkdir()
+  (folder / "kept.jpg").write_bytes(b"jpeg")
+  stat = os.stat(folder / "kept.jpg")
+
+  importer = Importer(str(folder), 200)
+  importer.cache = ThumbnailCache(str(tmp_path / "thumbnails.db"))
+
+  importer.cache.open()
+  importer.cache.put_many([(stat.st_size, stat.st_mtime_ns, thumbnail(str(folder / "kept.jpg"))),
+                           (1, 1, thumbnail(str(folder / "removed.jpg")))], importer.heights)
+  importer.cache.close()
+
+  importer.manifest = importer.scan()
+  importer.prune_cache()
+
+  importer.cache.open()
+
+  assert [path for path, in importer.cache.db.execute("SELECT DISTINCT path FROM thumbnails")] \
+    == [str(folder / "kept.jpg")]
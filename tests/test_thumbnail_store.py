@@ -0,0 +1,131 @@
+from gui.ThumbnailStore import ThumbnailStore
+
+def make_store():
+  # A store of four files over two dates and two extensions
+
+  store = ThumbnailStore()
+
+  for path, date in (("/a.jpg", "2021-03-04"), ("/b.PNG", "2021-03-04"), ("/c.jpg", "2021-03-05"),
+                     ("/d.png", "2021-03-05")):
+
+    store.add(path, date, "05:06:07", None, None, 0)
+
+  return store
+
+def test_add_and_find():
+
+  store = make_store()
+
+  record = store.find("/b.PNG")
+
+  assert (record.index, record.ext, record.date) == (1, "png", "2021-03-04")
+  assert store.find("/missing.jpg") is None
+  assert len(store) == 4
+
+  # Repeated values are shared
+  assert store[1].ext is store[3].ext
+
+def test_where():
+
+  store = make_store()
+
+  assert store.where() == {0, 1, 2, 3}
+  assert store.where(date="2021-03-04") == {0, 1}
+  assert store.where(date="2021-03-04", ext="jpg") == {0}
+  assert store.where(ext="gif") == set()
+  assert store.where(safety="") == {0, 1, 2, 3}
+
+  store.select([1, 2])
+
+  assert store.where(selected=True) == {1, 2}
+  assert store.where(selected=False) == {0, 3}
+  assert store.where(ext="png", selected=True) == {1}
+  assert store.where(ext="png", selected=False) == {3}
+
+  store.clear_selection()
+
+  assert store.where(selected=True) == set()
+  assert not any(record.selected for record in store)
+
+def test_bulk_updates():
+
+  store = make_store()
+
+  store.set_safety([0, 1], "sketchy")
+  store.add_tags([0, 1, 2], ["cat", "dog"])
+  store.add_tags([0], ["cat"])
+  store.remove_tags([1, 3], ["cat"])
+
+  assert store.where(safety="sketchy") == {0, 1}
+  assert store.where(safety="") == {2, 3}
+  assert store.where(tag="cat") == {0, 2}
+  assert store.where(tag="dog") == {0, 1, 2}
+  assert [store[index].tags for index in range(4)] == [["cat", "dog"], ["dog"], ["cat", "dog"], []]
+
+  store.set_safety([1], "safe")
+
+  assert store.where(safety="sketchy") == {0}
+  assert store[1].safety == "safe"
+
+def test_bulk_updates_take_any_iterable():
+
+  store = make_store()
+
+  store.add_tags((index for index in [0, 1]), ["x", "y"])
+  store.set_safety((index for index in [0, 1]), "unsafe")
+
+  assert [store[index].tags for index in range(2)] == [["x", "y"], ["x", "y"]]
+  assert store.where(safety="unsafe") == {0, 1}
+
+  store.remove_tags((index for index in [0, 1]), ["x", "y"])
+
+  assert [store[index].tags for index in range(2)] == [[], []]
+
+  store.select(index for index in [2, 3])
+
+  assert store.where(selected=True) == {2, 3}
+
+def test_replace_keeps_tags_and_safety():
+
+  store = make_store()
+
+  store.add_tags([0], ["cat"])
+  store.set_safety([0], "sketchy")
+
+  store[0].post_id = 5
+  store[0].duplicate = True
+
+  store.replace(0, "2021-03-05", "08:09:10", None, None, 1)
+
+  record = store[0]
+
+  assert store.where(date="2021-03-05") == {0, 2, 3}
+  assert store.where(date="2021-03-04") == {1}
+  assert (record.tags, record.safety, record.time, record.phash) == (["cat"], "sketchy",
+                                                                     "08:09:10", 1)
+  assert (record.post_id, record.duplicate) == (None, False)
+
+def test_removed_records_are_left_alone():
+
+  store = make_store()
+
+  store.add_tags([0], ["cat"])
+  store.select([0])
+  store.remove(0)
+
+  assert len(store) == 3
+  assert store.find("/a.jpg") is None
+  assert [record.index for record in store] == [1, 2, 3]
+  assert store.where() == {1, 2, 3}
+  assert store.where(tag="cat") == set()
+  assert store.where(selected=True) == set()
+
+  # Bulk updates skip it, so it never shows up in an index again
+  store.add_tags([0, 1], ["z"])
+  store.set_safety([0, 1], "unsafe")
+  store.select([0, 1])
+
+  assert store.where(tag="z") == {1}
+  assert store.where(safety="unsafe") == {1}
+  assert store.where(selected=True) == {1}
+  assert not store[0].selected
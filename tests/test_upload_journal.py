@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import threading
+
+import pytest
+
+from uploading import UploadJournal as journal_module
+from uploading.UploadJournal import UploadJournal, QUEUED, TOKEN, CREATED, APPLIED, TOKEN_LIFETIME
+
+def make_journal(tmp_path):
+
+  journal = UploadJournal("https://booru.example", str(tmp_path))
+  journal.open()
+
+  return journal
+
+def lines(journal):
+
+  with open(journal.path, encoding="utf-8") as f:
+
+    return [json.loads(line) for line in f if line.strip()]
+
+def files(tmp_path, *names):
+  # Makes the files the journal gets to record, compact forgets the ones that don't exist
+
+  paths = []
+
+  for name in names:
+
+    path = tmp_path / name
+    path.write_bytes(name.encode())
+
+    paths.append(str(path))
+
+  return paths
+
+def test_resume_where_the_last_session_stopped(tmp_path):
+
+  a, b, c = files(tmp_path, "a.jpg", "b.jpg", "c.jpg")
+
+  journal = make_journal(tmp_path)
+
+  journal.record(b, "b", QUEUED)
+  journal.record(a, "a", QUEUED)
+  journal.record(c, "c", QUEUED)
+  journal.record(a, "a", TOKEN, durable=True, token="t", token_time=time.time())
+  journal.record(a, "a", CREATED, durable=True, post_id=7)
+  journal.record(c, "c", APPLIED)
+  journal.close()
+
+  journal = make_journal(tmp_path)
+
+  entry = journal.state(a, "a")
+
+  assert (entry["state"], entry["token"], entry["post_id"]) == (CREATED, "t", 7)
+  assert journal.state(b, "b")["state"] == QUEUED
+
+  # Finished files are compacted away, the rest keep the order they were queued in
+  assert journal.state(c, "c") is None
+  assert [line["path"] for line in lines(journal)] == [b, a]
+  assert journal.position(b, "b") < journal.position(a, "a")
+  assert journal.position("/new.jpg", "new") == 2
+
+  # A changed file is a different file
+  assert journal.state(a, "changed") is None
+
+  journal.close()
+
+def test_compact_forgets_old_versions_and_deleted_files(tmp_path):
+
+  changed, deleted, waiting = files(tmp_path, "changed.jpg", "deleted.jpg", "waiting.jpg")
+
+  journal = make_journal(tmp_path)
+
+  journal.record(changed, "old", QUEUED)
+  journal.record(deleted, "d", QUEUED)
+  journal.record(waiting, "w", QUEUED)
+  journal.record(changed, "new", APPLIED)
+
+  # Whichever version of a file was recorded last is the one that counts
+  journal.record(waiting, "w2", QUEUED)
+  journal.record(waiting, "w", CREATED, post_id=3)
+
+  os.remove(deleted)
+
+  journal.close()
+
+  assert [(line["path"], line["checksum"]) for line in lines(journal)] == [(waiting, "w")]
+
+def test_old_tokens_are_not_reused(tmp_path):
+
+  journal = make_journal(tmp_path)
+
+  journal.record("/a.jpg", "a", TOKEN, token="old", token_time=time.time() - TOKEN_LIFETIME - 1)
+  journal.record("/b.jpg", "b", TOKEN, token="new", token_time=time.time())
+
+  assert journal.token("/a.jpg", "a") is None
+  assert journal.token("/b.jpg", "b") == "new"
+  assert journal.token("/c.jpg", "c") is None
+
+  journal.close()
+
+def test_half_lines_are_skipped(tmp_path):
+
+  journal = UploadJournal("https://booru.example", str(tmp_path))
+
+  with open(journal.path, "w", encoding="utf-8") as f:
+
+    f.write(json.dumps({"path": "/a.jpg", "checksum": "a", "state": QUEUED}) + "\n")
+    f.write('{"path": "/b.jpg", "chec\n')
+    f.write(json.dumps({"path": "/c.jpg", "checksum": "c", "state": QUEUED}) + "\n")
+    f.write('{"path": "/a.jpg", "checksum": "a", "st')
+
+  journal.open()
+
+  assert journal.state("/a.jpg", "a")["state"] == QUEUED
+  assert journal.state("/c.jpg", "c")["state"] == QUEUED
+
+  journal.close()
+
+def test_failed_sync_keeps_the_records(tmp_path, monkeypatch):
+
+  journal = make_journal(tmp_path)
+  journal.record("/a.jpg", "a", QUEUED)
+
+  fsync = os.fsync
+  failures = [OSError(28, "No space left on device")]
+
+  def failing_fsync(fd):
+
+    if failures:
+
+      raise failures.pop()
+
+    fsync(fd)
+
+  monkeypatch.setattr(journal_module.os, "fsync", failing_fsync)
+
+  # A durable record that didn't make it to disk has to say so
+  with pytest.raises(OSError):
+
+    journal.record("/a.jpg", "a", CREATED, durable=True, post_id=7)
+
+  assert len(journal.pending) == 2
+  assert journal.synced == 0
+
+  journal.flush()
+
+  assert journal.pending == []
+  assert journal.synced == 2
+
+  journal.file.close()
+  journal.file = None
+
+  journal = make_journal(tmp_path)
+
+  assert journal.state("/a.jpg", "a")["post_id"] == 7
+
+  journal.close()
+
+def test_failed_write_does_not_swallow_the_next_line(tmp_path):
+
+  journal = make_journal(tmp_path)
+
+  # What a write that ran out of space halfway through leaves behind
+  journal.file.write('{"path": "/a.jpg", "chec')
+  journal.broken = True
+
+  journal.record("/b.jpg", "b", QUEUED, durable=True)
+  journal.file.close()
+  journal.file = None
+
+  journal = make_journal(tmp_path)
+
+  assert journal.state("/b.jpg", "b")["state"] == QUEUED
+
+  journal.close()
+
+def test_durable_records_from_many_threads(tmp_path):
+
+  journal = make_journal(tmp_path)
+
+  def upload(worker):
+
+    for index in range(20):
+
+      journal.record(f"/{worker}/{index}.jpg", "x", TOKEN, durable=True, token="t",
+                     token_time=time.time())
+
+  threads = [threading.Thread(target=upload, args=(worker,)) for worker in range(4)]
+
+  for thread in threads:
+
+    thread.start()
+
+  for thread in threads:
+
+    thread.join()
+
+  assert journal.synced == journal.recorded == 80
+  assert len(lines(journal)) == 80
+
+  journal.close()
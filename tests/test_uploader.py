@@ -0,0 +1,50 @@
+import os
+import hashlib
+
+from uploading.ChecksumIndex import ChecksumIndex
+from uploading.UploadEngine import UploadJob
+from uploading.Uploader import Uploader
+
+def make_uploader(tmp_path, jobs):
+  # An Uploader whose events end up in the list it returns, with its index in tmp_path
+
+  events = []
+
+  uploader = Uploader(jobs, "http://localhost/", "user", "token",
+                      emit=lambda event, *args: events.append((event, *args)))
+
+  uploader.index = ChecksumIndex(str(tmp_path / "checksums.db"))
+  uploader.index.open()
+
+  return (uploader, events)
+
+def test_hash_jobs_counts_only_what_gets_hashed(tmp_path):
+
+  jobs = []
+
+  for index in range(3):
+
+    path = tmp_path / f"{index}.jpg"
+    path.write_bytes(bytes([index]) * 100)
+
+    jobs.append(UploadJob(index, str(path), [], None))
+
+  jobs.append(UploadJob(3, str(tmp_path / "missing.jpg"), [], None))
+
+  uploader, events = make_uploader(tmp_path, jobs)
+
+  # The first file was hashed in an earlier session
+  stat = os.stat(jobs[0].path)
+  uploader.index.put_checksums([(jobs[0].path, stat.st_size, stat.st_mtime_ns, "known")])
+
+  checksums = uploader.hash_jobs(jobs)
+
+  assert checksums == {0: "known",
+                       1: hashlib.sha1(bytes([1]) * 100).hexdigest(),
+                       2: hashlib.sha1(bytes([2]) * 100).hexdigest()}
+
+  assert ("max_progressbar", 2) in events
+  assert events.count(("increment_progressbar",)) == 2
+  assert [event for event in events if event[0] == "post_failed"][0][1] == 3
+
+  uploader.index.close()
@@ -0,0 +1,55 @@
+import struct
+
+import pytest
+
+from loading.VideoReader import VideoReader, MP4_EPOCH_OFFSET
+
+# 2021-03-04 05:06:07 UTC
+CREATED = 1614834367
+
+def box(kind, payload):
+
+  return struct.pack(">I4s", len(payload) + 8, kind) + payload
+
+def mvhd(version, seconds):
+
+  if version == 1:
+
+    return box(b"mvhd", bytes([1, 0, 0, 0]) + struct.pack(">QQ", seconds, seconds))
+
+  return box(b"mvhd", bytes(4) + struct.pack(">II", seconds, seconds))
+
+def write(tmp_path, data):
+
+  path = tmp_path / "video.mp4"
+  path.write_bytes(data)
+
+  return str(path)
+
+@pytest.mark.parametrize("version", [0, 1])
+def test_mp4_creation(tmp_path, version):
+
+  # The media data comes first and gets skipped over
+  data = box(b"ftyp", b"isom") + box(b"mdat", bytes(5000)) + \
+         box(b"moov", box(b"trak", b"") + mvhd(version, CREATED + MP4_EPOCH_OFFSET))
+
+  assert VideoReader.mp4_creation(write(tmp_path, data)) == "2021-03-04 05:06:07"
+
+def test_mp4_creation_with_large_boxes(tmp_path):
+
+  # A size of 1 means the real one is a 64 bit number after the type
+  mdat = struct.pack(">I4sQ", 1, b"mdat", 16 + 100) + bytes(100)
+  data = mdat + box(b"moov", mvhd(0, CREATED + MP4_EPOCH_OFFSET))
+
+  assert VideoReader.mp4_creation(write(tmp_path, data)) == "2021-03-04 05:06:07"
+
+@pytest.mark.parametrize("data", [
+  box(b"moov", mvhd(0, 0)),                                # Never set
+  box(b"ftyp", b"isom") + box(b"mdat", b""),               # No moov
+  box(b"moov", box(b"trak", b"")),                         # No mvhd
+  box(b"moov", mvhd(0, CREATED + MP4_EPOCH_OFFSET))[:20],  # Cut short
+  struct.pack(">I4s", 4, b"moov") + bytes(100),            # A size too small to be a box
+  b""])
+def test_mp4_without_creation(tmp_path, data):
+
+  assert VideoReader.mp4_creation(write(tmp_path, data)) == ""
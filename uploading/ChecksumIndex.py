@@ -0,0 +1,167 @@
+import os
+import hashlib
+import sqlite3
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Where the index lives, it's shared between every folder that gets uploaded
+INDEX_PATH = os.path.join(os.path.expanduser("~"), ".cache", "szurubooru_uploader", "checksums.db")
+
+# SQLite only allows so many variables in one query, so lookups are done in chunks of this size
+CHUNK_SIZE = 500
+
+# How much of a file gets hashed at a time
+READ_SIZE = 1024 * 1024
+
+class ChecksumIndex:
+
+  # A persistent index of the SHA1 checksums of everything that has been uploaded, per server,
+  # so files that are already on the server can be skipped before anything is sent.
+  # szurubooru itself refuses posts with the same SHA1, so this is the exact same check, just
+  # without uploading the file first. It also remembers the checksums of local files by path, size
+  # and mtime, so unchanged files never get hashed twice.
+  # The connection belongs to whichever thread opened it, so open it inside the thread using it.
+
+  def __init__(self, path=INDEX_PATH):
+
+    self.path = path
+
+    self.db = None
+
+  def open(self):
+    # Opens (and creates, if needed) the index database
+
+    if self.db is not None:
+
+      return
+
+    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    self.db = sqlite3.connect(self.path)
+
+    # WAL lets us write batches without syncing the whole file every time
+    self.db.execute("PRAGMA journal_mode=WAL")
+    self.db.execute("PRAGMA synchronous=NORMAL")
+
+    self.db.execute("""
+      CREATE TABLE IF NOT EXISTS files (
+        path     TEXT    NOT NULL PRIMARY KEY,
+        size     INTEGER NOT NULL,
+        mtime    INTEGER NOT NULL,
+        checksum TEXT    NOT NULL)""")
+
+    # Looking up by (server, checksum) is all we ever do, so the primary key is the table
+    self.db.execute("""
+      CREATE TABLE IF NOT EXISTS uploaded (
+        server   TEXT    NOT NULL,
+        checksum TEXT    NOT NULL,
+        post_id  INTEGER NOT NULL,
+        PRIMARY KEY (server, checksum)) WITHOUT ROWID""")
+
+    self.db.commit()
+
+  def close(self):
+
+    if self.db is not None:
+
+      self.db.close()
+      self.db = None
+
+  def checksums(self, files):
+    # Looks up the checksums of a list of (path, size, mtime) tuples
+    # Returns a dict of path -> checksum for every file that hasn't changed since it was hashed
+
+    stats = {path: (size, mtime) for path, size, mtime in files}
+    paths = list(stats)
+
+    found = {}
+
+    for i in range(0, len(paths), CHUNK_SIZE):
+
+      chunk = paths[i:i + CHUNK_SIZE]
+
+      rows = self.db.execute(
+        f"SELECT path, size, mtime, checksum FROM files WHERE path IN ({','.join('?' * len(chunk))})",
+        chunk)
+
+      for path, size, mtime, checksum in rows:
+
+        if stats[path] == (size, mtime):
+
+          found[path] = checksum
+
+    return found
+
+  def put_checksums(self, entries):
+    # Stores a list of (path, size, mtime, checksum) tuples
+
+    self.db.executemany(
+      "INSERT OR REPLACE INTO files (path, size, mtime, checksum) VALUES (?, ?, ?, ?)", entries)
+
+    self.db.commit()
+
+  def lookup(self, server, checksums):
+    # Returns a dict of checksum -> post_id for every one of the given checksums that has already
+    # been uploaded to server
+
+    checksums = list(checksums)
+
+    found = {}
+
+    for i in range(0, len(checksums), CHUNK_SIZE):
+
+      chunk = checksums[i:i + CHUNK_SIZE]
+
+      found.update(self.db.execute(
+        f"""SELECT checksum, post_id FROM uploaded
+            WHERE server = ? AND checksum IN ({','.join('?' * len(chunk))})""",
+        [server, *chunk]))
+
+    return found
+
+  def add(self, server, entries):
+    # Records a list of (checksum, post_id) tuples as uploaded to server
+
+    self.db.executemany(
+      "INSERT OR REPLACE INTO uploaded (server, checksum, post_id) VALUES (?, ?, ?)",
+      [(server, checksum, post_id) for checksum, post_id in entries])
+
+    self.db.commit()
+
+  def hash_file(path):
+    # Returns the SHA1 of a file as a hex string, reading it READ_SIZE bytes at a time
+
+    sha1 = hashlib.sha1()
+
+    with open(path, "rb") as f:
+
+      while True:
+
+        chunk = f.read(READ_SIZE)
+
+        if not chunk:
+
+          break
+
+        sha1.update(chunk)
+
+    return sha1.hexdigest()
+
+  def hash_many(paths, workers=None):
+    # Hashes a list of files with at most workers threads at once
+    # This is a generator, it yields (path, checksum, error) as soon as each file is hashed. hashlib
+    # lets go of the GIL while it hashes, so threads really do run side by side here.
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+
+      futures = {pool.submit(ChecksumIndex.hash_file, path): path for path in paths}
+
+      for future in as_completed(futures):
+
+        try:
+
+          yield (futures[future], future.result(), None)
+
+        except OSError as e:
+
+          yield (futures[future], None, e)
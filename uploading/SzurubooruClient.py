@@ -0,0 +1,308 @@
+import os
+import json
+import uuid
+import base64
+import queue
+import http.client
+
+from contextlib import contextmanager
+from urllib.parse import urlsplit, urlencode
+
+# How much of a file gets read and sent at a time, this is all of it that's ever in memory
+CHUNK_SIZE = 256 * 1024
+
+# How long to wait on the server before giving up on a request
+TIMEOUT = 60
+
+# szurubooru won't create a post without a safety, this is used for files that don't have one
+DEFAULT_SAFETY = "safe"
+
+# Errors that mean a kept-alive connection was closed by the server while it sat in the pool
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError)
+
+class SzurubooruError(Exception):
+
+  # Raised when the server answers with an error, szurubooru describes those in JSON
+  # answer is the whole JSON, some errors carry more than a name and description (e.g.
+  # PostAlreadyUploadedError has the otherPostId).
+
+  def __init__(self, status, name, description, answer=None):
+
+    super(SzurubooruError, self).__init__(f"{name}: {description} (HTTP {status})")
+
+    self.status = status
+    self.name = name
+    self.description = description
+    self.answer = answer or {}
+
+class SzurubooruClient:
+
+  # Talks to the REST API of a szurubooru server.
+  # Connections are kept alive and pooled, since setting up a new (TLS) connection per file costs
+  # more than uploading a small image. Up to connections requests can run at once from different
+  # threads, each one borrows its own connection from the pool. File contents are streamed from
+  # disk in CHUNK_SIZE pieces, so uploading a 2GB video doesn't load 2GB into memory.
+  # url can be any http:// or https:// base url, including a local stand-in server.
+
+  def __init__(self, url, username, token, connections=4):
+
+    parts = urlsplit(url)
+
+    if parts.scheme not in ("http", "https"):
+
+      raise ValueError(f"Not an http(s) url: {url}")
+
+    self.scheme = parts.scheme
+    self.host = parts.hostname
+    self.port = parts.port
+
+    # The API lives under /api of wherever szurubooru is hosted
+    self.base_path = parts.path.rstrip('/') + "/api"
+
+    credentials = base64.b64encode(f"{username}:{token}".encode()).decode()
+
+    self.headers = {
+      "Accept": "application/json",
+      "Authorization": f"Token {credentials}"}
+
+    self.connections = connections
+
+    # Idle connections, and how many have been opened in total
+    self.pool = queue.LifoQueue()
+    self.opened = queue.Queue(maxsize=connections)
+
+  def close(self):
+    # Closes every idle connection
+
+    while True:
+
+      try:
+
+        self.pool.get_nowait().close()
+
+      except queue.Empty:
+
+        return
+
+  @contextmanager
+  def connection(self):
+    # Borrows a connection from the pool, opening a new one if none is idle and we are still
+    # under the limit, or waiting for one to be returned otherwise
+    # Yields (connection, reused), reused being whether it has been used for a request before.
+
+    try:
+
+      conn, reused = self.pool.get_nowait(), True
+
+    except queue.Empty:
+
+      try:
+
+        self.opened.put_nowait(None)
+        conn, reused = self.new_connection(), False
+
+      except queue.Full:
+
+        conn, reused = self.pool.get(), True
+
+    try:
+
+      yield (conn, reused)
+
+    except BaseException:
+
+      # We can't know what state the connection is in, closing it makes the next request that
+      # borrows it reconnect
+      conn.close()
+      raise
+
+    finally:
+
+      self.pool.put(conn)
+
+  def new_connection(self):
+
+    if self.scheme == "https":
+
+      return http.client.HTTPSConnection(self.host, self.port, timeout=TIMEOUT)
+
+    return http.client.HTTPConnection(self.host, self.port, timeout=TIMEOUT)
+
+  def request(self, method, endpoint, body=None, headers=None):
+    # Sends a request to an API endpoint and returns the decoded JSON answer
+    # body can be bytes or a function that returns an iterable of bytes, which gets called again
+    # if the request has to be retried. Raises SzurubooruError when the server reports an error.
+
+    headers = {**self.headers, **(headers or {})}
+
+    while True:
+
+      with self.connection() as (conn, reused):
+
+        try:
+
+          conn.request(method, self.base_path + endpoint,
+                       body=body() if callable(body) else body,
+                       headers=headers)
+
+          response = conn.getresponse()
+          data = response.read()
+
+        except STALE_CONNECTION_ERRORS:
+
+          # The server dropped a connection we kept alive, nothing was processed so just retry
+          # on a fresh one. A fresh connection failing is a real error though.
+          if reused:
+
+            conn.close()
+            continue
+
+          raise
+
+      break
+
+    try:
+
+      answer = json.loads(data) if data else {}
+
+    except ValueError:
+
+      answer = {}
+
+    if response.status >= 400:
+
+      raise SzurubooruError(
+        response.status,
+        answer.get("name", response.reason),
+        answer.get("description", data[:200].decode("utf-8", "replace")),
+        answer)
+
+    return answer
+
+  def send_json(self, method, endpoint, data):
+    # Sends data as a JSON body, and returns the decoded JSON answer
+
+    return self.request(method, endpoint, json.dumps(data).encode(), {
+      "Content-Type": "application/json"})
+
+  def upload_file(self, path, progress=None):
+    # Uploads a file to the temporary upload storage, and returns the token that refers to it
+    # progress gets called with (bytes_sent, bytes_total) while the request is being sent.
+
+    content_type, length, body = SzurubooruClient.multipart({}, {"content": path}, progress)
+
+    return self.request("POST", "/uploads", body, {
+      "Content-Type": content_type,
+      "Content-Length": str(length)})["token"]
+
+  def create_post(self, content_token, safety):
+    # Creates a post out of an uploaded file's token, and returns the post's JSON
+
+    return self.send_json("POST", "/posts/", {
+      "contentToken": content_token,
+      "safety": safety or DEFAULT_SAFETY})
+
+  def list_tags(self, query, offset, limit=100, fields=()):
+    # Returns one page of the tags matching a search query, as szurubooru's paged search JSON
+    # fields limits which fields of each tag are sent, leave it empty to get all of them.
+
+    params = {"query": query, "offset": offset, "limit": limit}
+
+    if fields:
+
+      params["fields"] = ",".join(fields)
+
+    return self.request("GET", f"/tags/?{urlencode(params)}")
+
+  def get_post(self, post_id):
+
+    return self.request("GET", f"/post/{post_id}")
+
+  def update_post(self, post_id, version, fields):
+    # Changes the given fields of a post, version has to be the post's current version
+
+    return self.send_json("PUT", f"/post/{post_id}", {**fields, "version": version})
+
+  def multipart(fields, files, progress=None):
+    # Builds a multipart/form-data body without reading any file into memory
+    # fields is a dict of name -> bytes and files a dict of name -> path. Returns a tuple of
+    # (content_type, length, body), body being a function that returns a fresh iterator over the
+    # body, so we can tell the length up front and still stream it.
+
+    boundary = uuid.uuid4().hex
+
+    parts = []
+
+    for name, value in fields.items():
+
+      head = (f"--{boundary}\r\n"
+              f"Content-Disposition: form-data; name=\"{name}\"\r\n\r\n").encode()
+
+      parts.append((head, value, None))
+
+    for name, path in files.items():
+
+      filename = os.path.basename(path).replace('"', "%22")
+
+      head = (f"--{boundary}\r\n"
+              f"Content-Disposition: form-data; name=\"{name}\"; filename=\"{filename}\"\r\n"
+              f"Content-Type: application/octet-stream\r\n\r\n").encode()
+
+      parts.append((head, None, path))
+
+    tail = f"--{boundary}--\r\n".encode()
+
+    length = len(tail) + sum(
+      len(head) + (len(value) if path is None else os.path.getsize(path)) + 2
+      for head, value, path in parts)
+
+    def body():
+
+      sent = 0
+
+      for head, value, path in parts:
+
+        if path is None:
+
+          chunks = [head + value + b"\r\n"]
+
+        else:
+
+          chunks = SzurubooruClient.read_chunks(head, path)
+
+        for chunk in chunks:
+
+          yield chunk
+
+          sent += len(chunk)
+
+          if progress is not None:
+
+            progress(sent, length)
+
+      yield tail
+
+      if progress is not None:
+
+        progress(length, length)
+
+    return (f"multipart/form-data; boundary={boundary}", length, body)
+
+  def read_chunks(head, path):
+    # Yields the part header, the file in CHUNK_SIZE pieces, and the line break that ends the part
+
+    yield head
+
+    with open(path, "rb") as f:
+
+      while True:
+
+        chunk = f.read(CHUNK_SIZE)
+
+        if not chunk:
+
+          break
+
+        yield chunk
+
+    yield b"\r\n"
@@ -0,0 +1,147 @@
+import time
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from uploading.SzurubooruClient import SzurubooruError
+from uploading.UploadJournal import TOKEN, CREATED, APPLIED
+
+# One file to upload, index being whatever the caller uses to find it again (e.g. its index in
+# MainGui.thumbs). checksum is the file's SHA1, which the journal needs to resume it.
+UploadJob = namedtuple(
+  "UploadJob",
+  ["index", "path", "tags", "safety", "checksum"],
+  defaults=(None,))
+
+# The error szurubooru gives when a token doesn't refer to an upload (anymore)
+EXPIRED_TOKEN_ERROR = "MissingOrExpiredRequiredFileError"
+
+class UploadEngine:
+
+  # Uploads files to szurubooru, several at once.
+  # Uploading is mostly waiting on the network, so threads are enough here. Each thread borrows a
+  # kept-alive connection from the SzurubooruClient, so the client should allow at least as many
+  # connections as there are workers.
+  # Every file goes through the same steps as szurubooru's own web interface: the file is uploaded
+  # for a token, the token is turned into a post, and then the tags are applied. With a journal,
+  # each finished step gets recorded, and a file that already got through some of them only does
+  # the ones that are left.
+
+  def __init__(self, client, workers=4, journal=None):
+
+    self.client = client
+    self.workers = workers
+    self.journal = journal
+
+    self.pool = None
+
+  def start(self):
+    # Starts the worker threads
+
+    if self.pool is None:
+
+      self.pool = ThreadPoolExecutor(max_workers=self.workers)
+
+  def shutdown(self):
+    # Stops the worker threads, and cancels anything that hasn't started yet
+
+    if self.pool is not None:
+
+      self.pool.shutdown(wait=True, cancel_futures=True)
+      self.pool = None
+
+  def upload(self, jobs, progress=None):
+    # Uploads every UploadJob in the given list
+    # This is a generator, it yields (job, post, error) as soon as each upload finishes, so the
+    # order is *not* the order of the list. post is the JSON of the post, which only has the id
+    # if the post was created in an earlier session.
+    # progress gets called with (job, bytes_sent, bytes_total) from the worker threads.
+
+    self.start()
+
+    futures = {self.pool.submit(self.upload_one, job, progress): job for job in jobs}
+
+    for future in as_completed(futures):
+
+      try:
+
+        yield (futures[future], future.result(), None)
+
+      except Exception as e:
+
+        yield (futures[future], None, e)
+
+  def upload_one(self, job, progress):
+    # Uploads a single job, runs in a worker thread
+
+    entry = self.journal.state(job.path, job.checksum) if self.journal is not None else None
+
+    if entry is not None and entry["state"] in (CREATED, APPLIED):
+
+      # The post already exists, so the file doesn't have to be sent again
+      post = {"id": entry["post_id"]}
+
+      if entry["state"] == APPLIED:
+
+        return post
+
+      # We need the version to change it
+      post = self.client.get_post(post["id"])
+
+    else:
+
+      post = self.create(job, progress)
+
+    if job.tags:
+
+      post = self.client.update_post(post["id"], post["version"], {"tags": list(job.tags)})
+
+    self.record(job, APPLIED)
+
+    return post
+
+  def create(self, job, progress):
+    # Uploads the job's file, or reuses a token from an earlier session, and turns it into a post
+
+    if progress is not None:
+
+      report = lambda sent, total: progress(job, sent, total)
+
+    else:
+
+      report = None
+
+    token = self.journal.token(job.path, job.checksum) if self.journal is not None else None
+
+    if token is not None:
+
+      try:
+
+        post = self.client.create_post(token, job.safety)
+
+      except SzurubooruError as e:
+
+        if e.name != EXPIRED_TOKEN_ERROR:
+
+          raise
+
+        # The server threw the upload away in the meantime, so send it again
+        token = None
+
+    if token is None:
+
+      token = self.client.upload_file(job.path, report)
+      self.record(job, TOKEN, durable=True, token=token, token_time=time.time())
+
+      post = self.client.create_post(token, job.safety)
+
+    # This one has to be on disk before anything else happens, or we would lose track of the post
+    self.record(job, CREATED, durable=True, post_id=post["id"])
+
+    return post
+
+  def record(self, job, state, durable=False, **fields):
+
+    if self.journal is not None:
+
+      self.journal.record(job.path, job.checksum, state, durable, **fields)
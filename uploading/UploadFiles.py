@@ -0,0 +1,47 @@
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from uploading.UploadEngine import UploadJob
+from uploading.Uploader import Uploader
+
+class UploadFiles(QThread):
+
+  # Runs an Uploader on a separate thread, and passes what it emits on to the main thread as
+  # pyqtSignals of the same name
+
+  # Emmitted while a post is being sent, with (index, bytes_sent, bytes_total)
+  post_progress = pyqtSignal(int, int, int)
+
+  # Emmitted once a post has been created, with (index, post_id)
+  post_finished = pyqtSignal(int, int)
+
+  # Emmitted for files that are already on the server, with (index, post_id of the existing post)
+  post_duplicate = pyqtSignal(int, int)
+
+  # Emmitted when a post could not be created, with (index, error)
+  post_failed = pyqtSignal(int, str)
+
+  # Emmitted in order to format and modify the progressbar
+  format_progressbar = pyqtSignal(str)
+  max_progressbar = pyqtSignal(int)
+  increment_progressbar = pyqtSignal()
+
+  def __init__(self, jobs, url, username, token, workers=4):
+    # jobs is a list of UploadJobs, their index is what the signals report back
+
+    super(UploadFiles, self).__init__()
+
+    self.uploader = Uploader(jobs, url, username, token, workers, self.relay)
+
+  def from_thumbs(thumbs):
+    # Makes the UploadJobs of ThumbnailRecords, indexed by their index in MainGui.thumbs
+
+    return [UploadJob(thumb.index, thumb.path, thumb.tags, thumb.safety) for thumb in thumbs]
+
+  def run(self):
+    # Main function that gets moved to the separate thread
+
+    self.uploader.run()
+
+  def relay(self, event, *args):
+
+    getattr(self, event).emit(*args)
@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+# Where the journals live, there is one per server
+JOURNAL_DIR = os.path.join(os.path.expanduser("~"), ".cache", "szurubooru_uploader", "journals")
+
+# Records that don't have to be on disk right away are written in groups of this many...
+FLUSH_RECORDS = 64
+
+# ...or whatever has been recorded after this many seconds, whichever comes first
+FLUSH_INTERVAL = 1.0
+
+# szurubooru throws away uploads that haven't been turned into a post after a while, so tokens
+# older than this aren't worth trying again
+TOKEN_LIFETIME = 6 * 60 * 60
+
+# The states a file goes through, in order
+QUEUED = "queued"               # Going to be uploaded
+TOKEN = "token"                 # Uploaded to /api/uploads, the token is in the record
+CREATED = "created"             # Turned into a post, the post_id is in the record
+APPLIED = "applied"             # Tags applied, nothing left to do
+
+STATES = (QUEUED, TOKEN, CREATED, APPLIED)
+
+class UploadJournal:
+
+  # An append-only log of how far the upload of each file got, so an upload that gets interrupted
+  # (a crash, the laptop going to sleep, the server restarting) can pick up where it left off.
+  # Every change of state is one JSON line, replaying the file gives the latest state of every
+  # file. Files are identified by path and checksum, so a file that changed starts over.
+  # Syncing every line to disk on its own would make the journal the slowest part of uploading,
+  # so lines are written and fsync'd in groups. A record that has to be on disk before moving on
+  # (durable=True) waits for the next group: whichever thread gets there first writes and syncs
+  # everything pending, including the records of the threads waiting behind it, so one fsync
+  # covers every worker that finished a step in the meantime. Anything else just waits for the
+  # group to fill up, losing those only means redoing a step that is safe to redo.
+
+  def __init__(self, server, directory=JOURNAL_DIR):
+
+    name = hashlib.sha1(server.encode()).hexdigest()[:16]
+    self.path = os.path.join(directory, f"{name}.jsonl")
+
+    # The latest record of every (path, checksum), and the order they were first queued in
+    self.entries = {}
+    self.order = {}
+
+    # The (path, checksum) each path was last recorded with, older checksums are of versions of the
+    # file that are gone
+    self.latest = {}
+
+    # Lines that haven't been written yet, how many records there have been in total, and how many
+    # of those are on disk
+    self.pending = []
+    self.recorded = 0
+    self.synced = 0
+
+    # Whether some thread is writing a group right now, and whether the last group failed to be
+    # written, which can leave half a line at the end of the file
+    self.writing = False
+    self.broken = False
+
+    self.last_flush = time.monotonic()
+    self.lock = threading.Condition()
+
+    self.file = None
+
+  def open(self):
+    # Replays the journal, and opens it for appending
+
+    if self.file is not None:
+
+      return
+
+    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    try:
+
+      with open(self.path, "r", encoding="utf-8") as f:
+
+        for line in f:
+
+          try:
+
+            self.apply(json.loads(line))
+
+          except ValueError:
+
+            # A crash or a failed write can leave half a line behind, the lines around it are
+            # still fine
+            continue
+
+    except FileNotFoundError:
+
+      pass
+
+    self.file = open(self.path, "a", encoding="utf-8")
+
+  def close(self):
+    # Writes whatever is left, and throws away the records of finished files
+
+    if self.file is None:
+
+      return
+
+    self.flush()
+    self.file.close()
+    self.file = None
+
+    self.compact()
+
+  def apply(self, record):
+    # Updates the latest state of a file with a record
+
+    key = (record["path"], record["checksum"])
+
+    if key not in self.order:
+
+      self.order[key] = len(self.order)
+
+    self.entries[key] = {**self.entries.get(key, {}), **record}
+    self.latest[record["path"]] = key
+
+  def record(self, path, checksum, state, durable=False, **fields):
+    # Records that a file reached state, fields are whatever that state needs to be resumed
+    # (e.g. the token or post_id). With durable, this only returns once the record is on disk.
+    # Safe to call from several threads at once.
+
+    record = {"path": path, "checksum": checksum, "state": state, "time": time.time(), **fields}
+
+    with self.lock:
+
+      self.apply(record)
+      self.pending.append(json.dumps(record))
+      self.recorded += 1
+
+      if durable or len(self.pending) >= FLUSH_RECORDS or \
+         time.monotonic() - self.last_flush >= FLUSH_INTERVAL:
+
+        self.sync(self.recorded)
+
+  def flush(self):
+    # Writes and syncs every record so far
+
+    with self.lock:
+
+      self.sync(self.recorded)
+
+  def sync(self, count):
+    # Waits until the first count records are on disk, writing them if no one else is
+    # The lock has to be held, it's let go of while writing so other threads can keep recording.
+    # If writing fails, the records stay pending for the next try and the error is raised, so a
+    # durable record never returns without being on disk. Threads waiting on the same group try
+    # again themselves.
+
+    while self.synced < count:
+
+      if self.writing:
+
+        # Someone else is writing a group, ours might be in it
+        self.lock.wait()
+        continue
+
+      lines = list(self.pending)
+      target = self.recorded
+
+      # Start on a new line after a failed write, so half a line doesn't swallow the next one
+      start = "\n" if self.broken else ""
+
+      self.writing = True
+      self.broken = True
+
+      self.lock.release()
+
+      try:
+
+        self.file.write(start + "".join(line + "\n" for line in lines))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+      finally:
+
+        self.lock.acquire()
+        self.writing = False
+        self.lock.notify_all()
+
+      # Only now are they on disk, anything recorded while writing is still pending
+      del self.pending[:len(lines)]
+
+      self.broken = False
+      self.synced = target
+      self.last_flush = time.monotonic()
+
+  def state(self, path, checksum):
+    # Returns the latest record of a file, or None if the journal doesn't know it
+
+    return self.entries.get((path, checksum))
+
+  def token(self, path, checksum):
+    # Returns the token of a file's upload if it's recent enough to still be valid, None otherwise
+
+    entry = self.entries.get((path, checksum))
+
+    if entry is None or entry.get("token") is None:
+
+      return None
+
+    if time.time() - entry["token_time"] > TOKEN_LIFETIME:
+
+      return None
+
+    return entry["token"]
+
+  def position(self, path, checksum):
+    # Returns where a file was first queued, files the journal doesn't know come last
+
+    return self.order.get((path, checksum), len(self.order))
+
+  def compact(self):
+    # Rewrites the journal with only the files that haven't finished, so it doesn't grow forever
+    # Finished files are in the ChecksumIndex, the journal doesn't need to remember them. Neither
+    # does it need files that were deleted, or changed since (the new version is under its own
+    # checksum), since those will never be resumed.
+
+    unfinished = [self.entries[key] for key in sorted(self.order, key=self.order.get)
+                  if self.entries[key]["state"] != APPLIED and self.latest[key[0]] == key and
+                  os.path.exists(key[0])]
+
+    temp_path = self.path + ".tmp"
+
+    with open(temp_path, "w", encoding="utf-8") as f:
+
+      for entry in unfinished:
+
+        f.write(json.dumps(entry) + "\n")
+
+      f.flush()
+      os.fsync(f.fileno())
+
+    os.replace(temp_path, self.path)
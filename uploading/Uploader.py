@@ -0,0 +1,239 @@
+import os
+import time
+import threading
+
+from uploading.ChecksumIndex import ChecksumIndex
+from uploading.SzurubooruClient import SzurubooruClient, SzurubooruError
+from uploading.UploadEngine import UploadEngine
+from uploading.UploadJournal import UploadJournal, QUEUED
+
+# The least amount of seconds between two progress events of the same post
+PROGRESS_INTERVAL = 0.1
+
+class Uploader:
+
+  # Uploads a list of UploadJobs to a szurubooru server, skipping files that are already on it and
+  # resuming what an earlier session didn't finish, without anything from Qt, so it also runs
+  # without a GUI.
+  # Whoever runs it hears about what's happening through emit, which gets called with the name of
+  # an event and its arguments, the index being the job's:
+  #   "post_progress" (index, bytes_sent, bytes_total)
+  #   "post_finished" (index, post_id)
+  #   "post_duplicate" (index, post_id of the existing post)
+  #   "post_failed" (index, error)
+  #   "format_progressbar" (text), "max_progressbar" (maximum), "increment_progressbar" ()
+  # post_progress gets emitted from the UploadEngine's worker threads, everything else from the
+  # thread calling run.
+
+  def __init__(self, jobs, url, username, token, workers=4, emit=None):
+
+    self.jobs = jobs
+
+    self.emit = emit or (lambda event, *args: None)
+
+    # Checksums and the journal are kept per server
+    self.server = url.rstrip('/')
+
+    self.client = SzurubooruClient(url, username, token, connections=workers)
+    self.index = ChecksumIndex()
+    self.journal = UploadJournal(self.server)
+    self.engine = UploadEngine(self.client, workers, self.journal)
+
+    # When each post last reported its progress, so a fast upload doesn't flood whoever listens
+    self.last_progress = {}
+    self.progress_lock = threading.Lock()
+
+  def run(self):
+
+    self.index.open()
+    self.journal.open()
+
+    try:
+
+      # Hash everything first, so duplicates never get sent in the first place
+      checksums = self.hash_jobs(self.jobs)
+
+      jobs = [job._replace(checksum=checksums[job.index])
+              for job in self.jobs if job.index in checksums]
+
+      jobs, copies = self.skip_duplicates(jobs)
+      jobs = self.queue(jobs)
+
+      self.upload(jobs, copies)
+
+    finally:
+
+      self.engine.shutdown()
+      self.client.close()
+      self.index.close()
+      self.journal.close()
+
+  def hash_jobs(self, jobs):
+    # Gets the SHA1 of every job's file, only hashing the ones the index doesn't know yet
+    # Returns a dict of index -> checksum, jobs whose file can't be read are reported as failed
+
+    stats = {}
+
+    for job in jobs:
+
+      try:
+
+        stat = os.stat(job.path)
+        stats[job.path] = (stat.st_size, stat.st_mtime_ns)
+
+      except OSError as e:
+
+        self.emit("post_failed", job.index, str(e))
+
+    known = self.index.checksums([(path, size, mtime) for path, (size, mtime) in stats.items()])
+    hashed = []
+
+    missing = [path for path in stats if path not in known]
+
+    # Only the files that have to be hashed move the progressbar
+    self.emit("format_progressbar", "Checking for duplicates - %v/%m")
+    self.emit("max_progressbar", len(missing))
+
+    for path, checksum, error in ChecksumIndex.hash_many(missing):
+
+      if error is not None:
+
+        print(f"Error while hashing {path} with error {error}")
+
+      else:
+
+        known[path] = checksum
+        hashed.append((path, *stats[path], checksum))
+
+      self.emit("increment_progressbar")
+
+    self.index.put_checksums(hashed)
+
+    checksums = {}
+
+    for job in jobs:
+
+      if job.path in known:
+
+        checksums[job.index] = known[job.path]
+
+      elif job.path in stats:
+
+        self.emit("post_failed", job.index, "Could not read the file")
+
+    print(f"Hashed {len(hashed)} of {len(jobs)} files, the rest was already known.")
+
+    return checksums
+
+  def skip_duplicates(self, jobs):
+    # Drops every job whose file is already on the server, or is the same as another job's file
+    # Returns a tuple of (jobs, copies), jobs being what's left to upload and copies a dict of
+    # checksum -> indices of the jobs that wait on the upload of the same file.
+
+    uploaded = self.index.lookup(self.server, set(job.checksum for job in jobs))
+
+    first = {}
+    copies = {}
+
+    for job in jobs:
+
+      checksum = job.checksum
+
+      if checksum in uploaded:
+
+        self.emit("post_duplicate", job.index, uploaded[checksum])
+
+      elif checksum in first:
+
+        copies.setdefault(checksum, []).append(job.index)
+
+      else:
+
+        first[checksum] = job
+
+    print(f"Skipping {len(jobs) - len(first)} duplicates.")
+
+    return (list(first.values()), copies)
+
+  def queue(self, jobs):
+    # Puts the jobs that an earlier session didn't finish first, in the order they were queued in,
+    # and records the rest as queued in the journal
+    # Returns the jobs in the order they should be uploaded.
+
+    jobs = sorted(jobs, key=lambda job: self.journal.position(job.path, job.checksum))
+
+    resumed = 0
+
+    for job in jobs:
+
+      if self.journal.state(job.path, job.checksum) is None:
+
+        self.journal.record(job.path, job.checksum, QUEUED)
+
+      else:
+
+        resumed += 1
+
+    self.journal.flush()
+
+    if resumed:
+
+      print(f"Resuming {resumed} uploads from an earlier session.")
+
+    return jobs
+
+  def upload(self, jobs, copies):
+    # Uploads the jobs, recording every new post in the index
+
+    self.emit("format_progressbar", "Uploading - %v/%m")
+    self.emit("max_progressbar", len(jobs))
+
+    for job, post, error in self.engine.upload(jobs, self.report_progress):
+
+      checksum = job.checksum
+
+      if error is None:
+
+        self.index.add(self.server, [(checksum, post.get("id", 0))])
+        self.emit("post_finished", job.index, post.get("id", 0))
+
+        for index in copies.get(checksum, []):
+
+          self.emit("post_duplicate", index, post.get("id", 0))
+
+      elif isinstance(error, SzurubooruError) and error.name == "PostAlreadyUploadedError":
+
+        # Uploaded from somewhere else, the index just didn't know about it yet
+        post_id = error.answer.get("otherPostId", 0)
+
+        self.index.add(self.server, [(checksum, post_id)])
+
+        for index in [job.index] + copies.get(checksum, []):
+
+          self.emit("post_duplicate", index, post_id)
+
+      else:
+
+        print(f"Error while uploading {job.path} with error {error}")
+
+        for index in [job.index] + copies.get(checksum, []):
+
+          self.emit("post_failed", index, str(error))
+
+      self.emit("increment_progressbar")
+
+  def report_progress(self, job, sent, total):
+    # Passes the progress of a post on, at most every PROGRESS_INTERVAL seconds
+    # This gets called from the UploadEngine's worker threads.
+
+    now = time.monotonic()
+
+    with self.progress_lock:
+
+      if sent < total and now - self.last_progress.get(job.index, 0) < PROGRESS_INTERVAL:
+
+        return
+
+      self.last_progress[job.index] = now
+
+    self.emit("post_progress", job.index, sent, total)